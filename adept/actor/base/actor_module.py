@@ -41,7 +41,14 @@ class ActorModule(RequiresArgsMixin, metaclass=abc.ABCMeta):
         raise NotImplementedError
 
     @classmethod
-    def exp_spec_builder(cls, obs_space, act_space, internal_space, batch_sz):
+    def exp_spec_builder(
+        cls, obs_space, act_space, internal_space, batch_sz, obs_dtypes=None
+    ):
+        """
+        :param obs_dtypes: Dict[str, dtype], optional, dtypes of the
+            observations as output by the CPU preprocessor. Observations are
+            stored in these dtypes instead of their key types.
+        """
         def build_fn(exp_len):
             exp_space = cls._exp_spec(
                 exp_len, batch_sz, obs_space, act_space, internal_space
@@ -53,6 +60,10 @@ class ActorModule(RequiresArgsMixin, metaclass=abc.ABCMeta):
             return {**exp_space, **env_space}
 
         key_types = cls._key_types(obs_space, act_space, internal_space)
+        if obs_dtypes:
+            for k in obs_space.keys():
+                if k in obs_dtypes:
+                    key_types[k] = obs_dtypes[k]
         exp_keys = cls._exp_keys(obs_space, act_space, internal_space)
         return ExpSpecBuilder(
             obs_space, act_space, internal_space, key_types, exp_keys, build_fn
@@ -96,9 +96,6 @@ class ImpalaHostActor(ActorModule, ACActorHelperMixin):
         d = defaultdict(lambda: "float")
         for k in act_space.keys():
             d[k] = "long"
-        # TODO this needs a better solution
-        for k in obs_space.keys():
-            d[k] = "byte"
         return d
 
 
@@ -162,7 +159,4 @@ class ImpalaWorkerActor(ActorModule, ACActorHelperMixin):
         d = defaultdict(lambda: "float")
         for k in act_space.keys():
             d[k] = "long"
-        # TODO this needs a better solution
-        for k in obs_space.keys():
-            d[k] = "byte"
         return d
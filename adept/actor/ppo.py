@@ -12,7 +12,7 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
 
 import torch
 
@@ -78,3 +78,10 @@ class PPOActorTrain(ActorModule, ACActorHelperMixin):
         }
 
         return spec
+
+    @classmethod
+    def _key_types(cls, obs_space, act_space, internal_space):
+        d = defaultdict(lambda: 'float')
+        for k in act_space.keys():
+            d[k] = 'long'
+        return d
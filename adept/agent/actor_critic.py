@@ -31,13 +31,14 @@ class ActorCritic(AgentModule):
         normalize_advantage,
         entropy_weight,
         return_scale,
+        dedup_frames=0,
     ):
         super(ActorCritic, self).__init__(reward_normalizer, action_space)
         self.discount = discount
         self.normalize_advantage = normalize_advantage
         self.entropy_weight = entropy_weight
 
-        self._exp_cache = Rollout(spec_builder, rollout_len)
+        self._exp_cache = Rollout(spec_builder, rollout_len, dedup_frames)
         self._actor = ACRolloutActorTrain(action_space)
         self._learner = ACRolloutLearner(
             reward_normalizer,
@@ -60,6 +61,8 @@ class ActorCritic(AgentModule):
             normalize_advantage=args.normalize_advantage,
             entropy_weight=args.entropy_weight,
             return_scale=args.return_scale,
+            # absent from args saved before frame dedup existed
+            dedup_frames=args.dedup_frames or 0,
         )
 
     @property
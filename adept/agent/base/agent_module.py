@@ -58,7 +58,14 @@ class AgentModule(RequiresArgsMixin, metaclass=abc.ABCMeta):
         return list(sorted(self.action_space.keys()))
 
     @classmethod
-    def exp_spec_builder(cls, obs_space, act_space, internal_space, batch_sz):
+    def exp_spec_builder(
+        cls, obs_space, act_space, internal_space, batch_sz, obs_dtypes=None
+    ):
+        """
+        :param obs_dtypes: Dict[str, dtype], optional, dtypes of the
+            observations as output by the CPU preprocessor. Observations are
+            stored in these dtypes instead of their key types.
+        """
         def build_fn(exp_len):
             exp_space = cls._exp_spec(
                 exp_len, batch_sz, obs_space, act_space, internal_space
@@ -70,6 +77,10 @@ class AgentModule(RequiresArgsMixin, metaclass=abc.ABCMeta):
             return {**exp_space, **env_space}
 
         key_types = cls._key_types(obs_space, act_space, internal_space)
+        if obs_dtypes:
+            for k in obs_space.keys():
+                if k in obs_dtypes:
+                    key_types[k] = obs_dtypes[k]
         exp_keys = cls._exp_keys(obs_space, act_space, internal_space)
         return ExpSpecBuilder(
             obs_space, act_space, internal_space, key_types, exp_keys, build_fn
@@ -110,11 +121,12 @@ class AgentModule(RequiresArgsMixin, metaclass=abc.ABCMeta):
     def clear(self):
         self.exp_cache.clear()
 
-    def act(self, network, obs, prev_internals):
+    def act(self, network, obs, prev_internals, env_ids=None):
         """
         :param network: NetworkModule
         :param obs: Dict[str, Tensor]
         :param prev_internals: previous interal states. Dict[str, Tensor]
+        :param env_ids: Optional LongTensor, env indices if obs is a sub-batch
         :return:
             actions: Dict[ActionKey, LongTensor (B)]
             internal_states: Dict[str, Tensor]
@@ -129,13 +141,24 @@ class AgentModule(RequiresArgsMixin, metaclass=abc.ABCMeta):
         actions, experience = self.compute_action_exp(
             predictions, prev_internals, pobs, av_actions
         )
-        self.exp_cache.write_actor(experience)
+        if env_ids is None:
+            self.exp_cache.write_actor(experience)
+        else:
+            self.exp_cache.write_actor(experience, env_ids=env_ids)
         return actions, internal_states
 
-    def observe(self, obs, rewards, terminals, infos):
-        self.exp_cache.write_env(obs, rewards, terminals, infos)
+    def observe(self, obs, rewards, terminals, infos, env_ids=None):
+        if env_ids is None:
+            self.exp_cache.write_env(obs, rewards, terminals, infos)
+        else:
+            self.exp_cache.write_env(
+                obs, rewards, terminals, infos, env_ids=env_ids
+            )
         return rewards, terminals, infos
 
     def to(self, device):
         self.exp_cache.to(device)
         return self
+
+    def close(self):
+        self.exp_cache.close()
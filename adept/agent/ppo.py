@@ -97,6 +97,10 @@ class PPO(AgentModule):
             exp_len, batch_sz, obs_space, act_space, internal_space
         )
 
+    @classmethod
+    def _key_types(cls, obs_space, act_space, internal_space):
+        return PPOActorTrain._key_types(obs_space, act_space, internal_space)
+
     @staticmethod
     def output_space(action_space):
         return PPOActorTrain.output_space(action_space)
@@ -135,11 +139,11 @@ class PPO(AgentModule):
         gae_returns = torch.stack(list(reversed(gae_returns))).data
 
         # Convert to torch tensors of [seq, num_env]
-        old_values = torch.stack(r.values).squeeze(-1)
+        old_values = r.values.squeeze(-1)
         adv_targets_batch = (gae_returns - old_values).data
-        old_log_probs_batch = torch.stack(r.log_probs).data
+        old_log_probs_batch = r.log_probs.data
         # keep a copy of terminals on the cpu it's faster
-        rollout_terminals = torch.stack(r.terminals).cpu().numpy()
+        rollout_terminals = r.terminals.cpu().numpy()
 
         # Normalize advantage
         if self.normalize_advantage:
@@ -79,6 +79,7 @@ class ActorLearnerHost(Container):
             env.observation_space,
             env.gpu_preprocessor,
         )
+        env_observation_dtypes = env.cpu_preprocessor.observation_dtypes
         env.close()
 
         # NETWORK
@@ -126,6 +127,7 @@ class ActorLearnerHost(Container):
             env.action_space,
             net.internal_space(),
             args.nb_env * args.nb_learn_batch,
+            env_observation_dtypes,
         )
         actor = actor_cls.from_args(args, env.action_space)
         learner = REGISTRY.lookup_learner(args.learner).from_args(
@@ -190,9 +192,14 @@ class ActorLearnerHost(Container):
             rollouts, terminal_rewards, terminal_infos = rollout_queuer.get()
 
             # Iterate forward on batch
+            merge_start = time()
             self.exp.write_exps(rollouts)
+            if self.device.type == "cuda":
+                # the copies are async, wait for them to time the merge
+                torch.cuda.synchronize(self.device)
+            merge_ms = (time() - merge_start) * 1000
             # keep a copy of terminals on the cpu it's faster
-            rollout_terminals = torch.stack(self.exp["terminals"]).numpy()
+            rollout_terminals = self.exp["terminals"].cpu().numpy()
             self.exp.to(self.device)
             r = self.exp.read()
             internals = {k: ts[0].unbind(0) for k, ts in r.internals.items()}
@@ -209,6 +216,7 @@ class ActorLearnerHost(Container):
                 for i in terminal_inds:
                     for k, v in self.network.new_internals(self.device).items():
                         internals[k][i] = v
+                self.reset_preprocessor(self.network, terminals)
 
             # compute loss
             loss_dict, metric_dict = self.learner.learn_step(
@@ -221,6 +229,7 @@ class ActorLearnerHost(Container):
             total_loss = torch.sum(
                 torch.stack(tuple(loss for loss in loss_dict.values()))
             )
+            metric_dict["merge_ms"] = torch.tensor(merge_ms)
 
             # Perform state updates
             global_step_count += (
@@ -286,6 +295,11 @@ class ActorLearnerHost(Container):
                         metric_dict,
                         self.network.named_parameters(),
                     )
+                    self.summary_writer.add_scalar(
+                        "env/nb_restart",
+                        rollout_queuer.nb_restart,
+                        global_step_count,
+                    )
                 prev_step_t = cur_step_t
 
         rollout_queuer.close()
@@ -298,7 +312,7 @@ class ActorLearnerHost(Container):
         return global_step_count >= self.nb_step
 
     def close(self):
-        pass
+        self.exp.close()
 
     def get_parameters(self):
         params = [p.cpu() for p in self.network.parameters()]
@@ -33,6 +33,8 @@ class RolloutQueuerAsync:
         self.rollout_queue = queue.Queue(self.queue_max_size)
         self._worker_wait_time = 0
         self._host_wait_time = 0
+        # latest env restart count of each worker, by rank
+        self._nb_restarts = {}
 
     def _background_queing_thread(self):
         while not self._should_stop:
@@ -95,6 +97,7 @@ class RolloutQueuerAsync:
         terminal_infos = []
         for w in worker_data:
             r, t, i = w["rollout"], w["terminal_rewards"], w["terminal_infos"]
+            self._nb_restarts[w["rank"]] = w["nb_restart"]
             rollouts.append(r)
             terminal_rewards.append(t)
             terminal_infos.append(i)
@@ -107,6 +110,11 @@ class RolloutQueuerAsync:
         # try to join background thread
         self.background_thread.join()
 
+    @property
+    def nb_restart(self):
+        """Env restarts of all workers that have sent a rollout."""
+        return sum(self._nb_restarts.values())
+
     def metrics(self):
         return {
             "Host wait time": self._host_wait_time,
@@ -12,6 +12,7 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
 from collections import namedtuple
 from time import time
 
@@ -19,10 +20,11 @@ import numpy as np
 import ray
 import torch
 
+from adept.exp import ExperienceRecorder
 from adept.manager import SubProcEnvManager
 from adept.network import ModularNetwork
 from adept.registry import REGISTRY
-from adept.utils.util import dtensor_to_dev, listd_to_dlist
+from adept.utils.util import DeviceTransfer, listd_to_dlist
 
 from adept.container.base import Container
 
@@ -58,7 +60,13 @@ class ActorLearnerWorker(Container):
         engine = REGISTRY.lookup_engine(args.env)
         env_cls = REGISTRY.lookup_env(args.env)
         mgr_cls = REGISTRY.lookup_manager(args.manager)
+        mgr_start_t = time()
         env_mgr = mgr_cls.from_args(args, engine, env_cls, seed=seed)
+        print(
+            "Worker {} started {} envs in {:.2f}s".format(
+                rank, env_mgr.nb_env, time() - mgr_start_t
+            )
+        )
 
         # NETWORK
         torch.manual_seed(args.seed)
@@ -84,6 +92,7 @@ class ActorLearnerWorker(Container):
             env_mgr.action_space,
             net.internal_space(),
             env_mgr.nb_env,
+            env_mgr.cpu_preprocessor.observation_dtypes,
         )
         exp = REGISTRY.lookup_exp(args.exp).from_args(args, builder)
 
@@ -94,6 +103,7 @@ class ActorLearnerWorker(Container):
         self.nb_env = args.nb_env
         self.network = net.to(device)
         self.device = device
+        self.obs_to_dev = DeviceTransfer(device)
         self.initial_step_count = initial_step_count
 
         # TODO: this should be set to eval after some number of training steps
@@ -105,7 +115,7 @@ class ActorLearnerWorker(Container):
         self.ep_rewards = torch.zeros(self.nb_env)
         self.rank = rank
 
-        self.obs = dtensor_to_dev(self.env_mgr.reset(), self.device)
+        self.obs = self.obs_to_dev(self.env_mgr.reset())
         self.internals = listd_to_dlist(
             [
                 self.network.new_internals(self.device)
@@ -115,6 +125,12 @@ class ActorLearnerWorker(Container):
         self.start_time = time()
         self._weights_synced = False
 
+        self.recorder = None
+        if args.record_exp:
+            self.recorder = ExperienceRecorder(
+                os.path.join(args.record_exp, "worker{}".format(rank))
+            )
+
     def run(self):
         if not self._weights_synced:
             raise Exception("Must set weights before calling run")
@@ -133,11 +149,13 @@ class ActorLearnerWorker(Container):
             self.exp.write_actor(exp)
 
             next_obs, rewards, terminals, infos = self.env_mgr.step(actions)
-            next_obs = dtensor_to_dev(next_obs, self.device)
+            next_obs = self.obs_to_dev(next_obs)
             self.exp.write_env(
                 self.obs, rewards.float(), terminals.float(), infos
             )
 
+            self.reset_preprocessor(self.network, terminals)
+
             # Perform state updates
             self.step_count += self.nb_env
             self.ep_rewards += rewards.float()
@@ -177,6 +195,8 @@ class ActorLearnerWorker(Container):
 
         # rollout is full return it
         self.exp.write_next_obs(self.obs)
+        if self.recorder is not None:
+            self.recorder.record(self.exp, self.obs, self.internals)
         # TODO: compression?
         if len(all_terminal_rewards) > 0:
             return {
@@ -185,12 +205,16 @@ class ActorLearnerWorker(Container):
                 "terminal_infos": {
                     k: np.mean(v) for k, v in all_terminal_infos.items()
                 },
+                "rank": self.rank,
+                "nb_restart": self.env_mgr.nb_restart,
             }
         else:
             return {
                 "rollout": self._ray_pack(self.exp),
                 "terminal_rewards": None,
                 "terminal_infos": None,
+                "rank": self.rank,
+                "nb_restart": self.env_mgr.nb_restart,
             }
 
     def set_weights(self, weights):
@@ -208,6 +232,9 @@ class ActorLearnerWorker(Container):
         return params
 
     def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+        self.exp.close()
         return self.env_mgr.close()
 
     def _ray_pack(self, exp):
@@ -217,7 +244,10 @@ class ActorLearnerWorker(Container):
     def _to_cpu(self, var):
         # TODO: this is a hack, should instead register a custom serializer for torch tensors to go
         # to CPU
-        if isinstance(var, list):
+        if isinstance(var, torch.Tensor):
+            # copied, the rollout is overwritten while this one is sent
+            return var.to("cpu", copy=True)
+        elif isinstance(var, list):
             # list of dict -> dict of lists
             # observations/actions/internals
             if isinstance(var[0], dict):
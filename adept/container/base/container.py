@@ -24,6 +24,20 @@ class Container:
                 next_save += epoch_len
         return next_save
 
+    @staticmethod
+    def reset_preprocessor(network, terminals):
+        """
+        Reset the GPU preprocessor state, e.g. frame stacks, of the envs
+        whose episode ended, so it isn't carried into the next episode.
+
+        :param network: NetworkModule
+        :param terminals: Tensor or ndarray (B), of the whole env batch
+        """
+        gpu_preprocessor = getattr(network, "gpu_preprocessor", None)
+        mask = torch.as_tensor(terminals).bool()
+        if gpu_preprocessor is not None and mask.any():
+            gpu_preprocessor.reset(mask)
+
     @staticmethod
     def count_parameters(net):
         return sum(p.numel() for p in net.parameters() if p.requires_grad)
@@ -10,7 +10,7 @@ from torch.utils.tensorboard import SummaryWriter
 from adept.manager import SubProcEnvManager
 from adept.network import ModularNetwork
 from adept.registry import REGISTRY
-from adept.utils import dtensor_to_dev, listd_to_dlist
+from adept.utils import DeviceTransfer, listd_to_dlist
 from adept.utils.logging import SimpleModelSaver
 from .base import Container
 from .base.updater import Updater
@@ -71,7 +71,13 @@ class DistribHost(Container):
         engine = REGISTRY.lookup_engine(args.env)
         env_cls = REGISTRY.lookup_env(args.env)
         mgr_cls = REGISTRY.lookup_manager(args.manager)
+        mgr_start_t = time()
         env_mgr = mgr_cls.from_args(args, engine, env_cls, seed=seed)
+        logger.info(
+            "Started {} envs in {:.2f}s".format(
+                env_mgr.nb_env, time() - mgr_start_t
+            )
+        )
 
         # NETWORK
         torch.manual_seed(args.seed)
@@ -105,6 +111,7 @@ class DistribHost(Container):
             env_mgr.action_space,
             net.internal_space(),
             env_mgr.nb_env,
+            env_mgr.cpu_preprocessor.observation_dtypes,
         )
         agent = agent_cls.from_args(
             args, rwd_norm, env_mgr.action_space, builder
@@ -117,6 +124,7 @@ class DistribHost(Container):
         self.network = net.to(device)
         self.optimizer = optim_fn(self.network.parameters())
         self.device = device
+        self.obs_to_dev = DeviceTransfer(device)
         self.initial_step_count = initial_step_count
         self.log_id_dir = log_id_dir
         self.epoch_len = args.epoch_len
@@ -152,7 +160,7 @@ class DistribHost(Container):
         prev_step_t = time()
         ep_rewards = torch.zeros(self.nb_env)
 
-        obs = dtensor_to_dev(self.env_mgr.reset(), self.device)
+        obs = self.obs_to_dev(self.env_mgr.reset())
         internals = listd_to_dlist(
             [
                 self.network.new_internals(self.device)
@@ -163,7 +171,7 @@ class DistribHost(Container):
         while global_step_count < self.nb_step:
             actions, internals = self.agent.act(self.network, obs, internals)
             next_obs, rewards, terminals, infos = self.env_mgr.step(actions)
-            next_obs = dtensor_to_dev(next_obs, self.device)
+            next_obs = self.obs_to_dev(next_obs)
 
             self.agent.observe(
                 obs,
@@ -176,6 +184,8 @@ class DistribHost(Container):
                     for k, v in self.network.new_internals(self.device).items():
                         internals[k][i] = v
 
+            self.reset_preprocessor(self.network, terminals)
+
             # Perform state updates
             local_step_count += self.nb_env
             global_step_count += self.nb_env * self.world_size
@@ -240,6 +250,11 @@ class DistribHost(Container):
                         metric_dict,
                         self.network.named_parameters(),
                     )
+                    self.summary_writer.add_scalar(
+                        "env/nb_restart",
+                        self.env_mgr.nb_restart,
+                        global_step_count,
+                    )
                     prev_step_t = cur_step_t
 
     def close(self):
@@ -272,7 +287,13 @@ class DistribWorker(Container):
         # ENV
         engine = REGISTRY.lookup_engine(args.env)
         env_cls = REGISTRY.lookup_env(args.env)
+        mgr_start_t = time()
         env_mgr = SubProcEnvManager.from_args(args, engine, env_cls, seed=seed)
+        logger.info(
+            "Started {} envs in {:.2f}s".format(
+                env_mgr.nb_env, time() - mgr_start_t
+            )
+        )
 
         # NETWORK
         torch.manual_seed(args.seed)
@@ -305,6 +326,7 @@ class DistribWorker(Container):
             env_mgr.action_space,
             net.internal_space(),
             env_mgr.nb_env,
+            env_mgr.cpu_preprocessor.observation_dtypes,
         )
         agent = agent_cls.from_args(
             args, rwd_norm, env_mgr.action_space, builder
@@ -317,6 +339,7 @@ class DistribWorker(Container):
         self.network = net.to(device)
         self.optimizer = optim_fn(self.network.parameters())
         self.device = device
+        self.obs_to_dev = DeviceTransfer(device)
         self.initial_step_count = initial_step_count
         self.log_id_dir = log_id_dir
         self.epoch_len = args.epoch_len
@@ -346,7 +369,7 @@ class DistribWorker(Container):
         local_step_count = global_step_count = self.initial_step_count
         ep_rewards = torch.zeros(self.nb_env)
 
-        obs = dtensor_to_dev(self.env_mgr.reset(), self.device)
+        obs = self.obs_to_dev(self.env_mgr.reset())
         internals = listd_to_dlist(
             [
                 self.network.new_internals(self.device)
@@ -357,7 +380,7 @@ class DistribWorker(Container):
         while global_step_count < self.nb_step:
             actions, internals = self.agent.act(self.network, obs, internals)
             next_obs, rewards, terminals, infos = self.env_mgr.step(actions)
-            next_obs = dtensor_to_dev(next_obs, self.device)
+            next_obs = self.obs_to_dev(next_obs)
 
             self.agent.observe(
                 obs,
@@ -370,6 +393,8 @@ class DistribWorker(Container):
                     for k, v in self.network.new_internals(self.device).items():
                         internals[k][i] = v
 
+            self.reset_preprocessor(self.network, terminals)
+
             # Perform state updates
             local_step_count += self.nb_env
             global_step_count += self.nb_env * self.world_size
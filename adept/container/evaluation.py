@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import os
+from time import time
 
 import torch
 
@@ -20,7 +21,7 @@ from adept.manager import SubProcEnvManager
 from adept.network import ModularNetwork
 from adept.registry import REGISTRY
 from adept.utils.script_helpers import LogDirHelper
-from adept.utils.util import listd_to_dlist, dtensor_to_dev
+from adept.utils.util import listd_to_dlist, DeviceTransfer
 
 
 class EvalContainer:
@@ -39,6 +40,7 @@ class EvalContainer:
         self.log_dir_helper = log_dir_helper = LogDirHelper(log_id_dir)
         self.train_args = train_args = log_dir_helper.load_args()
         self.device = device = self._device_from_gpu_id(gpu_id)
+        self.obs_to_dev = DeviceTransfer(device)
         self.logger = logger
 
         if epoch_id:
@@ -53,9 +55,15 @@ class EvalContainer:
 
         engine = REGISTRY.lookup_engine(train_args.env)
         env_cls = REGISTRY.lookup_env(train_args.env)
+        mgr_start_t = time()
         self.env_mgr = env_mgr = SubProcEnvManager.from_args(
             self.train_args, engine, env_cls, seed=seed, nb_env=nb_episode
         )
+        logger.info(
+            "Started {} envs in {:.2f}s".format(
+                env_mgr.nb_env, time() - mgr_start_t
+            )
+        )
         if train_args.agent:
             agent = train_args.agent
         else:
@@ -121,7 +129,7 @@ class EvalContainer:
                     ]
                 )
                 episode_completes = [False for _ in range(nb_env)]
-                next_obs = dtensor_to_dev(self.env_mgr.reset(), self.device)
+                next_obs = self.obs_to_dev(self.env_mgr.reset())
 
                 while not all(episode_completes):
                     obs = next_obs
@@ -132,7 +140,7 @@ class EvalContainer:
                     next_obs, rewards, terminals, infos = self.env_mgr.step(
                         actions
                     )
-                    next_obs = dtensor_to_dev(next_obs, self.device)
+                    next_obs = self.obs_to_dev(next_obs)
 
                     for i in range(self.env_mgr.nb_env):
                         if episode_completes[i]:
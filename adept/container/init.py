@@ -98,15 +98,24 @@ class Init:
 
         env_cls = R.lookup_env(args.env)
         rwdnorm_cls = R.lookup_reward_normalizer(args.rwd_norm)
+        manager_cls = R.lookup_manager(args.manager)
 
         env_args = env_cls.args
         rwdnorm_args = rwdnorm_cls.args
+        manager_args = manager_cls.args
         if args.custom_network:
             net_args = R.lookup_network(args.custom_network).args
         else:
             net_args = R.lookup_modular_args(args)
         args = DotDict(
-            {**args, **agent_args, **env_args, **rwdnorm_args, **net_args}
+            {
+                **args,
+                **agent_args,
+                **env_args,
+                **rwdnorm_args,
+                **manager_args,
+                **net_args,
+            }
         )
 
         return args
@@ -136,15 +145,24 @@ class Init:
 
         env_cls = R.lookup_env(args.env)
         rwdnorm_cls = R.lookup_reward_normalizer(args.rwd_norm)
+        manager_cls = R.lookup_manager(args.manager)
 
         env_args = env_cls.prompt(provided=args)
         rwdnorm_args = rwdnorm_cls.prompt(provided=args)
+        manager_args = manager_cls.prompt(provided=args)
         if args.custom_network:
             net_args = R.lookup_network(args.custom_network).prompt()
         else:
             net_args = R.prompt_modular_args(args)
         args = DotDict(
-            {**args, **agent_args, **env_args, **rwdnorm_args, **net_args}
+            {
+                **args,
+                **agent_args,
+                **env_args,
+                **rwdnorm_args,
+                **manager_args,
+                **net_args,
+            }
         )
         return args
 
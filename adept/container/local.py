@@ -5,10 +5,11 @@ from torch.nn.utils import clip_grad_norm_
 from torch.optim.lr_scheduler import LambdaLR
 from torch.utils.tensorboard import SummaryWriter
 
+from adept.exp import ExperienceRecorder, Rollout
 from adept.network import ModularNetwork
 from adept.registry import REGISTRY
 from adept.utils.logging import SimpleModelSaver
-from adept.utils.util import dtensor_to_dev, listd_to_dlist
+from adept.utils.util import DeviceTransfer, listd_to_dlist
 from .base import Container
 from .base.updater import Updater
 
@@ -28,7 +29,13 @@ class Local(Container):
         engine = REGISTRY.lookup_engine(args.env)
         env_cls = REGISTRY.lookup_env(args.env)
         mgr_cls = REGISTRY.lookup_manager(args.manager)
+        mgr_start_t = time()
         env_mgr = mgr_cls.from_args(args, engine, env_cls)
+        logger.info(
+            "Started {} envs in {:.2f}s".format(
+                env_mgr.nb_env, time() - mgr_start_t
+            )
+        )
 
         # NETWORK
         torch.manual_seed(args.seed)
@@ -72,6 +79,7 @@ class Local(Container):
             env_mgr.action_space,
             net.internal_space(),
             env_mgr.nb_env,
+            env_mgr.cpu_preprocessor.observation_dtypes,
         )
         agent = agent_cls.from_args(
             args, rwd_norm, env_mgr.action_space, builder
@@ -85,6 +93,7 @@ class Local(Container):
         self.optimizer = optim_fn(self.network.parameters())
         self.scheduler = LambdaLR(self.optimizer, warmup_schedule)
         self.device = device
+        self.obs_to_dev = DeviceTransfer(device)
         self.initial_step_count = initial_step_count
         self.log_id_dir = log_id_dir
         self.epoch_len = args.epoch_len
@@ -103,15 +112,25 @@ class Local(Container):
             self.optimizer = self.load_optim(self.optimizer, args.load_optim)
             logger.info("Reloaded optimizer from {}".format(args.load_optim))
 
+        self.recorder = None
+        if args.record_exp:
+            if not isinstance(self.agent.exp_cache, Rollout):
+                raise ValueError("Only rollouts can be recorded")
+            self.recorder = ExperienceRecorder(args.record_exp)
+            logger.info("Recording experience to {}".format(args.record_exp))
+
         self.network.train()
 
     def run(self):
+        if self.env_mgr.is_async:
+            return self._run_async()
+
         step_count = self.initial_step_count
         next_save = self.init_next_save(self.initial_step_count, self.epoch_len)
         prev_step_t = time()
         ep_rewards = torch.zeros(self.nb_env)
 
-        obs = dtensor_to_dev(self.env_mgr.reset(), self.device)
+        obs = self.obs_to_dev(self.env_mgr.reset())
         internals = listd_to_dlist(
             [
                 self.network.new_internals(self.device)
@@ -122,7 +141,7 @@ class Local(Container):
         while step_count < self.nb_step:
             actions, internals = self.agent.act(self.network, obs, internals)
             next_obs, rewards, terminals, infos = self.env_mgr.step(actions)
-            next_obs = dtensor_to_dev(next_obs, self.device)
+            next_obs = self.obs_to_dev(next_obs)
 
             self.agent.observe(
                 obs,
@@ -131,6 +150,8 @@ class Local(Container):
                 infos,
             )
 
+            self.reset_preprocessor(self.network, terminals)
+
             # Perform state updates
             step_count += self.nb_env
             ep_rewards += rewards.float()
@@ -146,30 +167,7 @@ class Local(Container):
                         term_infos.append(infos[i])
                     ep_rewards[i].zero_()
 
-            if term_rewards:
-                term_reward = np.mean(term_rewards)
-                delta_t = time() - start_time
-                self.logger.info(
-                    "STEP: {} REWARD: {} STEP/S: {}".format(
-                        step_count,
-                        term_reward,
-                        (step_count - self.initial_step_count) / delta_t,
-                    )
-                )
-                self.summary_writer.add_scalar(
-                    "reward", term_reward, step_count
-                )
-                if term_infos:
-                    float_keys = [
-                        k for k, v in term_infos[0].items() if type(v) == float
-                    ]
-                    term_infos_dlist = listd_to_dlist(term_infos)
-                    for k in float_keys:
-                        self.summary_writer.add_scalar(
-                            f"info/{k}",
-                            np.mean(term_infos_dlist[k]),
-                            step_count,
-                        )
+            self._log_episodes(step_count, start_time, term_rewards, term_infos)
 
             if step_count >= next_save:
                 self.saver.save_state_dicts(
@@ -179,30 +177,158 @@ class Local(Container):
 
             # Learn
             if self.agent.is_ready():
-                loss_dict, metric_dict = self.agent.learn_step(
-                    self.updater, self.network, next_obs, internals,
+                prev_step_t = self._learn(
+                    step_count, next_obs, internals, prev_step_t
                 )
-                total_loss = sum(loss_dict.values())
 
-                epoch = step_count / self.nb_env
-                self.scheduler.step(epoch)
+    def _run_async(self):
+        """
+        Acts on whichever envs the manager returns first. Envs that have
+        filled their rollout column are held until the learn step.
+        """
+        step_count = self.initial_step_count
+        next_save = self.init_next_save(self.initial_step_count, self.epoch_len)
+        prev_step_t = time()
+        ep_rewards = torch.zeros(self.nb_env)
+        rollout_len = len(self.agent.exp_cache)
 
-                self.agent.clear()
-                for k, vs in internals.items():
-                    internals[k] = [v.detach() for v in vs]
+        # latest observation of every env, updated in place so it can't
+        # share memory with the manager's buffers
+        obs = self.obs_to_dev(self.env_mgr.reset())
+        obs = {k: v.clone() for k, v in obs.items()}
+        internals = listd_to_dlist(
+            [
+                self.network.new_internals(self.device)
+                for _ in range(self.nb_env)
+            ]
+        )
+        idle_ids = torch.arange(self.nb_env)
+        start_time = time()
+        while step_count < self.nb_step:
+            env_idxs = self.agent.exp_cache.env_cur_idx[idle_ids]
+            act_ids = idle_ids[env_idxs < rollout_len]
+            nb_in_flight = self.nb_env - len(idle_ids)
+            # wait for a full batch unless nothing else is coming back
+            if len(act_ids) >= self.env_mgr.async_batch_size or (
+                len(act_ids) > 0 and nb_in_flight == 0
+            ):
+                idle_ids = idle_ids[env_idxs >= rollout_len]
+                sub_obs = {k: v[act_ids] for k, v in obs.items()}
+                sub_internals = {
+                    k: [vs[i] for i in act_ids.tolist()]
+                    for k, vs in internals.items()
+                }
+                actions, sub_internals = self.agent.act(
+                    self.network, sub_obs, sub_internals, env_ids=act_ids
+                )
+                for k, vs in sub_internals.items():
+                    for i, v in zip(act_ids.tolist(), vs):
+                        internals[k][i] = v
+                self.env_mgr.send(actions, act_ids)
+
+            # every env is idle with a full rollout column
+            if self.agent.is_ready():
+                prev_step_t = self._learn(
+                    step_count, obs, internals, prev_step_t
+                )
+                continue
 
-                # write summaries
-                cur_step_t = time()
-                if cur_step_t - prev_step_t > self.summary_freq:
-                    self.write_summaries(
-                        self.summary_writer,
+            sub_obs, rewards, terminals, infos, env_ids = self.env_mgr.recv()
+            sub_obs = self.obs_to_dev(sub_obs)
+            self.agent.observe(
+                {k: v[env_ids] for k, v in obs.items()},
+                rewards.to(self.device).float(),
+                terminals.to(self.device).float(),
+                infos,
+                env_ids=env_ids,
+            )
+            for k, v in sub_obs.items():
+                obs[k][env_ids] = v
+            idle_ids = torch.cat([idle_ids, env_ids])
+            env_terminals = torch.zeros(self.nb_env, dtype=torch.bool)
+            env_terminals[env_ids] = terminals.bool()
+            self.reset_preprocessor(self.network, env_terminals)
+
+            # Perform state updates
+            step_count += len(env_ids)
+            ep_rewards[env_ids] += rewards.float()
+
+            term_rewards, term_infos = [], []
+            for i, terminal, info in zip(env_ids.tolist(), terminals, infos):
+                if terminal:
+                    for k, v in self.network.new_internals(self.device).items():
+                        internals[k][i] = v
+                    term_rewards.append(ep_rewards[i].item())
+                    if info:
+                        term_infos.append(info)
+                    ep_rewards[i].zero_()
+
+            self._log_episodes(step_count, start_time, term_rewards, term_infos)
+
+            if step_count >= next_save:
+                self.saver.save_state_dicts(
+                    self.network, step_count, self.optimizer
+                )
+                next_save += self.epoch_len
+
+    def _log_episodes(self, step_count, start_time, term_rewards, term_infos):
+        if term_rewards:
+            term_reward = np.mean(term_rewards)
+            delta_t = time() - start_time
+            self.logger.info(
+                "STEP: {} REWARD: {} STEP/S: {}".format(
+                    step_count,
+                    term_reward,
+                    (step_count - self.initial_step_count) / delta_t,
+                )
+            )
+            self.summary_writer.add_scalar("reward", term_reward, step_count)
+            if term_infos:
+                float_keys = [
+                    k for k, v in term_infos[0].items() if type(v) == float
+                ]
+                term_infos_dlist = listd_to_dlist(term_infos)
+                for k in float_keys:
+                    self.summary_writer.add_scalar(
+                        f"info/{k}",
+                        np.mean(term_infos_dlist[k]),
                         step_count,
-                        total_loss,
-                        loss_dict,
-                        metric_dict,
-                        self.network.named_parameters(),
                     )
-                    prev_step_t = cur_step_t
+
+    def _learn(self, step_count, next_obs, internals, prev_step_t):
+        if self.recorder is not None:
+            self.recorder.record(self.agent.exp_cache, next_obs, internals)
+        loss_dict, metric_dict = self.agent.learn_step(
+            self.updater, self.network, next_obs, internals,
+        )
+        total_loss = sum(loss_dict.values())
+
+        epoch = step_count / self.nb_env
+        self.scheduler.step(epoch)
+
+        self.agent.clear()
+        for k, vs in internals.items():
+            internals[k] = [v.detach() for v in vs]
+
+        # write summaries
+        cur_step_t = time()
+        if cur_step_t - prev_step_t > self.summary_freq:
+            self.write_summaries(
+                self.summary_writer,
+                step_count,
+                total_loss,
+                loss_dict,
+                metric_dict,
+                self.network.named_parameters(),
+            )
+            self.summary_writer.add_scalar(
+                "env/nb_restart", self.env_mgr.nb_restart, step_count
+            )
+            prev_step_t = cur_step_t
+        return prev_step_t
 
     def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+        self.agent.close()
         return self.env_mgr.close()
@@ -16,7 +16,7 @@ import torch
 
 from adept.network import ModularNetwork
 from adept.registry import REGISTRY
-from adept.utils import dtensor_to_dev, listd_to_dlist
+from adept.utils import DeviceTransfer, listd_to_dlist
 from adept.utils.script_helpers import LogDirHelper
 from adept.utils.util import DotDict
 
@@ -39,6 +39,7 @@ class RenderContainer:
         self.train_args = train_args = log_dir_helper.load_args()
         self.train_args = DotDict({**self.train_args, **extra_args})
         self.device = device = self._device_from_gpu_id(gpu_id)
+        self.obs_to_dev = DeviceTransfer(device)
         self.logger = logger
 
         if epoch_id:
@@ -114,7 +115,7 @@ class RenderContainer:
                 internals = listd_to_dlist(
                     [self.network.new_internals(self.device)]
                 )
-                next_obs = dtensor_to_dev(self.env_mgr.reset(), self.device)
+                next_obs = self.obs_to_dev(self.env_mgr.reset())
                 self.env_mgr.render()
 
                 episode_complete = False
@@ -128,7 +129,7 @@ class RenderContainer:
                         actions
                     )
                     self.env_mgr.render()
-                    next_obs = dtensor_to_dev(next_obs, self.device)
+                    next_obs = self.obs_to_dev(next_obs)
 
                     reward_buf += rewards[0]
 
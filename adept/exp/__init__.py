@@ -2,7 +2,14 @@ from .base import ExpModule
 from .base import ExpSpecBuilder
 from .replay import ExperienceReplay, PrioritizedExperienceReplay
 from .rollout import Rollout
+from .disk_replay import DiskExperienceReplay
+from .offline import ExperienceRecorder, OfflineRolloutLoader
+from .sequence_replay import SequenceReplay
 
 EXP_REG = [
-    Rollout,  # , ExperienceReplay, PrioritizedExperienceReplay
+    Rollout,
+    ExperienceReplay,
+    PrioritizedExperienceReplay,
+    DiskExperienceReplay,
+    SequenceReplay,
 ]
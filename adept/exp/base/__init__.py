@@ -1,2 +1,4 @@
-from .spec_builder import ExpSpecBuilder
+from .spec_builder import ExpSpecBuilder, key_dtype
 from .exp_module import ExpModule
+from .frames import split_frames, rebuild_stacks
+from .sum_tree import SumTree
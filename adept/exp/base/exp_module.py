@@ -33,3 +33,7 @@ class ExpModule(RequiresArgsMixin, metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def is_ready(self):
         raise NotImplementedError
+
+    def close(self):
+        """Release resources held outside of memory, e.g. files."""
+        pass
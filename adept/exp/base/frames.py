@@ -0,0 +1,68 @@
+# Copyright (C) 2018 Heron Systems, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import torch
+
+
+def split_frames(stacks, nb_frame):
+    """
+    View a batch of channel-stacked observations as separate frames.
+
+    :param stacks: Tensor (B, nb_frame * C, ...)
+    :param nb_frame: int
+    :return: Tensor (nb_frame, B, C, ...), oldest frame first
+    """
+    b, nc = stacks.shape[:2]
+    return stacks.view(
+        b, nb_frame, nc // nb_frame, *stacks.shape[2:]
+    ).transpose(0, 1)
+
+
+def rebuild_stacks(frames, terminals, nb_frame):
+    """
+    Rebuild channel-stacked observations from deduplicated frames.
+
+    Frames older than an env's episode start are zeroed, as frame stacking
+    does after a reset.
+
+    :param frames: Tensor (nb_frame - 1 + T, B, C, ...), the frames before
+        the first observation followed by the newest frame of each of the T
+        observations
+    :param terminals: Tensor (T - 1, B), a nonzero terminal at t means that
+        observation t + 1 starts a new episode
+    :param nb_frame: int
+    :return: Tensor (T, B, nb_frame * C, ...)
+    """
+    nb_obs = frames.shape[0] - nb_frame + 1
+    device = frames.device
+    # index of the first observation of each env's current episode
+    obs_ids = torch.arange(1, nb_obs, device=device).unsqueeze(1)
+    starts = torch.where(
+        terminals.to(device) != 0,
+        obs_ids,
+        torch.full_like(obs_ids, -nb_frame),
+    )
+    starts = torch.cat([torch.full_like(starts[:1], -nb_frame), starts])
+    starts = starts.cummax(0).values
+
+    # the i-th frame of observation t is the newest frame of observation
+    # t - nb_frame + 1 + i
+    stacks = torch.stack(
+        [frames[i : i + nb_obs] for i in range(nb_frame)], dim=2
+    )
+    frame_obs = torch.arange(nb_obs, device=device).view(-1, 1, 1) + (
+        torch.arange(nb_frame, device=device) - nb_frame + 1
+    )
+    stacks[(frame_obs < starts.unsqueeze(2)).nonzero(as_tuple=True)] = 0
+    return stacks.flatten(2, 3)
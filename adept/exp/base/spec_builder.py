@@ -12,6 +12,9 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import torch
+
+from adept.utils.util import numpy_to_torch_dtype
 
 
 class ExpSpecBuilder:
@@ -27,3 +30,23 @@ class ExpSpecBuilder:
 
     def __call__(self, rollout_len):
         return self.build_fn(rollout_len)
+
+
+def key_dtype(key_type):
+    """
+    :param key_type: str ("long", "byte" or "float"), or the torch or numpy
+        dtype of an observation
+    :return: torch.dtype
+    """
+    if key_type == "long":
+        return torch.long
+    elif key_type == "byte":
+        return torch.uint8
+    elif key_type == "float":
+        return torch.float32
+    elif isinstance(key_type, torch.dtype):
+        return key_type
+    elif not isinstance(key_type, str):
+        # numpy dtype of an observation that wasn't converted to torch
+        return numpy_to_torch_dtype(key_type)
+    raise Exception(f"Unrecognized key_type: {key_type}")
@@ -0,0 +1,98 @@
+# Copyright (C) 2018 Heron Systems, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+
+
+class SumTree:
+    """
+    Array-backed sum-tree and min-tree over priorities. Node i has children
+    2i and 2i + 1, the root is node 1 and leaves start at node capacity.
+    Updates and prefix-sum searches are vectorized over a batch of leaves
+    and take one NumPy op per tree level.
+    """
+
+    def __init__(self, size):
+        """
+        :param size: int, number of leaves used
+        """
+        self.size = size
+        self.capacity = 1
+        while self.capacity < size:
+            self.capacity *= 2
+        self.depth = self.capacity.bit_length() - 1
+        self.sums = np.zeros(2 * self.capacity)
+        # leaves with a zero priority are excluded from the min
+        self.mins = np.full(2 * self.capacity, np.inf)
+
+    def total(self):
+        return self.sums[1]
+
+    def min(self):
+        return self.mins[1]
+
+    def get(self, indices):
+        """
+        :param indices: np.ndarray (N), leaf indices
+        :return: np.ndarray (N), priorities
+        """
+        return self.sums[indices + self.capacity]
+
+    def update(self, indices, priorities):
+        """
+        :param indices: np.ndarray (N), leaf indices. If repeated, the last
+            priority is kept.
+        :param priorities: np.ndarray (N), zero to exclude a leaf
+        """
+        nodes = indices + self.capacity
+        self.sums[nodes] = priorities
+        self.mins[nodes] = np.where(priorities > 0, priorities, np.inf)
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            left, right = 2 * nodes, 2 * nodes + 1
+            self.sums[nodes] = self.sums[left] + self.sums[right]
+            self.mins[nodes] = np.minimum(self.mins[left], self.mins[right])
+
+    def find(self, targets):
+        """
+        Find the leaves where the prefix sums of the priorities reach the
+        targets.
+
+        :param targets: np.ndarray (N), in [0, total())
+        :return: np.ndarray (N), leaf indices
+        """
+        targets = np.array(targets, dtype=np.float64)
+        nodes = np.ones(len(targets), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sums = self.sums[left]
+            # rounding can push a target past the last nonzero leaf, so
+            # never descend into a zero priority subtree
+            go_right = (targets >= left_sums) & (self.sums[left + 1] > 0)
+            targets -= np.where(go_right, left_sums, 0.0)
+            nodes = left + go_right
+        return nodes - self.capacity
+
+    def sample(self, batch_size, rng=np.random):
+        """
+        Stratified sampling, one leaf from each of batch_size equal segments
+        of the total priority.
+
+        :param batch_size: int
+        :return: np.ndarray (batch_size), leaf indices
+        """
+        segment = self.total() / batch_size
+        offsets = rng.uniform(size=batch_size)
+        targets = (np.arange(batch_size) + offsets) * segment
+        return self.find(targets)
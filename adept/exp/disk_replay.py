@@ -0,0 +1,132 @@
+# Copyright (C) 2018 Heron Systems, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+import torch
+
+from adept.exp.replay import ExperienceReplay
+from adept.utils.util import torch_to_numpy_dtype
+
+
+class DiskExperienceReplay(ExperienceReplay):
+    """
+    ExperienceReplay stored in memory-mapped files on local disk, for
+    buffers that don't fit in RAM. The storage tensors only hold a hot
+    window of each env's most recent steps, which are written back to disk
+    as they leave it. Sampled transitions are read from the hot window when
+    still there, otherwise from disk, in file offset order.
+
+    Files are created in a new directory under replay_dir and removed by
+    close(), or when the replay is collected.
+    """
+
+    args = {
+        **ExperienceReplay.args,
+        "replay_dir": "/tmp",
+        "replay_hot_size": 100000,
+    }
+
+    def __init__(
+        self,
+        spec_builder,
+        replay_size,
+        replay_min_size,
+        replay_batch_size,
+        replay_dir,
+        replay_hot_size,
+    ):
+        nb_env = spec_builder(1)["rewards"][1]
+        self.hot_size = max(replay_hot_size // nb_env, 1)
+        super(DiskExperienceReplay, self).__init__(
+            spec_builder, replay_size, replay_min_size, replay_batch_size
+        )
+        self.device = torch.device("cpu")
+        self.dir = tempfile.mkdtemp(prefix="replay_", dir=replay_dir)
+        # removes the files even if close is never called
+        self._dir_cleanup = weakref.finalize(
+            self, shutil.rmtree, self.dir, ignore_errors=True
+        )
+        self.disk = {
+            k: np.memmap(
+                os.path.join(self.dir, "{}.bin".format(i)),
+                dtype=torch_to_numpy_dtype(self._dtype(k)),
+                mode="w+",
+                shape=(self.capacity * self.nb_env, *self.spec[k][2:]),
+            )
+            for i, k in enumerate(sorted(self.spec.keys()))
+        }
+
+    @classmethod
+    def from_args(cls, args, spec_builder):
+        return cls(
+            spec_builder,
+            args.replay_size,
+            args.replay_min_size,
+            args.replay_batch_size,
+            args.replay_dir,
+            args.replay_hot_size,
+        )
+
+    def _nb_slot(self):
+        return self.hot_size
+
+    def _slot(self, steps):
+        return steps % self.hot_size
+
+    def _advance(self, env_ids):
+        super(DiskExperienceReplay, self)._advance(env_ids)
+        if env_ids is None:
+            env_ids = torch.arange(self.nb_env)
+        # write back the steps whose hot slots are written next
+        steps = self.env_cur_idx[env_ids] - self.hot_size
+        full = steps >= 0
+        if not full.any():
+            return
+        steps, env_ids = steps[full], env_ids[full]
+        offsets = ((steps % self.capacity) * self.nb_env + env_ids).numpy()
+        slots = self._slot(steps)
+        for k, tensor in self.items():
+            self.disk[k][offsets] = tensor[slots, env_ids].numpy()
+
+    def _gather(self, key, steps, env_ids):
+        tensor = self[key]
+        hot = steps > self.env_cur_idx[env_ids] - self.hot_size
+        out = torch.empty(len(steps), *tensor.shape[2:], dtype=tensor.dtype)
+        out[hot] = tensor[self._slot(steps[hot]), env_ids[hot]]
+
+        cold = (~hot).nonzero().squeeze(1)
+        if len(cold):
+            offsets = (steps[cold] % self.capacity) * self.nb_env + env_ids[
+                cold
+            ]
+            # sorted reads stay sequential on disk where possible
+            offsets, order = torch.sort(offsets)
+            rows = self.disk[key][offsets.numpy()]
+            out[cold[order]] = torch.from_numpy(rows)
+        return out.to(self.device)
+
+    def to(self, device):
+        # storage stays on the CPU, reads are moved to the device
+        self.device = torch.device(device)
+        return self
+
+    def close(self):
+        # the files are unmapped once the memmaps are collected
+        self.disk = {}
+        self._dir_cleanup()
@@ -0,0 +1,309 @@
+# Copyright (C) 2018 Heron Systems, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Record rollouts to disk and stream them back for offline learning.
+
+A recording is a directory with an index.json and one directory per chunk
+(one rollout). Each chunk holds one zlib compressed .npy file per key.
+"""
+import io
+import json
+import os
+import queue
+import threading
+import zlib
+
+import numpy as np
+import torch
+
+INDEX_FILE = "index.json"
+
+
+def _file_name(key):
+    return key.replace("/", ".") + ".npy.z"
+
+
+def _to_numpy(tensor):
+    return tensor.detach().to("cpu", copy=True).numpy()
+
+
+def _save(path, array, level):
+    buf = io.BytesIO()
+    np.save(buf, array, allow_pickle=False)
+    with open(path, "wb") as f:
+        f.write(zlib.compress(buf.getvalue(), level))
+
+
+def _load(path):
+    with open(path, "rb") as f:
+        buf = io.BytesIO(zlib.decompress(f.read()))
+    return np.load(buf, allow_pickle=False)
+
+
+class ExperienceRecorder:
+    """
+    Writes each recorded rollout as a chunk. Rollouts are copied to the cpu
+    on record(), then compressed and written by a background thread so the
+    caller doesn't wait on the disk.
+    """
+
+    def __init__(self, root_dir, compress_level=1, queue_size=4):
+        """
+        :param root_dir: str, directory of the recording
+        :param compress_level: int, zlib level, 0-9
+        :param queue_size: int, rollouts waiting to be written before
+            record() blocks
+        """
+        self.root_dir = root_dir
+        self.compress_level = compress_level
+        os.makedirs(root_dir, exist_ok=True)
+        index_path = os.path.join(root_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            # continue a recording
+            with open(index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {"chunks": []}
+        self.nb_chunk = len(self.index["chunks"])
+
+        self._queue = queue.Queue(queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def record(self, exp, next_obs, internals):
+        """
+        :param exp: Rollout, or Dict[str, Tensor (T, B, ...)]
+        :param next_obs: Dict[str, Tensor (B, ...)]
+        :param internals: Dict[str, List[Tensor (...)]], per env internals
+            after the rollout
+        """
+        if self._error is not None:
+            raise self._error
+        # copied, the rollout is overwritten before the chunk is written
+        chunk = {
+            "exp": {k: _to_numpy(v) for k, v in exp.items()},
+            "next_obs": {k: _to_numpy(v) for k, v in next_obs.items()},
+            "internals": {
+                k: _to_numpy(torch.stack(vs)) for k, vs in internals.items()
+            },
+        }
+        self._queue.put(chunk)
+
+    def _write_loop(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            try:
+                self._write_chunk(chunk)
+            except Exception as e:
+                self._error = e
+                return
+
+    def _write_chunk(self, chunk):
+        chunk_dir = "chunk_{:06d}".format(self.nb_chunk)
+        os.makedirs(os.path.join(self.root_dir, chunk_dir), exist_ok=True)
+        entry = {
+            "dir": chunk_dir,
+            "nb_env": int(chunk["exp"]["rewards"].shape[1]),
+        }
+        for group, arrays in chunk.items():
+            files = {}
+            for k, array in arrays.items():
+                prefix = "" if group == "exp" else group + "."
+                name = prefix + _file_name(k)
+                _save(
+                    os.path.join(self.root_dir, chunk_dir, name),
+                    array,
+                    self.compress_level,
+                )
+                files[k] = {
+                    "file": name,
+                    "shape": list(array.shape),
+                    "dtype": array.dtype.str,
+                }
+            entry[group] = files
+        self.index["chunks"].append(entry)
+        self.nb_chunk += 1
+
+        # replace the index atomically, it stays valid if the run dies
+        index_path = os.path.join(self.root_dir, INDEX_FILE)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump(self.index, f)
+        os.replace(index_path + ".tmp", index_path)
+
+    def close(self):
+        """Write the rollouts left in the queue."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+class OfflineRolloutLoader:
+    """
+    Streams recorded chunks into a Rollout. A background thread reads and
+    decompresses the next chunks while the learner trains on the current
+    one. Iterating yields (experiences, next_obs, internals), as a container
+    passes them to a LearnerModule.
+
+    The Rollout is built like the one that was recorded, but its batch may
+    span several chunks, e.g. the nb_learn_batch worker rollouts an
+    ActorLearnerHost merges. Its storage is overwritten by the next batch.
+    """
+
+    def __init__(
+        self, paths, rollout, prefetch=4, nb_epoch=1, shuffle=False, seed=0
+    ):
+        """
+        :param paths: str or List[str], recording directories, searched for
+            index files
+        :param rollout: Rollout, on the device to learn on
+        :param prefetch: int, number of chunks read ahead
+        :param nb_epoch: int, passes over the recordings
+        :param shuffle: bool, shuffle the chunks of each epoch
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        self.chunks = []
+        for path in paths:
+            for root, _, files in sorted(os.walk(path)):
+                if INDEX_FILE in files:
+                    with open(os.path.join(root, INDEX_FILE)) as f:
+                        index = json.load(f)
+                    for entry in index["chunks"]:
+                        self.chunks.append((root, entry))
+        if not self.chunks:
+            raise ValueError("No recorded chunks found in {}".format(paths))
+
+        self.rollout = rollout
+        self.device = rollout["rewards"].device
+        self.prefetch = prefetch
+        self.nb_epoch = nb_epoch
+        self.shuffle = shuffle
+        self.rng = np.random.RandomState(seed)
+
+        nb_env = rollout["rewards"].shape[1]
+        chunk_nb_env = self.chunks[0][1]["nb_env"]
+        if nb_env % chunk_nb_env:
+            raise ValueError(
+                "Rollout batch of {} is not a multiple of the recorded "
+                "batch of {}".format(nb_env, chunk_nb_env)
+            )
+        self.chunks_per_batch = nb_env // chunk_nb_env
+        for root, entry in self.chunks:
+            for k, v in rollout.items():
+                shape = tuple(v.shape)
+                shape = shape[:1] + (chunk_nb_env,) + shape[2:]
+                if k not in entry["exp"]:
+                    raise ValueError("Key {} was not recorded".format(k))
+                if tuple(entry["exp"][k]["shape"]) != shape:
+                    raise ValueError(
+                        "Recorded {} has shape {}, expected {}".format(
+                            k, entry["exp"][k]["shape"], shape
+                        )
+                    )
+
+        self._thread = None
+        self._stop = threading.Event()
+
+    def __len__(self):
+        return self.nb_epoch * (len(self.chunks) // self.chunks_per_batch)
+
+    def __iter__(self):
+        self.close()
+        self._stop.clear()
+        batches = queue.Queue(self.prefetch)
+        self._thread = threading.Thread(
+            target=self._read_loop, args=(batches,), daemon=True
+        )
+        self._thread.start()
+        while True:
+            batch = batches.get()
+            if batch is None:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            yield self._to_rollout(batch)
+
+    def _read_loop(self, batches):
+        try:
+            for _ in range(self.nb_epoch):
+                order = np.arange(len(self.chunks))
+                if self.shuffle:
+                    self.rng.shuffle(order)
+                # drop the last chunks if they don't fill a batch
+                for start in range(
+                    0,
+                    len(order) - self.chunks_per_batch + 1,
+                    self.chunks_per_batch,
+                ):
+                    chunks = [
+                        self._read_chunk(*self.chunks[i])
+                        for i in order[start : start + self.chunks_per_batch]
+                    ]
+                    if not self._put(batches, chunks):
+                        return
+            self._put(batches, None)
+        except Exception as e:
+            self._put(batches, e)
+
+    def _put(self, batches, item):
+        # give up if the consumer stopped iterating
+        while not self._stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read_chunk(self, root, entry):
+        chunk = {}
+        for group in ["exp", "next_obs", "internals"]:
+            tensors = {}
+            for k, meta in entry[group].items():
+                array = _load(os.path.join(root, entry["dir"], meta["file"]))
+                tensor = torch.from_numpy(array)
+                if self.device.type == "cuda":
+                    tensor = tensor.pin_memory()
+                tensors[k] = tensor
+            chunk[group] = tensors
+        return chunk
+
+    def _to_rollout(self, chunks):
+        self.rollout.write_exps([c["exp"] for c in chunks])
+        next_obs = {
+            k: torch.cat([c["next_obs"][k] for c in chunks]).to(self.device)
+            for k in chunks[0]["next_obs"]
+        }
+        internals = {
+            k: list(
+                torch.cat([c["internals"][k] for c in chunks])
+                .to(self.device)
+                .unbind(0)
+            )
+            for k in chunks[0]["internals"]
+        }
+        return self.rollout.read(), next_obs, internals
+
+    def close(self):
+        """Stop the background thread of an unfinished iteration."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
@@ -12,32 +12,323 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from collections import namedtuple
+
+import numpy as np
+import torch
+
 from adept.exp.base.exp_module import ExpModule
+from adept.exp.base.spec_builder import key_dtype
+from adept.exp.base.sum_tree import SumTree
 
 
-class ExperienceReplay(ExpModule):
-    def write_actor(self, items):
-        pass
+class ExperienceReplay(dict, ExpModule):
+    """
+    Circular buffer of transitions, stored as one preallocated
+    (capacity, B, ...) tensor per key, where a slot holds one step of every
+    env. Writes copy a whole step, or a sub-batch of envs at their own
+    steps, in place. read() samples a batch of transitions uniformly.
+    """
 
-    def write_env(self, obs, rewards, terminals, infos):
-        pass
+    args = {
+        "replay_size": 1000000,
+        "replay_min_size": 10000,
+        "replay_batch_size": 32,
+    }
+
+    def __init__(
+        self, spec_builder, replay_size, replay_min_size, replay_batch_size
+    ):
+        super(ExperienceReplay, self).__init__()
+        self.spec = spec_builder(1)
+        self.obs_keys = spec_builder.obs_keys
+        self.action_keys = spec_builder.action_keys
+        self.internal_keys = spec_builder.internal_keys
+        self.exp_keys = spec_builder.exp_keys
+        self.key_types = spec_builder.key_types
+        self.nb_env = self.spec["rewards"][1]
+        # steps kept per env. The next observation of the newest transition
+        # and the step being written take a slot each.
+        self.capacity = max(replay_size // self.nb_env, 3)
+        self.replay_min_size = replay_min_size
+        self.replay_batch_size = replay_batch_size
+
+        self.has_obs = all([obs_key in self.spec for obs_key in self.obs_keys])
+        self.has_actions = all(
+            [act_key in self.spec for act_key in self.action_keys]
+        )
+        self.has_internals = all(
+            [internal_key in self.spec for internal_key in self.internal_keys]
+        )
+        # steps written by each env
+        self.env_cur_idx = torch.zeros(self.nb_env).long()
+
+        for k in self.spec.keys():
+            self[k] = torch.zeros(
+                self._nb_slot(), *self.spec[k][1:], dtype=self._dtype(k)
+            )
+
+    @classmethod
+    def from_args(cls, args, spec_builder):
+        return cls(
+            spec_builder,
+            args.replay_size,
+            args.replay_min_size,
+            args.replay_batch_size,
+        )
+
+    def write_actor(self, experience, no_env=False, env_ids=None):
+        for k in experience.keys() & self.keys():
+            self._write(k, experience[k].detach(), env_ids)
+        if no_env:
+            self._advance(env_ids)
+
+    def write_env(self, obs, rewards, terminals, infos, env_ids=None):
+        if self.has_obs:
+            for k in self.obs_keys:
+                self._write(k, obs[k], env_ids)
+        self._write("rewards", rewards, env_ids)
+        self._write("terminals", terminals, env_ids)
+        self._advance(env_ids)
+
+    def _write(self, key, value, env_ids):
+        """
+        :param key: str
+        :param value: Tensor (B, ...), or (len(env_ids), ...)
+        :param env_ids: Optional[LongTensor], env indices of a sub-batch
+        """
+        tensor = self[key]
+        if env_ids is None:
+            tensor[self._slot(self.env_cur_idx[0].item())] = value
+        else:
+            slots = self._slot(self.env_cur_idx[env_ids])
+            tensor.index_put_(
+                (slots.to(tensor.device), env_ids.to(tensor.device)),
+                value.to(tensor.device, tensor.dtype),
+            )
+
+    def _advance(self, env_ids):
+        if env_ids is None:
+            self.env_cur_idx += 1
+        else:
+            self.env_cur_idx[env_ids] += 1
+
+    def _nb_slot(self):
+        """
+        :return: int, steps held by the storage tensors
+        """
+        return self.capacity
+
+    def _slot(self, steps):
+        """
+        :param steps: int or LongTensor, steps of an env
+        :return: int or LongTensor, slots of the steps in the storage tensors
+        """
+        return steps % self.capacity
+
+    def _dtype(self, key):
+        return key_dtype(self.key_types[key])
+
+    def sample(self, batch_size):
+        """
+        Sample transitions uniformly from the steps whose next observation
+        is stored. Envs are sampled in proportion to their transitions, so
+        envs that have written fewer steps are sampled less.
+
+        :param batch_size: int
+        :return: Tuple[LongTensor, LongTensor], (batch_size,) slots and envs
+        """
+        nb_valid = self._nb_valid()
+        env_ids = torch.multinomial(nb_valid.float(), batch_size, True)
+        nb_step = self.env_cur_idx[env_ids]
+        first = (nb_step + 1 - self.capacity).clamp(min=0)
+        steps = first + (
+            torch.rand(batch_size) * nb_valid[env_ids].float()
+        ).long()
+        return steps % self.capacity, env_ids
+
+    def _nb_valid(self):
+        """
+        :return: LongTensor (B), transitions stored for each env
+        """
+        return (self.env_cur_idx - 1).clamp(min=0, max=self.capacity - 2)
 
     def read(self):
+        return self.read_transitions(*self.sample(self.replay_batch_size))
+
+    def read_transitions(self, slots, env_ids):
+        """
+        :param slots: LongTensor (N), buffer slots of the transitions
+        :param env_ids: LongTensor (N), envs of the transitions
+        :return: namedtuple of (N, ...) tensors
+        """
+        nb_step = self.env_cur_idx[env_ids]
+        # the latest step stored in each slot
+        steps = nb_step - 1 - (nb_step - 1 - slots) % self.capacity
+        tmp = {}
+        if self.has_obs:
+            tmp["observations"] = {
+                k: self._gather(k, steps, env_ids) for k in self.obs_keys
+            }
+            tmp["next_observations"] = {
+                k: self._gather(k, steps + 1, env_ids) for k in self.obs_keys
+            }
+        if self.has_actions:
+            tmp["actions"] = {
+                k: self._gather(k, steps, env_ids) for k in self.action_keys
+            }
+        if self.has_internals:
+            tmp["internals"] = {
+                k: self._gather(k, steps, env_ids)
+                for k in self.internal_keys
+            }
+        for k in self.exp_keys:
+            tmp[k] = self._gather(k, steps, env_ids)
+        tmp["rewards"] = self._gather("rewards", steps, env_ids)
+        tmp["terminals"] = self._gather("terminals", steps, env_ids)
+        return namedtuple(self.__class__.__name__, tmp.keys())(**tmp)
+
+    def _gather(self, key, steps, env_ids):
+        """
+        :param key: str
+        :param steps: LongTensor (N), steps of the envs
+        :param env_ids: LongTensor (N)
+        :return: Tensor (N, ...)
+        """
+        tensor = self[key]
+        return tensor[
+            self._slot(steps).to(tensor.device), env_ids.to(tensor.device)
+        ]
+
+    def clear(self):
+        # transitions are kept across learn steps
         pass
 
     def is_ready(self):
-        pass
+        return len(self) >= self.replay_min_size
 
+    def __len__(self):
+        return self._nb_valid().sum().item()
 
-class PrioritizedExperienceReplay(ExpModule):
-    def write_actor(self, items):
-        pass
+    def to(self, device):
+        for k, tensor in self.items():
+            self[k] = tensor.to(device)
+        return self
 
-    def write_env(self, obs, rewards, terminals, infos):
-        pass
+
+class PrioritizedExperienceReplay(ExperienceReplay):
+    """
+    ExperienceReplay that samples transitions in proportion to their
+    priority, stored with a sum-tree over every (slot, env) transition. New
+    transitions get the highest priority seen so far. read() also returns
+    the sampled transitions' indices, for update_priorities, and their
+    importance-sampling weights.
+    """
+
+    args = {
+        **ExperienceReplay.args,
+        "replay_alpha": 0.6,
+        "replay_beta": 0.4,
+    }
+
+    def __init__(
+        self,
+        spec_builder,
+        replay_size,
+        replay_min_size,
+        replay_batch_size,
+        replay_alpha,
+        replay_beta,
+    ):
+        super(PrioritizedExperienceReplay, self).__init__(
+            spec_builder, replay_size, replay_min_size, replay_batch_size
+        )
+        self.alpha = replay_alpha
+        self.beta = replay_beta
+        self.tree = SumTree(self.capacity * self.nb_env)
+        self.max_priority = 1.0
+
+    @classmethod
+    def from_args(cls, args, spec_builder):
+        return cls(
+            spec_builder,
+            args.replay_size,
+            args.replay_min_size,
+            args.replay_batch_size,
+            args.replay_alpha,
+            args.replay_beta,
+        )
+
+    def _advance(self, env_ids):
+        if env_ids is None:
+            env_ids = torch.arange(self.nb_env)
+        nb_step = self.env_cur_idx[env_ids]
+        super(PrioritizedExperienceReplay, self)._advance(env_ids)
+        # the previous step now has its next observation, and the oldest
+        # step's slot is written next
+        valid = nb_step >= 1
+        stale = nb_step + 1 - self.capacity >= 0
+        indices = torch.cat(
+            [
+                self._tree_indices(
+                    nb_step[stale] + 1 - self.capacity, env_ids[stale]
+                ),
+                self._tree_indices(nb_step[valid] - 1, env_ids[valid]),
+            ]
+        ).numpy()
+        priorities = np.concatenate(
+            [
+                np.zeros(stale.sum().item()),
+                np.full(valid.sum().item(), self.max_priority ** self.alpha),
+            ]
+        )
+        self.tree.update(indices, priorities)
+
+    def _tree_indices(self, steps, env_ids):
+        return (steps % self.capacity) * self.nb_env + env_ids
+
+    def sample(self, batch_size):
+        """
+        Stratified sampling in proportion to priority.
+
+        :param batch_size: int
+        :return: Tuple[LongTensor, LongTensor], (batch_size,) slots and envs
+        """
+        indices = torch.from_numpy(self.tree.sample(batch_size))
+        return indices // self.nb_env, indices % self.nb_env
 
     def read(self):
-        pass
+        slots, env_ids = self.sample(self.replay_batch_size)
+        transitions = self.read_transitions(slots, env_ids)
+        indices = slots * self.nb_env + env_ids
+        weights = self.weights(indices)
+        return namedtuple(
+            self.__class__.__name__,
+            transitions._fields + ("indices", "weights"),
+        )(*transitions, indices, weights.to(self["rewards"].device))
 
-    def is_ready(self):
-        pass
+    def weights(self, indices):
+        """
+        Importance-sampling weights, normalized by the largest weight.
+
+        :param indices: LongTensor (N), transitions as slot * B + env
+        :return: Tensor (N)
+        """
+        priorities = self.tree.get(indices.numpy())
+        weights = (priorities / self.tree.min()) ** -self.beta
+        return torch.from_numpy(weights).float()
+
+    def update_priorities(self, indices, priorities):
+        """
+        :param indices: LongTensor (N), transitions as returned by read()
+        :param priorities: Tensor (N), new priorities, such as the absolute
+            TD errors
+        """
+        indices = indices.cpu().numpy()
+        priorities = priorities.detach().cpu().double().numpy() + 1e-6
+        self.max_priority = max(self.max_priority, priorities.max())
+        # transitions overwritten since they were read stay excluded
+        stored = self.tree.get(indices) > 0
+        self.tree.update(
+            indices[stored], priorities[stored] ** self.alpha
+        )
@@ -16,14 +16,26 @@ from collections import namedtuple
 
 import torch
 from adept.utils import dlist_to_listd
-from torch import distributed as dist
+from adept.utils.util import broadcast_coalesced
 from adept.exp.base.exp_module import ExpModule
+from adept.exp.base.frames import rebuild_stacks, split_frames
+from adept.exp.base.spec_builder import key_dtype
 
 
 class Rollout(dict, ExpModule):
-    args = {"rollout_len": 20}
+    """
+    Stores a rollout of experience as one preallocated (T, B, ...) tensor per
+    key, written in place. read() returns views of the storage, which are
+    overwritten by the next rollout.
 
-    def __init__(self, spec_builder, rollout_len):
+    With dedup_frames set to the number of frames stacked on the channel
+    dimension of image observations, only the newest frame of each
+    observation is stored and stacks are rebuilt on read().
+    """
+
+    args = {"rollout_len": 20, "dedup_frames": 0}
+
+    def __init__(self, spec_builder, rollout_len, dedup_frames=0):
         super(Rollout, self).__init__()
         self.spec = spec_builder(rollout_len)
         self.obs_keys = spec_builder.obs_keys
@@ -32,6 +44,16 @@ class Rollout(dict, ExpModule):
         self.exp_keys = spec_builder.exp_keys
         self.key_types = spec_builder.key_types
         self.rollout_len = rollout_len
+        self.dedup_frames = dedup_frames
+        # (T, B, N * C, H, W) observations that are stored as single frames
+        self.frame_keys = [
+            k
+            for k in self.obs_keys
+            if dedup_frames > 1
+            and k in self.spec
+            and len(self.spec[k]) == 5
+            and self.spec[k][2] % dedup_frames == 0
+        ]
 
         self.has_obs = all([obs_key in self.spec for obs_key in self.obs_keys])
         self.has_actions = all(
@@ -41,6 +63,8 @@ class Rollout(dict, ExpModule):
             [internal_key in self.spec for internal_key in self.internal_keys]
         )
         self.cur_idx = 0
+        # per env write index, used when a sub-batch of envs is written
+        self.env_cur_idx = torch.zeros(self.spec["rewards"][1]).long()
 
         for k in self.spec.keys():
             self[k] = self._init_key(k)
@@ -49,9 +73,17 @@ class Rollout(dict, ExpModule):
 
     @classmethod
     def from_args(cls, args, spec_builder):
-        return cls(spec_builder, args.rollout_len)
+        # absent from args saved before frame dedup existed
+        return cls(spec_builder, args.rollout_len, args.dedup_frames or 0)
+
+    def write_actor(self, experience, no_env=False, env_ids=None):
+        if env_ids is not None:
+            for k in experience.keys() & self.keys():
+                self._write_envs(k, experience[k], env_ids)
+            if no_env:
+                self._advance_envs(env_ids)
+            return
 
-    def write_actor(self, experience, no_env=False):
         for k in experience.keys() & self.keys():
             # exp_shape = self[k][self.cur_idx].shape
             # write_shape = experience[k].shape
@@ -62,14 +94,29 @@ class Rollout(dict, ExpModule):
         if no_env:
             self.cur_idx += 1
 
-    def write_env(self, obs, rewards, terminals, infos):
+    def write_env(self, obs, rewards, terminals, infos, env_ids=None):
+        if env_ids is not None:
+            if self.has_obs:
+                for k in self.obs_keys:
+                    if k in self.frame_keys:
+                        self._write_frame_envs(k, obs[k], env_ids)
+                    else:
+                        self._write_envs(k, obs[k], env_ids)
+            self._write_envs("rewards", rewards, env_ids)
+            self._write_envs("terminals", terminals, env_ids)
+            self._advance_envs(env_ids)
+            return
+
         if self.has_obs:
             for k in self.obs_keys:
                 # exp_shape = self[k][self.cur_idx].shape
                 # write_shape = obs[k].shape
                 # if exp_shape != write_shape:
                 #     print(f'obs {k} {exp_shape} {write_shape}')
-                self[k][self.cur_idx] = obs[k]
+                if k in self.frame_keys:
+                    self._write_frames(k, obs[k])
+                else:
+                    self[k][self.cur_idx] = obs[k]
         # exp_shape = self['rewards'][self.cur_idx].shape
         # write_shape = rewards.shape
         # if exp_shape != write_shape:
@@ -82,38 +129,91 @@ class Rollout(dict, ExpModule):
         self["terminals"][self.cur_idx] = terminals
         self.cur_idx += 1
 
+    def _write_frames(self, key, stacks):
+        """
+        Store the newest frame of a batch of stacked observations. The first
+        observation of the rollout also stores its older frames.
+
+        :param key: str
+        :param stacks: Tensor (B, N * C, H, W)
+        """
+        frames = split_frames(stacks, self.dedup_frames)
+        if self.cur_idx == 0:
+            self[key][: self.dedup_frames - 1] = frames[:-1]
+        self[key][self.cur_idx + self.dedup_frames - 1] = frames[-1]
+
+    def _write_frame_envs(self, key, stacks, env_ids):
+        """
+        Store the newest frame of a sub-batch of stacked observations.
+
+        :param key: str
+        :param stacks: Tensor (len(env_ids), N * C, H, W)
+        :param env_ids: LongTensor, env indices of the sub-batch
+        """
+        frames = split_frames(stacks, self.dedup_frames)
+        first = (self.env_cur_idx[env_ids] == 0).nonzero().squeeze(1)
+        if len(first):
+            tensor = self[key]
+            first_ids = env_ids[first].to(tensor.device)
+            tensor[: self.dedup_frames - 1, first_ids] = (
+                frames[:-1]
+                .index_select(1, first.to(stacks.device))
+                .to(tensor.device, tensor.dtype)
+            )
+        self._write_envs(key, frames[-1], env_ids, offset=self.dedup_frames - 1)
+
+    def _write_envs(self, key, value, env_ids, offset=0):
+        """
+        Write a sub-batch of envs at each env's own rollout index.
+
+        :param key: str
+        :param value: Tensor (len(env_ids), ...)
+        :param env_ids: LongTensor, env indices of the sub-batch
+        :param offset: int, added to the rollout index of each env
+        """
+        tensor = self[key]
+        env_idxs = self.env_cur_idx[env_ids] + offset
+        tensor.index_put_(
+            (env_idxs.to(tensor.device), env_ids.to(tensor.device)),
+            value.to(tensor.device, tensor.dtype),
+        )
+
+    def _advance_envs(self, env_ids):
+        self.env_cur_idx[env_ids] += 1
+        self.cur_idx = self.env_cur_idx.min().item()
+
     def write_exps(self, exps):
-        other_exp_keys = exps[0].keys()
-        for rollout_idx in range(self.rollout_len):
-            for k in self.sorted_keys:
-                if k in other_exp_keys:
-                    tensors_to_cat = []
-                    for exp in exps:
-                        tensors_to_cat.append(exp[k][rollout_idx])
-                    cat = torch.cat(tensors_to_cat)
-                    self[k][rollout_idx] = cat
-
-        # copy next observation (for bootstrapping)
-        if self.has_obs:
-            for k in self.obs_keys:
-                tensors_to_cat = []
-                for exp in exps:
-                    tensors_to_cat.append(exp[k][-1])
-                cat = torch.cat(tensors_to_cat)
-                self[k][-1] = cat
+        """
+        Merge rollouts of sub-batches of envs, in order along the batch
+        dimension. Each key of each rollout is copied into its batch slice of
+        the storage in one copy.
+
+        :param exps: List[Dict[str, Tensor (T, b, ...)]]
+        """
+        start = 0
+        for exp in exps:
+            end = start + exp["rewards"].shape[1]
+            for k in exp.keys() & self.keys():
+                self[k][:, start:end].copy_(exp[k])
+            start = end
 
     def write_next_obs(self, obs):
         if self.has_obs:
             for k in self.obs_keys:
-                self[k][-1] = obs[k]
+                if k in self.frame_keys:
+                    frames = split_frames(obs[k], self.dedup_frames)
+                    self[k][-1] = frames[-1]
+                else:
+                    self[k][-1] = obs[k]
 
     def read(self):
         tmp = {}
         if self.has_obs:
+            obs = {k: self._read_obs(k) for k in self.obs_keys}
             tmp["observations"] = dlist_to_listd(
-                {k: self[k][:-1] for k in self.obs_keys}
+                {k: v[:-1] for k, v in obs.items()}
             )
-            tmp["next_observation"] = {k: self[k][-1] for k in self.obs_keys}
+            tmp["next_observation"] = {k: v[-1] for k, v in obs.items()}
         if self.has_actions:
             tmp["actions"] = dlist_to_listd(
                 {k: self[k] for k in self.action_keys}
@@ -126,11 +226,16 @@ class Rollout(dict, ExpModule):
         tmp["terminals"] = self["terminals"]
         return namedtuple(self.__class__.__name__, tmp.keys())(**tmp)
 
+    def _read_obs(self, key):
+        if key not in self.frame_keys:
+            return self[key]
+        return rebuild_stacks(self[key], self["terminals"], self.dedup_frames)
+
     def clear(self):
-        for k, tensor_list in self.items():
-            for i in range(len(tensor_list)):
-                self[k][i] = self[k][i].detach()
+        for k, tensor in self.items():
+            self[k] = tensor.detach()
         self.cur_idx = 0
+        self.env_cur_idx.zero_()
 
     def is_ready(self):
         return self.cur_idx == self.rollout_len
@@ -139,32 +244,26 @@ class Rollout(dict, ExpModule):
         return self.rollout_len
 
     def to(self, device):
-        for k, tensor_list in self.items():
-            for tensor_idx, tensor in enumerate(tensor_list):
-                self[k][tensor_idx] = tensor.to(device)
+        for k, tensor in self.items():
+            self[k] = tensor.to(device)
         return self
 
     def _init_key(self, key):
-        zs = torch.zeros(*self.spec[key][1:])
-        if self.key_types[key] == "long":
-            zs = zs.long()
-        elif self.key_types[key] == "byte":
-            zs = zs.byte()
-        elif self.key_types[key] == "float":
-            pass
+        if key in self.frame_keys:
+            b, nc, h, w = self.spec[key][1:]
+            shape = (b, nc // self.dedup_frames, h, w)
+            length = self.spec[key][0] + self.dedup_frames - 1
         else:
-            raise Exception(f"Unrecognized key_type: {self.key_types[key]}")
-        return [zs for _ in range(self.spec[key][0])]
+            shape = self.spec[key][1:]
+            length = self.spec[key][0]
+        return torch.zeros(
+            length, *shape, dtype=key_dtype(self.key_types[key])
+        )
 
     def sync(self, src, grp, async_op=False):
-        handles = []
-        for k in self.sorted_keys:
-            for t in self[k]:
-                handles.append(
-                    dist.broadcast(t, src=src, group=grp, async_op=True)
-                )
-
-        if not async_op:
-            [handle.wait() for handle in handles]
-
-        return handles
+        """
+        Broadcast the rollout from src, with one collective per dtype.
+        """
+        return broadcast_coalesced(
+            [self[k] for k in self.sorted_keys], src, grp, async_op
+        )
@@ -0,0 +1,259 @@
+# Copyright (C) 2018 Heron Systems, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from collections import namedtuple
+
+import torch
+
+from adept.exp.base.exp_module import ExpModule
+from adept.exp.base.spec_builder import key_dtype
+
+
+class SequenceReplay(dict, ExpModule):
+    """
+    Replay of fixed-length sequences for recurrent networks. Each env's steps
+    are staged until a sequence of sequence_len steps and its next
+    observation is complete. The sequence is then copied into the replay,
+    and the next sequence starts sequence_len - sequence_overlap steps
+    later.
+
+    Sequences are stored time-major, one preallocated
+    (sequence_len (+ 1), capacity, ...) tensor per key, with episode-boundary
+    masks, 0 at steps that start a new episode. Internals written by the
+    actor (internal keys in its exp spec) are only kept for the first step
+    of each sequence. read() samples a (T, B) batch with one
+    index_select per key and splits off the first burn_in_len steps, run
+    only to warm up the internals.
+    """
+
+    args = {
+        "replay_size": 10000,
+        "replay_min_size": 100,
+        "replay_batch_size": 32,
+        "sequence_len": 80,
+        "sequence_overlap": 40,
+        "burn_in_len": 40,
+    }
+
+    def __init__(
+        self,
+        spec_builder,
+        replay_size,
+        replay_min_size,
+        replay_batch_size,
+        sequence_len,
+        sequence_overlap,
+        burn_in_len,
+    ):
+        """
+        :param replay_size: int, sequences stored
+        :param replay_min_size: int, sequences stored before reads
+        """
+        super(SequenceReplay, self).__init__()
+        if not 0 <= sequence_overlap < sequence_len:
+            raise ValueError("Sequence overlap must be less than its length")
+        if not 0 <= burn_in_len < sequence_len:
+            raise ValueError("Burn in must be shorter than the sequence")
+        self.spec = spec_builder(1)
+        self.obs_keys = spec_builder.obs_keys
+        self.action_keys = spec_builder.action_keys
+        self.internal_keys = spec_builder.internal_keys
+        self.exp_keys = spec_builder.exp_keys
+        self.key_types = spec_builder.key_types
+        self.nb_env = self.spec["rewards"][1]
+        self.capacity = replay_size
+        self.replay_min_size = replay_min_size
+        self.replay_batch_size = replay_batch_size
+        self.sequence_len = sequence_len
+        self.stride = sequence_len - sequence_overlap
+        self.burn_in_len = burn_in_len
+
+        self.has_obs = all([obs_key in self.spec for obs_key in self.obs_keys])
+        self.has_actions = all(
+            [act_key in self.spec for act_key in self.action_keys]
+        )
+        self.has_internals = all(
+            [internal_key in self.spec for internal_key in self.internal_keys]
+        )
+        # steps staged by each env
+        self.env_cur_idx = torch.zeros(self.nb_env).long()
+        # slot of the next sequence, and number of sequences stored
+        self.next_slot = 0
+        self.nb_stored = 0
+
+        # the steps of each env's sequence in progress, and its next
+        # observation
+        self.staging = {
+            k: torch.zeros(
+                sequence_len + 1,
+                *self.spec[k][1:],
+                dtype=key_dtype(self.key_types[k]),
+            )
+            for k in self.spec.keys()
+        }
+        for k in self.spec.keys():
+            shape = self.spec[k][2:]
+            if k in self.internal_keys:
+                # only the internals a sequence starts from
+                shape = (replay_size, *shape)
+            elif k in self.obs_keys:
+                shape = (sequence_len + 1, replay_size, *shape)
+            else:
+                shape = (sequence_len, replay_size, *shape)
+            self[k] = torch.zeros(*shape, dtype=key_dtype(self.key_types[k]))
+        self["masks"] = torch.zeros(sequence_len, replay_size)
+
+    @classmethod
+    def from_args(cls, args, spec_builder):
+        return cls(
+            spec_builder,
+            args.replay_size,
+            args.replay_min_size,
+            args.replay_batch_size,
+            args.sequence_len,
+            args.sequence_overlap,
+            args.burn_in_len,
+        )
+
+    def write_actor(self, experience, no_env=False, env_ids=None):
+        for k in experience.keys() & self.staging.keys():
+            self._write(k, experience[k].detach(), env_ids)
+        if no_env:
+            self._advance(env_ids)
+
+    def write_env(self, obs, rewards, terminals, infos, env_ids=None):
+        if self.has_obs:
+            for k in self.obs_keys:
+                self._write(k, obs[k], env_ids)
+        self._write("rewards", rewards, env_ids)
+        self._write("terminals", terminals, env_ids)
+        self._advance(env_ids)
+
+    def _write(self, key, value, env_ids):
+        """
+        :param key: str
+        :param value: Tensor (B, ...), or (len(env_ids), ...)
+        :param env_ids: Optional[LongTensor], env indices of a sub-batch
+        """
+        tensor = self.staging[key]
+        if env_ids is None:
+            tensor[self.env_cur_idx[0].item()] = value
+        else:
+            tensor.index_put_(
+                (
+                    self.env_cur_idx[env_ids].to(tensor.device),
+                    env_ids.to(tensor.device),
+                ),
+                value.to(tensor.device, tensor.dtype),
+            )
+
+    def _advance(self, env_ids):
+        if env_ids is None:
+            env_ids = torch.arange(self.nb_env)
+        self.env_cur_idx[env_ids] += 1
+        # the next observation of the last step is staged
+        done = env_ids[self.env_cur_idx[env_ids] > self.sequence_len]
+        if len(done):
+            self._store(done)
+
+    def _store(self, env_ids):
+        """
+        Copy the staged sequences of envs into the replay, then keep their
+        overlapping steps staged.
+
+        :param env_ids: LongTensor, envs with a complete sequence staged
+        """
+        slots = (self.next_slot + torch.arange(len(env_ids))) % self.capacity
+        self.next_slot = (self.next_slot + len(env_ids)) % self.capacity
+        self.nb_stored = min(self.nb_stored + len(env_ids), self.capacity)
+
+        device = self["rewards"].device
+        slots, env_ids = slots.to(device), env_ids.to(device)
+        for k, staged in self.staging.items():
+            if k in self.internal_keys:
+                self[k][slots] = staged[0, env_ids]
+            elif k in self.obs_keys:
+                self[k][:, slots] = staged[:, env_ids]
+            else:
+                self[k][:, slots] = staged[: self.sequence_len, env_ids]
+        terminals = self.staging["terminals"][: self.sequence_len - 1, env_ids]
+        self["masks"][0, slots] = 1.0
+        self["masks"][1:, slots] = 1.0 - terminals.float()
+
+        for staged in self.staging.values():
+            staged[: self.sequence_len + 1 - self.stride, env_ids] = staged[
+                self.stride :, env_ids
+            ]
+        self.env_cur_idx[env_ids.cpu()] -= self.stride
+
+    def read(self):
+        inds = torch.randint(self.nb_stored, (self.replay_batch_size,))
+        return self.read_sequences(inds)
+
+    def read_sequences(self, inds):
+        """
+        :param inds: LongTensor (B), slots of the sequences
+        :return: namedtuple of (T, B, ...) tensors, the first burn_in_len
+            steps split off as burn_in_observations and burn_in_masks
+        """
+        inds = inds.to(self["rewards"].device)
+        burn_in = self.burn_in_len
+        batch = {}
+        for k, tensor in self.items():
+            if k in self.internal_keys:
+                batch[k] = tensor.index_select(0, inds)
+            else:
+                batch[k] = tensor.index_select(1, inds)
+
+        tmp = {}
+        if self.has_obs:
+            tmp["burn_in_observations"] = {
+                k: batch[k][:burn_in] for k in self.obs_keys
+            }
+            tmp["observations"] = {
+                k: batch[k][burn_in:-1] for k in self.obs_keys
+            }
+            tmp["next_observation"] = {k: batch[k][-1] for k in self.obs_keys}
+        if self.has_actions:
+            tmp["actions"] = {k: batch[k][burn_in:] for k in self.action_keys}
+        if self.has_internals:
+            # internals at the start of the burn in
+            tmp["internals"] = {k: batch[k] for k in self.internal_keys}
+        for k in self.exp_keys:
+            if k in self.obs_keys:
+                tmp[k] = batch[k][burn_in:-1]
+            elif k not in self.internal_keys:
+                tmp[k] = batch[k][burn_in:]
+        tmp["rewards"] = batch["rewards"][burn_in:]
+        tmp["terminals"] = batch["terminals"][burn_in:]
+        tmp["burn_in_masks"] = batch["masks"][:burn_in]
+        tmp["masks"] = batch["masks"][burn_in:]
+        return namedtuple(self.__class__.__name__, tmp.keys())(**tmp)
+
+    def clear(self):
+        # sequences are kept across learn steps
+        pass
+
+    def is_ready(self):
+        return self.nb_stored >= self.replay_min_size
+
+    def __len__(self):
+        return self.nb_stored
+
+    def to(self, device):
+        for k, tensor in self.items():
+            self[k] = tensor.to(device)
+        for k, tensor in self.staging.items():
+            self.staging[k] = tensor.to(device)
+        return self
@@ -44,12 +44,11 @@ class ACRolloutLearner(LearnerModule):
 
     def learn_step(self, updater, network, experiences, next_obs, internals):
         # normalize rewards
-        rewards = self.reward_normalizer(torch.stack(experiences.rewards))
+        rewards = self.reward_normalizer(experiences.rewards)
 
-        # torch stack rollouts
-        r_log_probs_action = torch.stack(experiences.log_probs)
-        r_values = torch.stack(experiences.values)
-        r_entropies = torch.stack(experiences.entropies)
+        r_log_probs_action = experiences.log_probs
+        r_values = experiences.values
+        r_entropies = experiences.entropies
 
         # estimate value of next state
         with torch.no_grad():
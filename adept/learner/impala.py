@@ -14,10 +14,26 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import torch
 
-from adept.utils.util import listd_to_dlist, dlist_to_listd
-
 from .base import LearnerModule
-from .base.dm_return_scale import DeepMindReturnScaler
+
+
+@torch.jit.script
+def _reverse_scan(deltas, decays):
+    """
+    acc_t = deltas_t + decays_t * acc_t+1, with acc_T = 0.
+
+    :param deltas: Tensor (T, B)
+    :param decays: Tensor (T, B)
+    :return: Tensor (T, B)
+    """
+    rollout_len = deltas.shape[0]
+    out = torch.empty_like(deltas)
+    acc = torch.zeros_like(deltas[0])
+    for j in range(rollout_len):
+        i = rollout_len - 1 - j
+        acc = deltas[i] + decays[i] * acc
+        out[i] = acc
+    return out
 
 
 class ImpalaLearner(LearnerModule):
@@ -30,6 +46,7 @@ class ImpalaLearner(LearnerModule):
         "discount": 0.99,
         "minimum_importance_value": 1.0,
         "minimum_importance_policy": 1.0,
+        "minimum_importance_trace": 1.0,
         "entropy_weight": 0.01,
     }
 
@@ -40,11 +57,21 @@ class ImpalaLearner(LearnerModule):
         minimum_importance_value,
         minimum_importance_policy,
         entropy_weight,
+        minimum_importance_trace=1.0,
     ):
+        """
+        :param minimum_importance_value: float, rho bar, clips the
+            importance of the value targets
+        :param minimum_importance_policy: float, clips the importance of the
+            policy gradient
+        :param minimum_importance_trace: float, c bar, clips the importance
+            of the traces
+        """
         self.reward_normalizer = reward_normalizer
         self.discount = discount
         self.minimum_importance_value = minimum_importance_value
         self.minimum_importance_policy = minimum_importance_policy
+        self.minimum_importance_trace = minimum_importance_trace
         self.entropy_weight = entropy_weight
 
     @classmethod
@@ -55,6 +82,12 @@ class ImpalaLearner(LearnerModule):
             minimum_importance_value=args.minimum_importance_value,
             minimum_importance_policy=args.minimum_importance_policy,
             entropy_weight=args.entropy_weight,
+            # absent from args saved before the trace clip was configurable
+            minimum_importance_trace=(
+                1.0
+                if args.minimum_importance_trace is None
+                else args.minimum_importance_trace
+            ),
         )
 
     def learn_step(self, updater, network, experiences, next_obs, internals):
@@ -64,26 +97,18 @@ class ImpalaLearner(LearnerModule):
             b_last_values = results["critic"].squeeze(1).data
 
         # Gather host log_probs
-        r_log_probs = []
-        for b_action, b_log_softs in zip(
-            experiences.actions, experiences.log_softmaxes
-        ):
-            k_log_probs = []
-            for act_tensor, log_soft in zip(
-                b_action.values(), b_log_softs.unbind(1)
-            ):
-                log_prob = log_soft.gather(1, act_tensor.unsqueeze(1))
-                k_log_probs.append(log_prob)
-            r_log_probs.append(torch.cat(k_log_probs, dim=1))
-
-        r_log_probs_learner = torch.stack(r_log_probs)
-        r_log_probs_actor = torch.stack(experiences.log_probs)
+        # actions are also exp keys, stored as (T, B) tensors
+        r_log_probs_learner = self._gather_log_probs(
+            {k: getattr(experiences, k) for k in experiences.actions[0]},
+            experiences.log_softmaxes,
+        )
+        r_log_probs_actor = experiences.log_probs
         r_rewards = self.reward_normalizer(
-            torch.stack(experiences.rewards)
+            experiences.rewards
         )  # normalize rewards
-        r_values = torch.stack(experiences.values)
-        r_terminals = torch.stack(experiences.terminals)
-        r_entropies = torch.stack(experiences.entropies)
+        r_values = experiences.values
+        r_terminals = experiences.terminals
+        r_entropies = experiences.entropies
         r_dterminal_masks = self.discount * (1.0 - r_terminals.float())
 
         with torch.no_grad():
@@ -96,6 +121,7 @@ class ImpalaLearner(LearnerModule):
                 b_last_values,
                 self.minimum_importance_value,
                 self.minimum_importance_policy,
+                self.minimum_importance_trace,
             )
 
         value_loss = 0.5 * (vtrace_target - r_values).pow(2).mean()
@@ -112,6 +138,17 @@ class ImpalaLearner(LearnerModule):
         metrics = {"importance": importance.mean()}
         return losses, metrics
 
+    @staticmethod
+    def _gather_log_probs(actions, log_softmaxes):
+        """
+        :param actions: Dict[ActionKey, LongTensor (T, B)], in the order the
+            actor stacked the log softmaxes
+        :param log_softmaxes: Tensor (T, B, K, A)
+        :return: Tensor (T, B, K), log probability of each action
+        """
+        actions = torch.stack(list(actions.values()), dim=-1)
+        return log_softmaxes.gather(3, actions.unsqueeze(-1)).squeeze(-1)
+
     @staticmethod
     def _vtrace_returns(
         log_prob_diffs,
@@ -121,14 +158,15 @@ class ImpalaLearner(LearnerModule):
         bootstrap_value,
         min_importance_value,
         min_importance_policy,
+        min_importance_trace=1.0,
     ):
-        rollout_len = log_prob_diffs.shape[0]
-
         importance = torch.exp(log_prob_diffs)
         clamped_importance_value = importance.clamp(max=min_importance_value)
+        clamped_importance_trace = importance.clamp(max=min_importance_trace)
         # if multiple actions take the average, (dim 3 is seq, batch, # actions)
         if clamped_importance_value.dim() == 3:
             clamped_importance_value = clamped_importance_value.mean(-1)
+            clamped_importance_trace = clamped_importance_trace.mean(-1)
 
         # create nstep vtrace return
         # first create d_tV of function 1 in the paper
@@ -142,22 +180,10 @@ class ImpalaLearner(LearnerModule):
         # reverse over the values to create the summed importance weighted
         # return everything on the right side of the plus in function 1 of
         # the paper
-        vs_minus_v_xs = []
-        nstep_v = 0.0
-        # TODO: this uses a different clamping if != 1
-        if min_importance_policy != 1 or min_importance_value != 1:
-            raise NotImplementedError()
-
-        for i in reversed(range(rollout_len)):
-            nstep_v = (
-                diff_value_per_step[i]
-                + discount_terminal_mask[i]
-                * clamped_importance_value[i]
-                * nstep_v
-            )
-            vs_minus_v_xs.append(nstep_v)
-        # reverse to a forward in time list
-        vs_minus_v_xs = torch.stack(list(reversed(vs_minus_v_xs)))
+        vs_minus_v_xs = _reverse_scan(
+            diff_value_per_step,
+            discount_terminal_mask * clamped_importance_trace,
+        )
 
         # Add V(s) to finish computation of v_s
         v_s = r_values + vs_minus_v_xs
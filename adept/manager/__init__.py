@@ -1,6 +1,7 @@
 from adept.manager.simple_env_manager import SimpleEnvManager
 from adept.manager.subproc_env_manager import SubProcEnvManager
+from adept.manager.threaded_env_manager import ThreadedEnvManager
 from adept.manager.base.manager_module import EnvManagerModule
 
 
-MANAGER_REG = [SimpleEnvManager, SubProcEnvManager]
+MANAGER_REG = [SimpleEnvManager, SubProcEnvManager, ThreadedEnvManager]
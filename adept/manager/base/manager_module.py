@@ -35,8 +35,27 @@ class EnvManagerModule(EnvBase, RequiresArgsMixin, metaclass=abc.ABCMeta):
     def nb_env(self):
         return len(self._env_fns)
 
+    @property
+    def is_async(self):
+        """
+        Whether the manager steps sub-batches of envs through send and recv.
+        """
+        return False
+
+    @property
+    def nb_restart(self):
+        """
+        Number of times env workers have been restarted after failing.
+        """
+        return 0
+
     @classmethod
     def from_args(cls, args, engine, env_cls, seed=None, nb_env=None, **kwargs):
+        env_fns = cls.env_fns_from_args(args, env_cls, seed, nb_env, **kwargs)
+        return cls(env_fns, engine)
+
+    @staticmethod
+    def env_fns_from_args(args, env_cls, seed=None, nb_env=None, **kwargs):
         if seed is None:
             seed = int(args.seed)
         if nb_env is None:
@@ -45,4 +64,4 @@ class EnvManagerModule(EnvBase, RequiresArgsMixin, metaclass=abc.ABCMeta):
         env_fns = []
         for i in range(nb_env):
             env_fns.append(env_cls.from_args_curry(args, seed + i, **kwargs))
-        return cls(env_fns, engine)
+        return env_fns
@@ -12,22 +12,55 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
-import os
+import logging
 import pickle
-
-import msgpack
-import msgpack_numpy as m
+import shutil
+import tempfile
+import traceback
+import warnings
+import weakref
+from multiprocessing.connection import wait
 
 import cloudpickle
-import numpy as np
 import torch
 import zmq
 from torch import multiprocessing as mp
 
-from adept.utils.util import listd_to_dlist, dlist_to_listd
+from adept.utils.util import (
+    listd_to_dlist,
+    DotDict,
+    pin_memory_,
+    unpin_memory_,
+    parse_cores,
+    available_cores,
+    set_cpu_affinity,
+    limit_threads,
+)
+from adept.preprocess.base import BatchCPUPreprocessor
 from .base.manager_module import EnvManagerModule
 
-ZMQ_CONNECT_METHOD = "tcp"
+logger = logging.getLogger(__name__)
+
+# Worker connections. ipc and tcp use ZMQ sockets, pipe uses the
+# multiprocessing pipe the worker is started with.
+TRANSPORTS = ("ipc", "pipe", "tcp")
+
+# Single byte control messages. Actions, rewards, dones and observations are
+# exchanged through shared memory, ZMQ only signals when they are ready to be
+# read. Step and reset commands are followed by an observation buffer index.
+CMD_STEP = b"s"
+CMD_RESET = b"r"
+CMD_RESET_TASK = b"t"
+CMD_CLOSE = b"c"
+MSG_READY = b"k"
+MSG_ERROR = b"e"
+
+# How often to check a worker is still alive while waiting on it
+WORKER_POLL_MS = 1000
+
+# Observations are double buffered so a step can't overwrite the batch
+# returned by the previous step.
+NB_OBS_BUFFER = 2
 
 
 class WorkerError(BaseException):
@@ -37,70 +70,210 @@ class WorkerError(BaseException):
 class SubProcEnvManager(EnvManagerModule):
     """Subprocess Environment Manager
 
-    This class uses torch multiprocessing to establish ZMQ connections to the
-    environment subprocesses. Once ZMQ connections are established, the multiprocessing
-    pipes are closed and ZMQ is used.
+    This class uses torch multiprocessing to start the environment
+    subprocesses. All workers are started at once and build their envs in
+    parallel. Spaces and preprocessors are taken from the first worker, which
+    is sent the shared memory along with every other worker over its
+    multiprocessing pipe. With the ``ipc`` or ``tcp`` transport, ZMQ
+    connections are then established and the multiprocessing pipes are
+    closed. With the ``pipe`` transport, the multiprocessing pipes are kept. ``ipc`` sockets
+    live in a temporary directory that is removed on close, and fall back to
+    ``tcp`` where ZMQ doesn't support ipc.
 
     This class is responsible for two main jobs:
         1) Aggregating the environment observations into a batch for learning.
         2) Unbundling a batch of agent actions and distributing them out to
          the environment subprocesses.
 
-    Observation tensors are communicated via torch shared memory. Non-tensors
-    are shared via msgpack.
-
-    Actions are serialized via msgpack.
+    Observation tensors, actions, rewards and dones are communicated via torch
+    shared memory indexed by env. ZMQ only carries short control signals.
+    Non-tensor observations and infos are pickled and only sent when they are
+    non-empty.
+
+    Each subprocess steps a contiguous slice of ``envs_per_worker`` envs and
+    writes their observations in place into one contiguous
+    ``(nb_env, *shape)`` tensor per key, which ``step`` and ``reset`` return
+    without copying. Observation buffers alternate between steps, so returned
+    observations stay valid until the step after next. With ``pin_memory``
+    and CUDA available, observation buffers are page-locked so they can be
+    copied to the GPU asynchronously.
+
+    A worker that raises, or dies, is restarted with fresh envs on the same
+    shared memory. Its envs are reset and their transitions marked terminal.
+
+    If ``async_batch_size`` is set, ``send`` and ``recv`` can be used to step
+    a subset of envs and receive whichever envs finish first, so slow envs
+    don't stall the whole batch.
+
+    Each worker limits torch and OpenCV to ``worker_nb_thread`` intra-op
+    threads so many workers don't oversubscribe the machine. Core lists are
+    strings like ``"0-3,8"``. If ``learner_cores`` is set, this process is
+    pinned to those cores. If ``worker_cores`` or ``learner_cores`` is set,
+    workers are pinned round-robin to one core each of ``worker_cores``,
+    which defaults to the cores not reserved for the learner.
+
+    With ``batch_preprocess``, each worker runs the leading batchable CPU
+    preprocessing ops once over the observations of all its envs, writing
+    into shared memory, instead of once per env. Off by default, it isn't
+    measurably faster for Atari, see benchmarks/batch_preprocess.py.
     """
 
-    args = {}
-
-    def __init__(self, env_fns, engine):
+    args = {
+        "envs_per_worker": 1,
+        "async_batch_size": None,
+        "pin_memory": True,
+        "transport": "ipc",
+        "worker_nb_thread": 1,
+        "worker_cores": None,
+        "learner_cores": None,
+        "batch_preprocess": False,
+    }
+
+    def __init__(
+        self,
+        env_fns,
+        engine,
+        envs_per_worker=1,
+        async_batch_size=None,
+        pin_memory=True,
+        transport="ipc",
+        worker_nb_thread=1,
+        worker_cores=None,
+        learner_cores=None,
+        batch_preprocess=False,
+    ):
         super(SubProcEnvManager, self).__init__(env_fns, engine)
+        if transport not in TRANSPORTS:
+            raise ValueError(
+                "Unknown transport {}, expected one of {}".format(
+                    transport, TRANSPORTS
+                )
+            )
+        if transport == "ipc" and not zmq.has("ipc"):
+            warnings.warn("ZMQ doesn't support ipc, falling back to tcp")
+            transport = "tcp"
+        self.envs_per_worker = envs_per_worker
+        self.env_slices = [
+            slice(start, min(start + envs_per_worker, self.nb_env))
+            for start in range(0, self.nb_env, envs_per_worker)
+        ]
+        self.async_batch_size = async_batch_size
+        self.pin_memory = pin_memory
+        self.transport = transport
+        self.worker_nb_thread = worker_nb_thread
+        self.batch_preprocess = batch_preprocess
+        self.worker_cores, self.learner_cores = self._assign_cores(
+            worker_cores, learner_cores
+        )
+        if self.learner_cores is not None:
+            if set_cpu_affinity(self.learner_cores):
+                limit_threads(len(self.learner_cores))
         self.waiting = False
         self.closed = False
-        self.processes = []
+        self.processes = [None] * self.nb_worker
+        self.restart_counts = [0] * self.nb_worker
 
         self._zmq_context = zmq.Context()
-        self._zmq_ports = []
-        self._zmq_sockets = []
-
-        # make a temporary env to get stuff
-        dummy = env_fns[0]()
-        self._observation_space = dummy.observation_space
-        self._action_space = dummy.action_space
-        self._cpu_preprocessor = dummy.cpu_preprocessor
-        self._gpu_preprocessor = dummy.gpu_preprocessor
-        dummy.close()
-
-        # Allows msgpack to work with NumPy
-        m.patch()
-
-        # iterate envs to get torch shared memory through pipe then close it
-        shared_memories = []
-
-        for w_ind in range(self.nb_env):
-            pipe, w_pipe = mp.Pipe()
-            socket, port = zmq_robust_bind_socket(self._zmq_context)
-
-            process = mp.Process(
-                target=worker,
-                args=(w_pipe, pipe, port, CloudpickleWrapper(env_fns[w_ind])),
+        self._zmq_sockets = [None] * self.nb_worker
+        self._ipc_dir = None
+        if transport == "ipc":
+            self._ipc_dir = tempfile.mkdtemp(prefix="adeptzmq-")
+            # removes socket files even if close is never called
+            self._ipc_cleanup = weakref.finalize(
+                self, shutil.rmtree, self._ipc_dir, ignore_errors=True
             )
-            process.daemon = True
-            process.start()
-            self.processes.append(process)
 
-            self._zmq_sockets.append(socket)
+        # start every worker before waiting on any of them
+        pipes = [self._start_worker(w_ind) for w_ind in range(self.nb_worker)]
+
+        # first worker sends spaces and preprocessors once its envs are built
+        (
+            self._observation_space,
+            self._action_space,
+            self._cpu_preprocessor,
+            self._gpu_preprocessor,
+        ) = pipes[0].recv()
+
+        # actions, rewards and dones are written in place, indexed by env
+        self._shared_actions = {
+            k: torch.zeros(self.nb_env, dtype=torch.long).share_memory_()
+            for k in self._action_space.keys()
+        }
+        self._shared_rewards = torch.zeros(self.nb_env).share_memory_()
+        self._shared_dones = torch.zeros(
+            self.nb_env, dtype=torch.bool
+        ).share_memory_()
+        self._shared_obs = [
+            self._alloc_shared_obs(self._cpu_preprocessor)
+            for _ in range(NB_OBS_BUFFER)
+        ]
+        self._buf_ind = 0
+
+        self._shared_memory = (
+            self._shared_actions,
+            self._shared_rewards,
+            self._shared_dones,
+            self._shared_obs,
+        )
+        for pipe in pipes:
+            pipe.send(self._shared_memory)
+
+        # gather the other workers as their envs finish building
+        pending = pipes[1:]
+        while pending:
+            for pipe in wait(pending):
+                pipe.recv()
+                pending.remove(pipe)
+
+        # workers connect to their zmq socket and close pipes
+        if transport != "pipe":
+            for pipe in pipes:
+                pipe.close()
+
+        # pin after the workers are forked, they don't use CUDA
+        if self.pin_memory:
+            for shared_obs in self._shared_obs:
+                for tensor in shared_obs.values():
+                    pin_memory_(tensor)
+
+        # async stepping state
+        self._in_flight = set()
+        self._poller = zmq.Poller()
+        self._worker_by_socket = {}
+        for w_ind in range(self.nb_worker):
+            self._register_worker(w_ind)
+
+    @classmethod
+    def from_args(cls, args, engine, env_cls, seed=None, nb_env=None, **kwargs):
+        args = DotDict({**cls.args, **args})
+        env_fns = cls.env_fns_from_args(args, env_cls, seed, nb_env, **kwargs)
+        return cls(
+            env_fns,
+            engine,
+            args.envs_per_worker,
+            args.async_batch_size,
+            args.pin_memory,
+            args.transport,
+            args.worker_nb_thread,
+            args.worker_cores,
+            args.learner_cores,
+            args.batch_preprocess,
+        )
 
-            pipe.send(("get_shared_memory", None))
-            shared_memories.append(pipe.recv())
+    @property
+    def is_async(self):
+        return (
+            self.async_batch_size is not None
+            and self.async_batch_size < self.nb_env
+        )
 
-            # switch to zmq socket and close pipes
-            pipe.send(("switch_zmq", None))
-            pipe.close()
-            w_pipe.close()
+    @property
+    def nb_worker(self):
+        return len(self.env_slices)
 
-        self.shared_memories = listd_to_dlist(shared_memories)
+    @property
+    def nb_restart(self):
+        return sum(self.restart_counts)
 
     @property
     def observation_space(self):
@@ -129,30 +302,124 @@ class SubProcEnvManager(EnvManagerModule):
         return self.step_wait()
 
     def step_async(self, actions):
-        action_dicts = dlist_to_listd(actions)
-        # zmq send
-        for socket, action in zip(self._zmq_sockets, action_dicts):
-            action = {k: v.numpy() for k, v in action.items()}
-            msg = msgpack.dumps(action)
+        for k, v in actions.items():
+            self._shared_actions[k].copy_(v)
+        self._buf_ind = (self._buf_ind + 1) % NB_OBS_BUFFER
+        msg = _command(CMD_STEP, self._buf_ind)
+        for socket in self._zmq_sockets:
             socket.send(msg, zmq.NOBLOCK, copy=False, track=False)
 
         self.waiting = True
 
     def step_wait(self):
-        results = [remote.recv() for remote in self._zmq_sockets]
+        results = [self._recv(w_ind) for w_ind in range(self.nb_worker)]
         self.waiting = False
 
-        # check for errors and parse
-        # self._check_for_errors(results)
-        transition = [pickle.loads(res) for res in results]
-        obs, rews, dones, infos = zip(*transition)
+        obs, infos = self._parse_replies(results)
+
+        obs = {**listd_to_dlist(obs), **self._shared_obs[self._buf_ind]}
+        # clone so the next step can't overwrite returned values
+        return (
+            obs,
+            self._shared_rewards.clone(),
+            self._shared_dones.clone(),
+            infos,
+        )
+
+    def send(self, actions, env_ids):
+        """Submits actions to a subset of the environment processes
+
+        Envs are stepped by worker, so env_ids must be made of whole worker
+        slices, as returned by ``recv``.
+
+        Parameters
+        ----------
+        actions : dict[str, torch.Tensor]
+            Actions for each env in env_ids
+        env_ids : torch.LongTensor
+        """
+        for k, v in actions.items():
+            self._shared_actions[k][env_ids] = v
+        w_inds = sorted(set((env_ids // self.envs_per_worker).tolist()))
+        for w_ind in w_inds:
+            env_slice = self.env_slices[w_ind]
+            nb_sent = (
+                (env_ids >= env_slice.start) & (env_ids < env_slice.stop)
+            ).sum()
+            assert nb_sent == self._nb_env_in(
+                env_slice
+            ), "Can't step part of a worker"
+            assert w_ind not in self._in_flight, "Worker is already stepping"
+            self._zmq_sockets[w_ind].send(
+                _command(CMD_STEP, self._buf_ind),
+                zmq.NOBLOCK,
+                copy=False,
+                track=False,
+            )
+            self._in_flight.add(w_ind)
+
+    def recv(self):
+        """Waits until ``async_batch_size`` envs have stepped, or all envs in
+        flight if there are fewer. Unlike ``step``, the returned observations
+        are copies.
+
+        Returns
+        -------
+        obs : dict[str, torch.Tensor]
+        rewards : torch.Tensor
+        dones : torch.Tensor
+        infos : list[dict]
+        env_ids : torch.LongTensor
+            Env index of each item in the batch
+        """
+        if not self._in_flight:
+            raise RuntimeError("recv called with no envs stepping, send first")
+        nb_in_flight = sum(
+            self._nb_env_in(self.env_slices[w]) for w in self._in_flight
+        )
+        nb_needed = min(self.async_batch_size, nb_in_flight)
+
+        ready, nb_ready = [], 0
+        while nb_ready < nb_needed:
+            events = self._poller.poll(WORKER_POLL_MS)
+            w_inds = [self._worker_by_socket[socket] for socket, _ in events]
+            if not w_inds:
+                # dead workers never reply, _recv reports them as failed
+                w_inds = [
+                    w
+                    for w in self._in_flight
+                    if not self.processes[w].is_alive()
+                ]
+            for w_ind in w_inds:
+                if w_ind in self._in_flight and nb_ready < nb_needed:
+                    ready.append((w_ind, self._recv(w_ind)))
+                    self._in_flight.remove(w_ind)
+                    nb_ready += self._nb_env_in(self.env_slices[w_ind])
+
+        ready.sort(key=lambda item: item[0])
+        w_inds = [w_ind for w_ind, _ in ready]
+        obs, infos = self._parse_replies(
+            [res for _, res in ready], w_inds=w_inds
+        )
+        env_ids = torch.cat(
+            [
+                torch.arange(self.env_slices[w].start, self.env_slices[w].stop)
+                for w in w_inds
+            ]
+        )
 
-        obs = listd_to_dlist(obs)
-        shared_mems = {
-            k: torch.stack(v) for k, v in self.shared_memories.items()
+        shared_obs = {
+            k: v.index_select(0, env_ids)
+            for k, v in self._shared_obs[self._buf_ind].items()
         }
-        obs = {**obs, **shared_mems}
-        return obs, torch.tensor(rews), torch.tensor(dones), infos
+        obs = {**listd_to_dlist(obs), **shared_obs}
+        return (
+            obs,
+            self._shared_rewards[env_ids],
+            self._shared_dones[env_ids],
+            infos,
+            env_ids,
+        )
 
     def reset(self):
         """Tell all subprocess environments to reset to initial state.
@@ -162,144 +429,438 @@ class SubProcEnvManager(EnvManagerModule):
         obs : dict[str, torch.Tensor]
             Observation
         """
+        self._buf_ind = (self._buf_ind + 1) % NB_OBS_BUFFER
         for socket in self._zmq_sockets:
-            socket.send(msgpack.dumps("reset"))
-        obs = listd_to_dlist(
-            [msgpack.loads(remote.recv()) for remote in self._zmq_sockets]
+            socket.send(_command(CMD_RESET, self._buf_ind))
+        obs, _ = self._parse_replies(
+            [self._recv(w_ind) for w_ind in range(self.nb_worker)]
         )
-        shared_mems = {
-            k: torch.stack(v) for k, v in self.shared_memories.items()
-        }
-        obs = {**obs, **shared_mems}
-        return obs
+        return {**listd_to_dlist(obs), **self._shared_obs[self._buf_ind]}
 
     def reset_task(self):
+        self._buf_ind = (self._buf_ind + 1) % NB_OBS_BUFFER
         for socket in self._zmq_sockets:
-            socket.send(msgpack.dumps("reset_task"))
-        return [msgpack.loads(remote.recv()) for remote in self._zmq_sockets]
+            socket.send(_command(CMD_RESET_TASK, self._buf_ind))
+        obs, _ = self._parse_replies(
+            [self._recv(w_ind) for w_ind in range(self.nb_worker)]
+        )
+        return obs
 
     def close(self):
         if self.closed:
             return
         if self.waiting:
-            for remote in self._zmq_sockets:
-                remote.recv()
-        for socket in self._zmq_sockets:
-            socket.send(msgpack.dumps("close"))
+            for w_ind in range(self.nb_worker):
+                self._recv(w_ind)
+        for w_ind in self._in_flight:
+            self._recv(w_ind)
+        for socket, process in zip(self._zmq_sockets, self.processes):
+            if process.is_alive():
+                socket.send(CMD_CLOSE)
         for p in self.processes:
             p.join()
+        for socket in self._zmq_sockets:
+            socket.close()
+        if self._ipc_dir is not None:
+            self._ipc_cleanup()
+        if self.pin_memory:
+            for shared_obs in self._shared_obs:
+                for tensor in shared_obs.values():
+                    unpin_memory_(tensor)
         self.closed = True
 
-    def _check_for_errors(self, results):
-        errors = []
-        del_inds = []
-        # multiple workers can fail on the same step
-        for i, r in enumerate(results):
-            if r[:5] == b"error":
-                del_inds.append(i)
-                errors.append("Worker {} has an error {}".format(i, r))
-        if len(errors) > 0:
-            # have to delete from last to first, otherwise inds are invalid
-            for d in reversed(sorted(del_inds)):
-                # remove from open sockets
-                del self._zmq_sockets[d]
-            raise WorkerError(errors)
-
-
-def worker(remote, parent_remote, port, env_fn_wrapper):
+    def _parse_replies(self, results, w_inds=None):
+        """
+        :param results: List[bytes], one reply per worker
+        :param w_inds: Optional[List[int]], workers replying, defaults to all
+        :return: Tuple[List[Dict], List[Dict]], non-shared obs and infos per env
+        """
+        if w_inds is None:
+            w_inds = range(self.nb_worker)
+        obs, infos = [], []
+        for w_ind, res in zip(w_inds, results):
+            if res[:1] == MSG_ERROR:
+                res = self._restart_worker(w_ind, pickle.loads(res[1:]))
+            nb_env = self._nb_env_in(self.env_slices[w_ind])
+            w_obs, w_infos = _parse_reply(res, nb_env)
+            obs.extend(w_obs)
+            infos.extend(w_infos)
+        return obs, infos
+
+    @staticmethod
+    def _nb_env_in(env_slice):
+        return env_slice.stop - env_slice.start
+
+    def _alloc_shared_obs(self, cpu_preprocessor):
+        """
+        :param cpu_preprocessor: CPUPreprocessor
+        :return: Dict[str, Tensor], one (nb_env, *shape) tensor per tensor
+            observation key
+        """
+        shared_obs = {}
+        dtypes = cpu_preprocessor.observation_dtypes
+        for name, shape in cpu_preprocessor.observation_space.items():
+            if shape is not None:
+                if not dtypes:
+                    tensor = torch.zeros(self.nb_env, *shape)
+                else:
+                    tensor = torch.zeros(
+                        self.nb_env, *shape, dtype=dtypes[name]
+                    )
+                shared_obs[name] = tensor.share_memory_()
+        return shared_obs
+
+    def _assign_cores(self, worker_cores, learner_cores):
+        """
+        :param worker_cores: Optional[str], cores shared by the workers
+        :param learner_cores: Optional[str], cores reserved for this process
+        :return: Tuple[Optional[List[List[int]]], Optional[List[int]]], cores
+            for each worker and for this process, None if not pinned
+        """
+        if worker_cores is None and learner_cores is None:
+            return None, None
+        if learner_cores is not None:
+            learner_cores = parse_cores(learner_cores)
+        if worker_cores is not None:
+            worker_cores = parse_cores(worker_cores)
+        else:
+            worker_cores = [
+                c for c in available_cores() if c not in learner_cores
+            ]
+        if not worker_cores:
+            raise ValueError("No cores left for the env workers")
+        return (
+            [
+                [worker_cores[w_ind % len(worker_cores)]]
+                for w_ind in range(self.nb_worker)
+            ],
+            learner_cores,
+        )
+
+    def _start_worker(self, w_ind):
+        """
+        Start the process for a worker. It expects the shared memory on the
+        returned pipe once it has sent back its first message.
+
+        :param w_ind: int
+        :return: multiprocessing.Connection
+        """
+        env_slice = self.env_slices[w_ind]
+        pipe, w_pipe = mp.Pipe()
+        if self.transport == "pipe":
+            socket, address = PipeSocket(pipe), None
+        else:
+            # restarted workers get a new socket
+            socket, address = zmq_robust_bind_socket(
+                self._zmq_context,
+                self.transport,
+                self._ipc_dir,
+                "{}-{}".format(w_ind, self.restart_counts[w_ind]),
+            )
+
+        process = mp.Process(
+            target=worker,
+            args=(
+                w_pipe,
+                pipe,
+                address,
+                CloudpickleWrapper(self.env_fns[env_slice]),
+                env_slice,
+                self.worker_nb_thread,
+                None if self.worker_cores is None else self.worker_cores[w_ind],
+                self.batch_preprocess,
+            ),
+        )
+        process.daemon = True
+        process.start()
+        w_pipe.close()
+        self.processes[w_ind] = process
+        self._zmq_sockets[w_ind] = socket
+        return pipe
+
+    def _register_worker(self, w_ind):
+        socket = self._zmq_sockets[w_ind]
+        self._poller.register(socket, zmq.POLLIN)
+        # the poller returns file descriptors for non ZMQ sockets
+        if isinstance(socket, PipeSocket):
+            self._worker_by_socket[socket.fileno()] = w_ind
+        else:
+            self._worker_by_socket[socket] = w_ind
+
+    def _unregister_worker(self, w_ind):
+        socket = self._zmq_sockets[w_ind]
+        self._poller.unregister(socket)
+        if isinstance(socket, PipeSocket):
+            del self._worker_by_socket[socket.fileno()]
+        else:
+            del self._worker_by_socket[socket]
+
+    def _recv(self, w_ind):
+        """
+        Wait for a reply from a worker. Workers that die without replying get
+        an error reply.
+
+        :param w_ind: int
+        :return: bytes
+        """
+        socket = self._zmq_sockets[w_ind]
+        process = self.processes[w_ind]
+        while not socket.poll(WORKER_POLL_MS):
+            if not process.is_alive():
+                break
+        try:
+            if socket.poll(0):
+                return socket.recv()
+        except EOFError:
+            pass
+        return _error_reply(
+            "Worker exited with code {}".format(process.exitcode)
+        )
+
+    def _restart_worker(self, w_ind, error):
+        """
+        Replace a failed worker with a new process and fresh envs on the same
+        shared memory. The new envs are reset and their transitions are marked
+        terminal with no reward.
+
+        :param w_ind: int
+        :param error: str, what went wrong with the failed worker
+        :return: bytes, reset reply from the new worker
+        """
+        # error holds the worker's traceback
+        logger.warning(
+            "Env worker %d failed, restarting it.\n%s", w_ind, error
+        )
+        self._unregister_worker(w_ind)
+        self._zmq_sockets[w_ind].close()
+        process = self.processes[w_ind]
+        process.join(timeout=WORKER_POLL_MS / 1000)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+        self.restart_counts[w_ind] += 1
+        pipe = self._start_worker(w_ind)
+        try:
+            pipe.recv()
+        except EOFError:
+            raise WorkerError(
+                "Env worker {} failed to restart after {}".format(w_ind, error)
+            )
+        pipe.send(self._shared_memory)
+        if self.transport != "pipe":
+            pipe.close()
+        self._register_worker(w_ind)
+
+        self._zmq_sockets[w_ind].send(_command(CMD_RESET, self._buf_ind))
+        res = self._recv(w_ind)
+        if res[:1] == MSG_ERROR:
+            raise WorkerError(
+                "Env worker {} failed to reset after restarting. {}".format(
+                    w_ind, pickle.loads(res[1:])
+                )
+            )
+        env_slice = self.env_slices[w_ind]
+        self._shared_rewards[env_slice] = 0
+        self._shared_dones[env_slice] = True
+        return res
+
+
+def worker(
+    remote,
+    parent_remote,
+    address,
+    env_fn_wrapper,
+    env_slice,
+    nb_thread=None,
+    cores=None,
+    batch_preprocess=False,
+):
     """
     Modified.
     MIT License
     Copyright (c) 2017 OpenAI (http://openai.com)
     """
     parent_remote.close()
-    env = env_fn_wrapper.x()
-
-    shared_memory = {}
-    dtypes = env.cpu_preprocessor.observation_dtypes
-    for name, shape in env.cpu_preprocessor.observation_space.items():
-        if shape is not None:
-            if not dtypes:
-                tensor = torch.FloatTensor(*shape)
-            else:
-                tensor = torch.zeros(*shape, dtype=dtypes[name])
-            shared_memory[name] = tensor
-
-    # initial python pipe setup
-    python_pipe = True
-    while python_pipe:
-        cmd, _ = remote.recv()
-        if cmd == "get_shared_memory":
-            remote.send(shared_memory)
-        elif cmd == "switch_zmq":
-            # close python pipes
-            remote.close()
-            python_pipe = False
-        else:
-            raise NotImplementedError
+    # before building envs, so no threads are started on other cores
+    if cores is not None:
+        set_cpu_affinity(cores)
+    if nb_thread is not None:
+        limit_threads(nb_thread)
+    envs = [env_fn() for env_fn in env_fn_wrapper.x]
+    env_inds = range(env_slice.start, env_slice.stop)
+
+    # initial python pipe setup, the first worker describes the envs
+    if env_slice.start == 0:
+        remote.send(
+            (
+                envs[0].observation_space,
+                envs[0].action_space,
+                envs[0].cpu_preprocessor,
+                envs[0].gpu_preprocessor,
+            )
+        )
+    else:
+        remote.send(None)
+    shared_actions, shared_rewards, shared_dones, shared_obs = remote.recv()
+    # envs return unprocessed observations from here on
+    batch_preprocessor = None
+    if batch_preprocess:
+        batch_preprocessor = BatchCPUPreprocessor(
+            [env.cpu_preprocessor for env in envs]
+        )
 
-    # zmq setup
-    context = zmq.Context()
-    socket = context.socket(zmq.PAIR)
-    if ZMQ_CONNECT_METHOD == "tcp":
-        socket.connect("tcp://localhost:{}".format(port))
-    if ZMQ_CONNECT_METHOD == "ipc":
-        socket.connect("ipc:///tmp/adeptzmq/{}".format(port))
+    if address is None:
+        # pipe transport, keep using the python pipe
+        socket = PipeSocket(remote)
+    else:
+        # close python pipes
+        remote.close()
+
+        # zmq setup
+        context = zmq.Context()
+        socket = context.socket(zmq.PAIR)
+        # don't hang on exit if the manager is gone
+        socket.setsockopt(zmq.LINGER, WORKER_POLL_MS)
+        socket.connect(address)
 
     running = True
     while running:
         try:
-            socket_data = socket.recv()
-            socket_parsed = msgpack.loads(socket_data)
-
-            # commands that aren't action dictionaries
-            if socket_parsed == "reset":
-                ob = env.reset()
-                ob = handle_ob(ob, shared_memory)
+            msg = socket.recv()
+            cmd, shared_memory = msg[:1], None
+            if len(msg) > 1:
+                shared_memory = shared_obs[msg[1]]
+
+            if cmd == CMD_STEP:
+                obs, infos = [], []
+                for env_ind, env in zip(env_inds, envs):
+                    action_dictionary = {
+                        k: v[env_ind].numpy() for k, v in shared_actions.items()
+                    }
+                    ob, reward, done, info = env.step(action_dictionary)
+                    if done:
+                        ob = env.reset()
+                    obs.append(ob)
+                    infos.append(info)
+                    shared_rewards[env_ind] = reward
+                    shared_dones[env_ind] = bool(done)
                 # only the non-shared obs are returned here
+                obs = handle_obs(
+                    obs, shared_memory, env_slice, batch_preprocessor
+                )
                 socket.send(
-                    msgpack.dumps(ob),
+                    _make_reply(obs, infos),
                     zmq.NOBLOCK,
                     copy=False,
                     track=False,
                 )
-            elif cmd == "reset_task":
-                ob = env.reset_task()
-                ob = handle_ob(ob, shared_memory)
-                # only the non-shared obs are returned here
+            elif cmd == CMD_RESET or cmd == CMD_RESET_TASK:
+                obs = []
+                for env in envs:
+                    if cmd == CMD_RESET:
+                        ob = env.reset()
+                    else:
+                        ob = env.reset_task()
+                    obs.append(ob)
+                obs = handle_obs(
+                    obs, shared_memory, env_slice, batch_preprocessor
+                )
                 socket.send(
-                    msgpack.dumps(ob),
+                    _make_reply(obs, [{} for _ in envs]),
                     zmq.NOBLOCK,
                     copy=False,
                     track=False,
                 )
-            elif socket_parsed == "close":
-                env.close()
+            elif cmd == CMD_CLOSE:
+                for env in envs:
+                    env.close()
                 running = False
-            # else action dictionary
             else:
-                action_dictionary = socket_parsed
-                ob, reward, done, info = env.step(action_dictionary)
-                if done:
-                    ob = env.reset()
-                ob = handle_ob(ob, shared_memory)
-                # only the non-shared obs are returned here
-                msg = pickle.dumps((ob, reward, done, info))
-                socket.send(msg, zmq.NOBLOCK, copy=False, track=False)
+                raise ValueError("Unknown command {}".format(cmd))
         except KeyboardInterrupt:
             pass
+        except Exception:
+            # the manager restarts this worker
+            socket.send(_error_reply(traceback.format_exc()))
+            for env in envs:
+                try:
+                    env.close()
+                except Exception:
+                    pass
+            running = False
+
+    socket.close()
+    if address is not None:
+        context.term()
+
+
+def handle_obs(obs, shared_memory, env_slice, batch_preprocessor=None):
+    """
+    Write the tensor observations of a slice of envs to shared memory.
+
+    :param obs: List[Dict[str, Any]], observation of each env in the slice
+    :param shared_memory: Dict[str, Tensor], (nb_env, *shape) tensors
+    :param env_slice: slice
+    :param batch_preprocessor: Optional[BatchCPUPreprocessor], preprocesses
+        the observations first
+    :return: List[Dict[str, Any]], non-shared observations of each env
+    """
+    if batch_preprocessor is not None:
+        return batch_preprocessor(
+            obs, {k: v[env_slice] for k, v in shared_memory.items()}
+        )
+    return [
+        handle_ob(ob, shared_memory, env_ind)
+        for ob, env_ind in zip(obs, range(env_slice.start, env_slice.stop))
+    ]
 
 
-def handle_ob(ob, shared_memory):
+def handle_ob(ob, shared_memory, env_ind):
     non_shared = {}
     for k, v in ob.items():
         if isinstance(v, torch.Tensor):
-            shared_memory[k].copy_(v)
+            shared_memory[k][env_ind].copy_(v)
         else:
             non_shared[k] = v
     return non_shared
 
 
+def _command(cmd, buf_ind):
+    """
+    :param cmd: bytes, single byte command
+    :param buf_ind: int, observation buffer the worker should write to
+    :return: bytes
+    """
+    return cmd + bytes((buf_ind,))
+
+
+def _make_reply(non_shared_obs, infos):
+    if not any(non_shared_obs) and not any(infos):
+        return MSG_READY
+    return pickle.dumps((non_shared_obs, infos))
+
+
+def _error_reply(error):
+    """
+    :param error: str, description of the error
+    :return: bytes
+    """
+    return MSG_ERROR + pickle.dumps(error)
+
+
+def _parse_reply(msg, nb_env):
+    """
+    :param msg: bytes, reply from a worker
+    :param nb_env: int, number of envs stepped by the worker
+    :return: Tuple[List[Dict[str, Any]], List[Dict[str, Any]]], non-shared
+        obs and infos per env
+    """
+    if msg == MSG_READY:
+        return [{} for _ in range(nb_env)], [{} for _ in range(nb_env)]
+    return pickle.loads(msg)
+
+
 class CloudpickleWrapper(object):
     """
     Modified.
@@ -314,28 +875,62 @@ class CloudpickleWrapper(object):
         return cloudpickle.dumps(self.x)
 
     def __setstate__(self, ob):
-        self.x = msgpack.loads(ob)
+        self.x = pickle.loads(ob)
 
 
-def zmq_robust_bind_socket(zmq_context):
-    try_count = 0
-    while try_count < 3:
-        try:
-            socket = zmq_context.socket(zmq.PAIR)
-            port = np.random.randint(5000, 30000)
-            if ZMQ_CONNECT_METHOD == "tcp":
-                socket.bind("tcp://*:{}".format(port))
-            if ZMQ_CONNECT_METHOD == "ipc":
-                os.makedirs("/tmp/adeptzmq/", exist_ok=True)
-                socket.bind("ipc:///tmp/adeptzmq/{}".format(port))
-        except zmq.error.ZMQError as e:
-            try_count += 1
-            socket = None
-            last_error = e
-            continue
-        break
-    if socket is None:
-        raise Exception(
-            "ZMQ couldn't bind socket after 3 tries. {}".format(last_error)
-        )
-    return socket, port
+class PipeSocket:
+    """
+    Wraps a multiprocessing Connection with the part of the ZMQ socket
+    interface used by the manager and workers. Has a fileno so it can be
+    registered with a zmq.Poller.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def send(self, msg, *args, **kwargs):
+        self.conn.send_bytes(msg)
+
+    def recv(self):
+        return self.conn.recv_bytes()
+
+    def poll(self, timeout=None):
+        """
+        :param timeout: Optional[int], milliseconds, waits forever if None
+        :return: bool, True if there is something to receive
+        """
+        if timeout is not None:
+            timeout /= 1000
+        return self.conn.poll(timeout)
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def close(self):
+        self.conn.close()
+
+
+def zmq_robust_bind_socket(zmq_context, transport="tcp", ipc_dir=None, name=0):
+    """
+    Bind a ZMQ PAIR socket. tcp sockets bind to a free port picked by the OS,
+    ipc sockets to a file in ipc_dir.
+
+    :param zmq_context: zmq.Context
+    :param transport: str, "tcp" or "ipc"
+    :param ipc_dir: str, directory for ipc socket files
+    :param name: Any, ipc socket file name, unique within ipc_dir
+    :return: Tuple[zmq.Socket, str], bound socket and the address to connect to
+    """
+    socket = zmq_context.socket(zmq.PAIR)
+    try:
+        if transport == "tcp":
+            socket.bind("tcp://127.0.0.1:*")
+        elif transport == "ipc":
+            socket.bind("ipc://{}/{}".format(ipc_dir, name))
+        else:
+            raise ValueError("Can't bind a {} socket".format(transport))
+    except (zmq.error.ZMQError, ValueError):
+        socket.close()
+        raise
+    address = socket.getsockopt_string(zmq.LAST_ENDPOINT)
+    return socket, address
@@ -15,7 +15,8 @@
 import abc
 
 import torch
-from torch import distributed as dist
+
+from adept.utils.util import broadcast_coalesced
 
 
 class BaseNetwork(torch.nn.Module):
@@ -41,21 +42,9 @@ class BaseNetwork(torch.nn.Module):
         return {k: t.shape for k, t in self.new_internals("cpu").items()}
 
     def sync(self, src, grp=None, async_op=False):
-
-        keys = []
-        handles = []
-
-        for k, t in self.state_dict().items():
-            if grp is None:
-                h = dist.broadcast(t, src, async_op=True)
-            else:
-                h = dist.broadcast(t, src, grp, async_op=True)
-
-            keys.append(k)
-            handles.append(h)
-
-        if not async_op:
-            for k, h in zip(keys, handles):
-                h.wait()
-
-        return handles
+        """
+        Broadcast the state dict from src, with one collective per dtype.
+        """
+        return broadcast_coalesced(
+            self.state_dict().values(), src, grp, async_op
+        )
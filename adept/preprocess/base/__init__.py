@@ -1,2 +1,3 @@
-from .ops import Operation, SimpleOperation, MultiOperation
-from .preprocessor import CPUPreprocessor, GPUPreprocessor
\ No newline at end of file
+from .ops import Operation, SimpleOperation, MultiOperation, FusedOperation
+from .preprocessor import CPUPreprocessor, GPUPreprocessor
+from .preprocessor import BatchCPUPreprocessor
\ No newline at end of file
@@ -1,4 +1,9 @@
 import abc
+import logging
+
+import torch
+
+logger = logging.getLogger(__name__)
 
 
 class Operation(abc.ABC):
@@ -13,6 +18,16 @@ class Operation(abc.ABC):
     def reset(self):
         pass
 
+    def reset_envs(self, mask):
+        """Reset the state kept for some envs of a batch.
+
+        Parameters
+        ----------
+        mask : torch.Tensor
+            (B,) bool, True for the envs to reset.
+        """
+        pass
+
     def to(self, device):
         return self
 
@@ -56,17 +71,30 @@ class MultiOperation(Operation, metaclass=abc.ABCMeta):
 class SimpleOperation(Operation, metaclass=abc.ABCMeta):
     """Modifies a single key in the observation dictionary."""
 
+    # Stateless ops that can preprocess the observations of many envs at once
+    # with preprocess_cpu_batch.
+    batchable = False
+    # Ops whose CPU preprocessing can write into a preallocated out tensor,
+    # shaped by update_shape and update_dtype, instead of allocating one.
+    writes_out = False
+    # Stateless ops whose GPU preprocessing is elementwise and traceable, so
+    # adjacent ones can be fused into one compiled function.
+    elementwise = False
+
     def __init__(self, input_field, output_field):
         self.input_field = input_field
         self.output_field = output_field
 
     @abc.abstractmethod
     def preprocess_cpu(self, tensor):
-        """Preprocess a specific field of an observation on the CPU.
+        """Preprocess a specific field of an observation on the CPU. Ops that
+        write out also take an ``out`` keyword argument.
 
         Parameters
         ----------
         tensor : torch.Tensor
+        out : torch.Tensor, optional
+            Preallocated output, returned once written.
 
         Returns
         -------
@@ -74,6 +102,26 @@ class SimpleOperation(Operation, metaclass=abc.ABCMeta):
         """
         raise NotImplemented
 
+    def preprocess_cpu_batch(self, tensor, out=None):
+        """Preprocess a specific field of a batch of observations on the CPU.
+        Only called if the op is batchable. Defaults to preprocess_cpu, which
+        works for elementwise ops.
+
+        Parameters
+        ----------
+        tensor : torch.Tensor or np.ndarray
+            Observations of every env, stacked on the first dimension.
+        out : torch.Tensor, optional
+            Preallocated output, only given to ops that write out.
+
+        Returns
+        -------
+        torch.Tensor
+        """
+        if out is None:
+            return self.preprocess_cpu(tensor)
+        return self.preprocess_cpu(tensor, out=out)
+
     @abc.abstractmethod
     def preprocess_gpu(self, tensor):
         """Preprocess a specific field of an observation on the GPU
@@ -87,3 +135,70 @@ class SimpleOperation(Operation, metaclass=abc.ABCMeta):
         torch.Tensor
         """
         raise NotImplemented
+
+
+class FusedOperation(SimpleOperation):
+    """Runs a chain of elementwise SimpleOperations on the GPU as one
+    function, traced with TorchScript so the fuser can merge their kernels
+    and drop the intermediate tensors. A function is traced per input dtype,
+    device and rank, falling back to running the ops one by one if tracing
+    fails. CPU inputs always run the ops one by one.
+    """
+
+    def __init__(self, ops):
+        """
+        Parameters
+        ----------
+        ops : list[SimpleOperation]
+            Elementwise ops that each preprocess the output of the last.
+        """
+        super().__init__(ops[0].input_field, ops[-1].output_field)
+        self.ops = ops
+        self._fns = {}
+
+    def update_shape(self, old_shape):
+        for op in self.ops:
+            old_shape = op.update_shape(old_shape)
+        return old_shape
+
+    def update_dtype(self, old_dtype):
+        for op in self.ops:
+            old_dtype = op.update_dtype(old_dtype)
+        return old_dtype
+
+    def preprocess_cpu(self, tensor):
+        for op in self.ops:
+            tensor = op.preprocess_cpu(tensor)
+        return tensor
+
+    def preprocess_gpu(self, tensor):
+        # only the CUDA fuser merges kernels, a trace is slower on the CPU
+        if tensor.device.type != "cuda":
+            return self._run(tensor)
+        key = (tensor.dtype, tensor.device, tensor.dim())
+        fn = self._fns.get(key)
+        if fn is None:
+            fn = self._fns[key] = self._compile(tensor)
+        return fn(tensor)
+
+    def to(self, device):
+        self.ops = [op.to(device) for op in self.ops]
+        return self
+
+    def _run(self, tensor):
+        for op in self.ops:
+            tensor = op.preprocess_gpu(tensor)
+        return tensor
+
+    def _compile(self, tensor):
+        try:
+            with torch.no_grad():
+                return torch.jit.trace(self._run, tensor, check_trace=False)
+        except RuntimeError:
+            # the tracer raises RuntimeError on ops it can't record
+            logger.warning(
+                "Could not trace fused ops %s, running them unfused",
+                [type(op).__name__ for op in self.ops],
+                exc_info=True,
+            )
+            return self._run
@@ -1,4 +1,3 @@
-from collections import deque
 from functools import reduce
 
 import torch
@@ -16,7 +15,13 @@ except ImportError:
 
 
 class CastToFloat(SimpleOperation):
-    def preprocess_cpu(self, tensor):
+    batchable = True
+    writes_out = True
+    elementwise = True
+
+    def preprocess_cpu(self, tensor, out=None):
+        if out is not None:
+            return out.copy_(tensor)
         return tensor.float()
 
     def preprocess_gpu(self, tensor):
@@ -30,7 +35,13 @@ class CastToFloat(SimpleOperation):
 
 
 class CastToDouble(SimpleOperation):
-    def preprocess_cpu(self, tensor):
+    batchable = True
+    writes_out = True
+    elementwise = True
+
+    def preprocess_cpu(self, tensor, out=None):
+        if out is not None:
+            return out.copy_(tensor)
         return tensor.double()
 
     def preprocess_gpu(self, tensor):
@@ -44,7 +55,13 @@ class CastToDouble(SimpleOperation):
 
 
 class CastToHalf(SimpleOperation):
-    def preprocess_cpu(self, tensor):
+    batchable = True
+    writes_out = True
+    elementwise = True
+
+    def preprocess_cpu(self, tensor, out=None):
+        if out is not None:
+            return out.copy_(tensor)
         return tensor.half()
 
     def preprocess_gpu(self, tensor):
@@ -58,6 +75,9 @@ class CastToHalf(SimpleOperation):
 
 
 class GrayScaleAndMoveChannel(SimpleOperation):
+    batchable = True
+    writes_out = True
+
     def __init__(self, *args, **kwargs):
         if not CV2_AVAILABLE:
             raise NotImplementedError("GrayScaleAndMoveChannel requires cv2")
@@ -69,8 +89,13 @@ class GrayScaleAndMoveChannel(SimpleOperation):
     def update_dtype(self, old_dtype):
         return old_dtype
 
-    def preprocess_cpu(self, tensor):
+    def preprocess_cpu(self, tensor, out=None):
         if tensor.dim() == 3:
+            if out is not None:
+                cv2.cvtColor(
+                    tensor.numpy(), cv2.COLOR_RGB2GRAY, dst=out.numpy()[0]
+                )
+                return out
             return torch.from_numpy(
                 cv2.cvtColor(tensor.numpy(), cv2.COLOR_RGB2GRAY)
             ).unsqueeze(0)
@@ -79,6 +104,23 @@ class GrayScaleAndMoveChannel(SimpleOperation):
                 "can't grayscale a rank" + str(tensor.dim()) + "tensor"
             )
 
+    def preprocess_cpu_batch(self, tensor, out=None):
+        if tensor.dim() == 4:
+            # one call over all frames stacked vertically
+            b, h, w, c = tensor.shape
+            if out is None:
+                out = torch.empty(b, 1, h, w, dtype=tensor.dtype)
+            cv2.cvtColor(
+                tensor.numpy().reshape(b * h, w, c),
+                cv2.COLOR_RGB2GRAY,
+                dst=out.numpy().reshape(b * h, w),
+            )
+            return out
+        else:
+            raise ValueError(
+                "can't grayscale a rank" + str(tensor.dim()) + "tensor"
+            )
+
     def preprocess_gpu(self, tensor):
         if tensor.dim() == 4:
             return tensor.mean(dim=3).unsqueeze(1)
@@ -89,6 +131,9 @@ class GrayScaleAndMoveChannel(SimpleOperation):
 
 
 class ResizeToNxM(SimpleOperation):
+    batchable = True
+    writes_out = True
+
     def __init__(self, n, m, input_field, output_field):
         if not CV2_AVAILABLE:
             raise NotImplementedError("ResizeToNxM requires cv2")
@@ -97,13 +142,31 @@ class ResizeToNxM(SimpleOperation):
         self.m = m
 
     def update_shape(self, old_shape):
-        return 1, self.n, self.m
+        # cv2 sizes are (width, height), images are (rows, cols)
+        return 1, self.m, self.n
 
     def update_dtype(self, old_dtype):
         return old_dtype
 
-    def preprocess_cpu(self, tensor):
+    def _resize(self, frame, dst):
+        """Area resize a (H, W) frame into dst, an (m, n) array."""
+        if dst.shape != (self.m, self.n):
+            raise ValueError(
+                "Resize output of shape {} can't hold a {}x{} "
+                "frame".format(dst.shape, self.m, self.n)
+            )
+        result = cv2.resize(
+            frame, (self.n, self.m), dst=dst, interpolation=cv2.INTER_AREA
+        )
+        # cv2 allocates its own result if it can't use dst
+        if result.ctypes.data != dst.ctypes.data:
+            dst[...] = result
+
+    def preprocess_cpu(self, tensor, out=None):
         if tensor.dim() == 3:
+            if out is not None:
+                self._resize(tensor.numpy()[0], out.numpy()[0])
+                return out
             temp = cv2.resize(
                 tensor.squeeze(0).numpy(),
                 (self.n, self.m),
@@ -117,9 +180,29 @@ class ResizeToNxM(SimpleOperation):
                 + " tensor to {}x{}".format(self.n, self.m)
             )
 
+    def preprocess_cpu_batch(self, tensor, out=None):
+        if tensor.dim() == 4:
+            # cv2 only area resizes up to 4 channels, so frames are resized one
+            # at a time, straight into the batch
+            frames = tensor.numpy()
+            if out is None:
+                out = torch.empty(
+                    tensor.size(0), 1, self.m, self.n, dtype=tensor.dtype
+                )
+            out_frames = out.numpy()
+            for i in range(tensor.size(0)):
+                self._resize(frames[i, 0], out_frames[i, 0])
+            return out
+        else:
+            raise ValueError(
+                "cant resize a rank"
+                + str(tensor.dim())
+                + " tensor to {}x{}".format(self.n, self.m)
+            )
+
     def preprocess_gpu(self, tensor):
         if tensor.dim() == 4:
-            return F.interpolate(tensor, (self.n, self.m), mode="area")
+            return F.interpolate(tensor, (self.m, self.n), mode="area")
         else:
             raise ValueError(
                 "cant resize a rank"
@@ -129,6 +212,10 @@ class ResizeToNxM(SimpleOperation):
 
 
 class Divide(SimpleOperation):
+    batchable = True
+    writes_out = True
+    elementwise = True
+
     def __init__(self, input_field, output_field, n):
         super().__init__(input_field, output_field)
         self.n = n
@@ -149,19 +236,29 @@ class Divide(SimpleOperation):
         else:
             return old_dtype
 
-    def preprocess_cpu(self, tensor):
-        return tensor * (1.0 / self.n)
+    def preprocess_cpu(self, tensor, out=None):
+        return torch.mul(tensor, 1.0 / self.n, out=out)
 
     def preprocess_gpu(self, tensor):
         return tensor * (1.0 / self.n)
 
 
 class FrameStackCPU(SimpleOperation):
+    """Stacks the last nb_frame frames on the channel dimension, oldest
+    first. Frames are kept twice in a ring buffer of 2 * nb_frame frames, so
+    the stack is a view of it and only the newest frame is copied each step.
+    The returned stack is overwritten by later steps.
+    """
+
     def __init__(self, input_field, output_field, nb_frame):
         super().__init__(input_field, output_field)
         self.nb_frame = nb_frame
         self.frames = None
         self.obs_space = None
+        # where the next frame is written, over the oldest one
+        self.frame_ind = 0
+        self._slots = None
+        self._stacks = None
 
     def update_shape(self, old_shape):
         if self.obs_space is None:
@@ -173,45 +270,97 @@ class FrameStackCPU(SimpleOperation):
         return old_dtype
 
     def preprocess_cpu(self, tensor):
-        self.frames.append(tensor)
-        if tensor.dim() == 3:
-            if len(self.frames) == self.nb_frame:
-                return torch.cat(list(self.frames))
-        else:
+        if tensor.dim() != 3:
             raise NotImplementedError(
                 f"Dimensionality not supported: {tensor.dim()}"
             )
+        if self.frames is None or self.frames.dtype != tensor.dtype:
+            shape = (2 * self.nb_frame,) + tensor.shape
+            self._alloc(tensor.new_zeros(shape), 0)
+        return self._push(tensor)
 
     def preprocess_gpu(self, tensor):
         raise NotImplementedError(f"GPU preprocessing not supported")
 
     def reset(self):
-        self.frames = deque(
-            [torch.zeros(self.obs_space)] * self.nb_frame, maxlen=self.nb_frame
-        )
+        if self.frames is not None:
+            self.frames.zero_()
+        self.frame_ind = 0
+
+    def _alloc(self, frames, dim):
+        """Set the ring buffer and precompute its views, so a step is only
+        two copies.
+
+        Parameters
+        ----------
+        frames : torch.Tensor
+            Ring buffer of 2 * nb_frame frames.
+        dim : int
+            Frame dimension of frames.
+        """
+        self.frames = frames
+        self.frame_ind = 0
+        self._slots = [
+            (frames.select(dim, ind), frames.select(dim, ind + self.nb_frame))
+            for ind in range(self.nb_frame)
+        ]
+        # stack after writing each slot, frames flattened into channels
+        self._stacks = [
+            frames.narrow(dim, ind + 1, self.nb_frame).flatten(dim, dim + 1)
+            for ind in range(self.nb_frame)
+        ]
+
+    def _push(self, tensor):
+        """Write the newest frame, copied since the input may be overwritten
+        by the next step, and return the stack, a view of the ring buffer.
+        """
+        ind = self.frame_ind
+        for slot in self._slots[ind]:
+            slot.copy_(tensor)
+        self.frame_ind = (ind + 1) % self.nb_frame
+        return self._stacks[ind]
 
 
 class FrameStackGPU(FrameStackCPU):
+    """Stacks frames of a batch of envs, (B, C, H, W) inputs. Envs that
+    start a new episode are reset with reset_envs before their first frame
+    is preprocessed.
+    """
+
     def preprocess_cpu(self, tensor):
         raise NotImplementedError(f"CPU preprocessing not supported")
 
     def preprocess_gpu(self, tensor):
-        if tensor.dim() == 4:
-            if len(self.frames) == self.nb_frame:
-                return torch.cat(list(self.frames), dim=1)
-        else:
+        if tensor.dim() != 4:
             raise NotImplementedError(
                 f"Dimensionality not supported: {tensor.dim()}"
             )
-
-    def reset(self):
-        self.frames = deque(
-            [torch.zeros((1,) + self.obs_space)] * self.nb_frame,
-            maxlen=self.nb_frame,
-        )
+        shape = (tensor.size(0), 2 * self.nb_frame) + tensor.shape[1:]
+        if (
+            self.frames is None
+            or self.frames.shape != shape
+            or self.frames.dtype != tensor.dtype
+            or self.frames.device != tensor.device
+        ):
+            self._alloc(tensor.new_zeros(shape), 1)
+        return self._push(tensor)
+
+    def reset_envs(self, mask):
+        if self.frames is not None:
+            mask = mask.to(self.frames.device).view(-1, 1, 1, 1, 1)
+            self.frames.masked_fill_(mask, 0)
+
+    def to(self, device):
+        if self.frames is not None:
+            frame_ind = self.frame_ind
+            self._alloc(self.frames.to(device), 1)
+            self.frame_ind = frame_ind
+        return self
 
 
 class FlattenSpace(SimpleOperation):
+    batchable = True
+
     def update_shape(self, old_shape):
         return (reduce(lambda prev, cur: prev * cur, old_shape),)
 
@@ -221,11 +370,16 @@ class FlattenSpace(SimpleOperation):
     def preprocess_cpu(self, tensor):
         return tensor.view(-1)
 
+    def preprocess_cpu_batch(self, tensor):
+        return tensor.view(tensor.size(0), -1)
+
     def preprocess_gpu(self, tensor):
         return tensor.view(-1)
 
 
 class FromNumpy(SimpleOperation):
+    batchable = True
+
     def update_shape(self, old_shape):
         return old_shape
 
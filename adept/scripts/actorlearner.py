@@ -84,6 +84,7 @@ Logging Options:
     --logdir <path>            Path to logging directory [default: /tmp/adept_logs/]
     --epoch-len <int>          Save a model every <int> frames [default: 1e6]
     --summary-freq <int>       Tensorboard summary frequency [default: 10]
+    --record-exp <path>        Record worker rollouts to a directory [default: None]
 
 Troubleshooting Options:
     --profile                 Profile this script
@@ -128,6 +129,7 @@ def parse_args():
     args.seed = int(args.seed)
     args.nb_step = int(float(args.nb_step))
     args.tag = parse_none(args.tag)
+    args.record_exp = parse_none(args.record_exp)
     args.summary_freq = int(args.summary_freq)
     args.lr = float(args.lr)
     args.epoch_len = int(float(args.epoch_len))
@@ -74,6 +74,7 @@ Logging Options:
     --epoch-len <int>       Save a model every <int> frames [default: 1e6]
     --nb-eval-env <int>     Evaluate agent in a separate thread [default: 0]
     --summary-freq <int>    Tensorboard summary frequency [default: 10]
+    --record-exp <path>     Record rollouts to a directory [default: None]
 
 Troubleshooting Options:
     --profile               Profile this script
@@ -109,6 +110,7 @@ def parse_args():
     args.seed = int(args.seed)
     args.nb_step = int(float(args.nb_step))
     args.tag = parse_none(args.tag)
+    args.record_exp = parse_none(args.record_exp)
     args.nb_eval_env = int(args.nb_eval_env)
     args.summary_freq = int(args.summary_freq)
     args.lr = float(args.lr)
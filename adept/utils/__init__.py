@@ -13,3 +13,5 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from .util import listd_to_dlist, dlist_to_listd, dtensor_to_dev
+from .util import DeviceTransfer, pin_memory_, unpin_memory_
+from .util import parse_cores, available_cores, set_cpu_affinity, limit_threads
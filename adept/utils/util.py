@@ -14,10 +14,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import json
 import heapq
+import os
 from collections import OrderedDict
 
 import numpy as np
 import torch
+from torch import distributed as dist
 
 
 def listd_to_dlist(list_of_dicts):
@@ -72,6 +74,183 @@ def dtensor_to_dev(d_tensor, device):
     return {k: v.to(device) for k, v in d_tensor.items()}
 
 
+class DeviceTransfer:
+    """
+    Moves dictionaries of tensors to a device. On CUDA devices, copies are
+    issued with ``non_blocking`` on a side stream so copies out of pinned
+    memory run alongside work already queued on the current stream. Work
+    queued on the current stream afterwards waits for the copy. Source tensors
+    must not be modified until that work has run.
+
+    On CPU this is ``dtensor_to_dev``, which doesn't copy.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.stream = None
+        if device.type == "cuda":
+            self.stream = torch.cuda.Stream(device)
+
+    def __call__(self, d_tensor):
+        """
+        :param d_tensor: Dict[str, Tensor]
+        :return: Dict[str, Tensor] on desired device.
+        """
+        if self.stream is None:
+            return dtensor_to_dev(d_tensor, self.device)
+
+        with torch.cuda.stream(self.stream):
+            d_dev = {
+                k: v.to(self.device, non_blocking=True)
+                for k, v in d_tensor.items()
+            }
+        current_stream = torch.cuda.current_stream(self.device)
+        current_stream.wait_stream(self.stream)
+        for v in d_dev.values():
+            # memory was allocated on the side stream
+            v.record_stream(current_stream)
+        return d_dev
+
+
+def pin_memory_(tensor):
+    """
+    Page-lock a CPU tensor in place. Unlike ``Tensor.pin_memory`` the storage
+    is kept, so this works on shared memory. No-op without CUDA.
+
+    :param tensor: Tensor
+    :return: Tensor
+    """
+    if torch.cuda.is_available() and tensor.numel() > 0:
+        if not tensor.is_pinned():
+            torch.cuda.check_error(
+                torch.cuda.cudart().cudaHostRegister(
+                    tensor.data_ptr(), tensor.numel() * tensor.element_size(), 0
+                )
+            )
+    return tensor
+
+
+def unpin_memory_(tensor):
+    """
+    Undo ``pin_memory_``.
+
+    :param tensor: Tensor
+    :return: Tensor
+    """
+    if torch.cuda.is_available() and tensor.numel() > 0:
+        if tensor.is_pinned():
+            torch.cuda.check_error(
+                torch.cuda.cudart().cudaHostUnregister(tensor.data_ptr())
+            )
+    return tensor
+
+
+class CoalescedBroadcast:
+    """
+    Handle of a broadcast_coalesced bucket. wait() copies the received
+    buffer back into the bucket's tensors.
+    """
+
+    def __init__(self, handle, tensors, flat):
+        self.handle = handle
+        self.tensors = tensors
+        self.flat = flat
+
+    def wait(self):
+        self.handle.wait()
+        numels = [t.numel() for t in self.tensors]
+        with torch.no_grad():
+            for t, view in zip(self.tensors, self.flat.split(numels)):
+                t.copy_(view.view_as(t))
+
+
+def broadcast_coalesced(tensors, src, group=None, async_op=False):
+    """
+    Broadcast tensors with one collective per (dtype, device) bucket. Each
+    bucket is flattened into a contiguous buffer, broadcast, and copied back.
+
+    :param tensors: Iterable[Tensor], in the same order on every rank
+    :param src: int, source rank
+    :param group: optional process group, the default group if None
+    :param async_op: bool, return before the broadcasts finish
+    :return: List[CoalescedBroadcast], wait() on each before reading the
+        tensors if async_op
+    """
+    buckets = OrderedDict()
+    for t in tensors:
+        buckets.setdefault((t.dtype, t.device), []).append(t)
+
+    handles = []
+    for bucket in buckets.values():
+        flat = torch.cat([t.detach().reshape(-1) for t in bucket])
+        if group is None:
+            h = dist.broadcast(flat, src, async_op=True)
+        else:
+            h = dist.broadcast(flat, src, group, async_op=True)
+        handles.append(CoalescedBroadcast(h, bucket, flat))
+
+    if not async_op:
+        for h in handles:
+            h.wait()
+    return handles
+
+
+def parse_cores(spec):
+    """
+    Parse a core list like ``"0-3,8"``.
+
+    :param spec: str, comma separated core ids or inclusive ranges
+    :return: List[int], sorted core ids
+    """
+    cores = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if "-" in part:
+            start, stop = part.split("-")
+            cores.update(range(int(start), int(stop) + 1))
+        elif part:
+            cores.add(int(part))
+    return sorted(cores)
+
+
+def available_cores():
+    """
+    :return: List[int], cores this process may run on
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def set_cpu_affinity(cores):
+    """
+    Restrict the current process to cores. No-op where the OS doesn't support
+    setting affinity.
+
+    :param cores: List[int]
+    :return: bool, whether affinity was set
+    """
+    if not hasattr(os, "sched_setaffinity"):
+        return False
+    os.sched_setaffinity(0, cores)
+    return True
+
+
+def limit_threads(nb_thread):
+    """
+    Limit the intra-op threads torch and OpenCV use in this process.
+
+    :param nb_thread: int
+    """
+    torch.set_num_threads(nb_thread)
+    try:
+        import cv2
+
+        cv2.setNumThreads(nb_thread)
+    except ImportError:
+        pass
+
+
 def json_to_dict(file_path):
     """Read JSON config."""
     json_object = json.load(open(file_path, "r"))
@@ -94,7 +273,8 @@ _torch_to_numpy_dtype = {v: k for k, v in _numpy_to_torch_dtype.items()}
 def numpy_to_torch_dtype(dtype):
 
     # check if dtype is weird and convert to familiar format
-    if type(dtype) == np.dtype:
+    # (np.dtype instances are subclasses such as dtype[float32] on numpy 1.20+)
+    if isinstance(dtype, np.dtype):
         dtype = dtype.type
 
     if dtype not in _numpy_to_torch_dtype:
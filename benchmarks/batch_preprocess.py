@@ -0,0 +1,137 @@
+# Copyright (C) 2018 Heron Systems, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Atari CPU preprocessing run per env against BatchCPUPreprocessor, on its own
+and inside the env managers.
+
+Usage:
+    batch_preprocess [options]
+    batch_preprocess (-h | --help)
+
+Options:
+    --nb-envs <str>             Comma separated env counts [default: 16,64]
+    --nb-step <int>             Timed steps per run [default: 100]
+    --nb-warmup <int>           Untimed steps per run [default: 10]
+
+Run from the repository root:
+    python -m benchmarks.batch_preprocess
+"""
+
+import time
+
+import numpy as np
+import torch
+
+from adept.manager import SubProcEnvManager, ThreadedEnvManager
+from adept.preprocess.base import BatchCPUPreprocessor
+from adept.utils.util import DotDict
+from benchmarks.manager_transport import time_steps
+from benchmarks.synthetic_env import (
+    ATARI_FRAME_SHAPE,
+    SyntheticAtariEnv,
+    make_env_fns,
+)
+
+
+def time_preprocessing(nb_env, batch, nb_step, nb_warmup):
+    """
+    :return: np.ndarray, seconds taken to preprocess every env, per step
+    """
+    preprocessors = [
+        SyntheticAtariEnv(seed).cpu_preprocessor for seed in range(nb_env)
+    ]
+    shape = preprocessors[0].observation_space["Box"]
+    out = {"Box": torch.zeros(nb_env, *shape, dtype=torch.uint8)}
+    batch_preprocessor = BatchCPUPreprocessor(preprocessors) if batch else None
+    frames = np.random.randint(
+        0, 256, (nb_env, *ATARI_FRAME_SHAPE), dtype=np.uint8
+    )
+    step_times = []
+    for step in range(nb_warmup + nb_step):
+        start = time.perf_counter()
+        obs = [p({"Box": frame}) for p, frame in zip(preprocessors, frames)]
+        if batch_preprocessor is not None:
+            batch_preprocessor(obs, out)
+        else:
+            for env_ind, ob in enumerate(obs):
+                out["Box"][env_ind].copy_(ob["Box"])
+        if step >= nb_warmup:
+            step_times.append(time.perf_counter() - start)
+    return np.array(step_times)
+
+
+def print_row(row, name, nb_env, step_times):
+    print(
+        row.format(
+            name,
+            nb_env,
+            "{:.3f}".format(step_times.mean() * 1000),
+            "{:.3f}".format(np.percentile(step_times, 90) * 1000),
+            "{:.0f}".format(nb_env / step_times.mean()),
+        )
+    )
+
+
+def main(args):
+    row = "{:>26} {:>7} {:>10} {:>10} {:>12}"
+    print(row.format("run", "nb_env", "mean ms", "p90 ms", "env steps/s"))
+    for nb_env in args.nb_envs:
+        for batch in [False, True]:
+            step_times = time_preprocessing(
+                nb_env, batch, args.nb_step, args.nb_warmup
+            )
+            name = "preprocess batched" if batch else "preprocess per env"
+            print_row(row, name, nb_env, step_times)
+        managers = [
+            ("ThreadedEnvManager", ThreadedEnvManager, {"nb_thread": 1}),
+            (
+                "SubProcEnvManager",
+                SubProcEnvManager,
+                {"envs_per_worker": nb_env},
+            ),
+        ]
+        for name, manager_cls, kwargs in managers:
+            for batch in [False, True]:
+                manager = manager_cls(
+                    make_env_fns(nb_env),
+                    "SyntheticAtari",
+                    batch_preprocess=batch,
+                    **kwargs
+                )
+                try:
+                    step_times = time_steps(
+                        manager, args.nb_step, args.nb_warmup
+                    )
+                finally:
+                    manager.close()
+                suffix = " batched" if batch else ""
+                print_row(row, name + suffix, nb_env, step_times)
+
+
+def parse_args():
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    args = {k.strip("--").replace("-", "_"): v for k, v in args.items()}
+    del args["h"]
+    del args["help"]
+    args["nb_envs"] = [int(x) for x in args["nb_envs"].split(",")]
+    args["nb_step"] = int(args["nb_step"])
+    args["nb_warmup"] = int(args["nb_warmup"])
+    return DotDict(args)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,127 @@
+# Copyright (C) 2018 Heron Systems, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Frame stacking with a deque and torch.cat each step against the ring buffer
+frame stackers.
+
+Usage:
+    frame_stack [options]
+    frame_stack (-h | --help)
+
+Options:
+    --nb-frame <int>            Frames stacked [default: 4]
+    --batch-sizes <str>         Comma separated batch sizes [default: 16,64]
+    --nb-step <int>             Timed steps [default: 1000]
+    --gpu-id <int>              CUDA device, -1 for CPU [default: 0]
+
+Run from the repository root:
+    python -m benchmarks.frame_stack
+"""
+
+import time
+from collections import deque
+
+import torch
+
+from adept.preprocess.ops import FrameStackCPU, FrameStackGPU
+from adept.utils.util import DotDict
+
+FRAME_SHAPE = (1, 84, 84)
+
+
+class DequeFrameStack:
+    """Copies every frame each step, like the frame stackers used to."""
+
+    def __init__(self, nb_frame, dim):
+        self.frames = deque(maxlen=nb_frame)
+        self.dim = dim
+
+    def __call__(self, tensor):
+        if not self.frames:
+            self.frames.extend([torch.zeros_like(tensor)] * self.frames.maxlen)
+        self.frames.append(tensor)
+        return torch.cat(list(self.frames), dim=self.dim)
+
+
+def time_stacker(stack, frames, nb_step, device):
+    """
+    :return: float, microseconds per step
+    """
+    for frame in frames:
+        stack(frame)
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    start = time.perf_counter()
+    for step in range(nb_step):
+        stack(frames[step % len(frames)])
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    return (time.perf_counter() - start) / nb_step * 1e6
+
+
+def main(args):
+    row = "{:>30} {:>10}"
+    print(row.format("stacker", "usec"))
+    cpu = torch.device("cpu")
+    frames = [
+        torch.randint(0, 256, FRAME_SHAPE, dtype=torch.uint8) for _ in range(8)
+    ]
+    ring = FrameStackCPU("Box", "Box", args.nb_frame)
+    ring.update_shape(FRAME_SHAPE)
+    runs = [
+        ("deque + cat", DequeFrameStack(args.nb_frame, 0)),
+        ("FrameStackCPU", ring.preprocess_cpu),
+    ]
+    for name, stack in runs:
+        usec = time_stacker(stack, frames, args.nb_step, cpu)
+        print(row.format(name, "{:.2f}".format(usec)))
+
+    if args.gpu_id >= 0 and torch.cuda.is_available():
+        device = torch.device("cuda:{}".format(args.gpu_id))
+    else:
+        device = cpu
+    for batch_size in args.batch_sizes:
+        frames = [
+            torch.rand(batch_size, *FRAME_SHAPE, device=device)
+            for _ in range(8)
+        ]
+        ring = FrameStackGPU("Box", "Box", args.nb_frame)
+        ring.update_shape(FRAME_SHAPE)
+        runs = [
+            ("deque + cat", DequeFrameStack(args.nb_frame, 1)),
+            ("FrameStackGPU", ring.preprocess_gpu),
+        ]
+        for name, stack in runs:
+            usec = time_stacker(stack, frames, args.nb_step, device)
+            name = "{} B={} {}".format(name, batch_size, device.type)
+            print(row.format(name, "{:.2f}".format(usec)))
+
+
+def parse_args():
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    args = {k.strip("--").replace("-", "_"): v for k, v in args.items()}
+    del args["h"]
+    del args["help"]
+    args["nb_frame"] = int(args["nb_frame"])
+    args["batch_sizes"] = [int(x) for x in args["batch_sizes"].split(",")]
+    args["nb_step"] = int(args["nb_step"])
+    args["gpu_id"] = int(args["gpu_id"])
+    return DotDict(args)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,112 @@
+# Copyright (C) 2018 Heron Systems, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+GPU preprocessing of the Atari chain, CastToFloat then Divide(255), with the
+ops dispatched one by one against the fused and traced ops.
+
+Usage:
+    gpu_preprocess_fusion [options]
+    gpu_preprocess_fusion (-h | --help)
+
+Options:
+    --batch-sizes <str>         Comma separated batch sizes [default: 32,256]
+    --nb-frame <int>            Frames stacked [default: 4]
+    --nb-step <int>             Timed steps [default: 1000]
+    --gpu-id <int>              CUDA device, -1 for CPU [default: 0]
+
+Run from the repository root:
+    python -m benchmarks.gpu_preprocess_fusion
+"""
+
+import time
+
+import torch
+
+from adept.preprocess.base import GPUPreprocessor
+from adept.preprocess.ops import CastToFloat, Divide
+from adept.utils.util import DotDict
+
+FRAME_SHAPE = (84, 84)
+
+
+def make_preprocessor(nb_frame, fuse):
+    return GPUPreprocessor(
+        [CastToFloat("Box", "Box"), Divide("Box", "Box", 255)],
+        {"Box": (nb_frame,) + FRAME_SHAPE},
+        {"Box": torch.uint8},
+        fuse=fuse,
+    )
+
+
+def time_preprocessor(preprocessor, obs, nb_step, device):
+    """
+    :return: float, microseconds per step
+    """
+    with torch.no_grad():
+        # warm up, the fused ops are traced and optimized on the first calls
+        for _ in range(10):
+            preprocessor(obs)
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        start = time.perf_counter()
+        for _ in range(nb_step):
+            preprocessor(obs)
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+    return (time.perf_counter() - start) / nb_step * 1e6
+
+
+def main(args):
+    if args.gpu_id >= 0 and torch.cuda.is_available():
+        device = torch.device("cuda:{}".format(args.gpu_id))
+    else:
+        device = torch.device("cpu")
+    row = "{:>24} {:>10}"
+    print(row.format("preprocessor", "usec"))
+    for batch_size in args.batch_sizes:
+        obs = {
+            "Box": torch.randint(
+                0,
+                256,
+                (batch_size, args.nb_frame) + FRAME_SHAPE,
+                dtype=torch.uint8,
+                device=device,
+            )
+        }
+        for fuse in [False, True]:
+            preprocessor = make_preprocessor(args.nb_frame, fuse)
+            usec = time_preprocessor(preprocessor, obs, args.nb_step, device)
+            name = "{} B={} {}".format(
+                "fused" if fuse else "unfused", batch_size, device.type
+            )
+            print(row.format(name, "{:.2f}".format(usec)))
+
+
+def parse_args():
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    args = {k.strip("--").replace("-", "_"): v for k, v in args.items()}
+    del args["h"]
+    del args["help"]
+    args["batch_sizes"] = [int(x) for x in args["batch_sizes"].split(",")]
+    args["nb_frame"] = int(args["nb_frame"])
+    args["nb_step"] = int(args["nb_step"])
+    args["gpu_id"] = int(args["gpu_id"])
+    return DotDict(args)
+
+
+if __name__ == "__main__":
+    main(parse_args())
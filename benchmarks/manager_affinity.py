@@ -0,0 +1,108 @@
+# Copyright (C) 2018 Heron Systems, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+SubProcEnvManager throughput with and without per-worker thread limits and
+core pinning.
+
+Usage:
+    manager_affinity [options]
+    manager_affinity (-h | --help)
+
+Options:
+    --nb-envs <str>             Comma separated env counts [default: 16,64]
+    --learner-cores <str>       Cores reserved for this process when pinning
+                                [default: 0]
+    --nb-step <int>             Timed steps per run [default: 200]
+    --nb-warmup <int>           Untimed steps per run [default: 20]
+    --step-time <float>         Seconds of busy work per env step [default: 0.0]
+
+Configurations:
+    default     workers keep the torch and OpenCV thread defaults
+    1-thread    workers use one torch and OpenCV thread
+    pinned      one thread per worker, workers pinned round-robin to the
+                cores not reserved for the learner
+
+Run from the repository root:
+    python -m benchmarks.manager_affinity
+"""
+
+import numpy as np
+
+from adept.manager import SubProcEnvManager
+from adept.utils.util import DotDict, available_cores
+from benchmarks.manager_transport import time_steps
+from benchmarks.synthetic_env import make_env_fns
+
+
+def configs(args):
+    """
+    :return: List[Tuple[str, Dict]], name and manager kwargs of each run
+    """
+    runs = [
+        ("default", {"worker_nb_thread": None}),
+        ("1-thread", {"worker_nb_thread": 1}),
+    ]
+    if len(available_cores()) > 1:
+        runs.append(
+            (
+                "pinned",
+                {"worker_nb_thread": 1, "learner_cores": args.learner_cores},
+            )
+        )
+    else:
+        print("Single core, skipping pinned runs")
+    return runs
+
+
+def main(args):
+    runs = configs(args)
+    row = "{:>9} {:>7} {:>10} {:>10} {:>12}"
+    print(row.format("config", "nb_env", "mean ms", "p90 ms", "env steps/s"))
+    for nb_env in args.nb_envs:
+        for name, kwargs in runs:
+            manager = SubProcEnvManager(
+                make_env_fns(nb_env, args.step_time), "SyntheticAtari", **kwargs
+            )
+            try:
+                step_times = time_steps(manager, args.nb_step, args.nb_warmup)
+            finally:
+                manager.close()
+            print(
+                row.format(
+                    name,
+                    nb_env,
+                    "{:.3f}".format(step_times.mean() * 1000),
+                    "{:.3f}".format(np.percentile(step_times, 90) * 1000),
+                    "{:.0f}".format(nb_env / step_times.mean()),
+                )
+            )
+
+
+def parse_args():
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    args = {k.strip("--").replace("-", "_"): v for k, v in args.items()}
+    del args["h"]
+    del args["help"]
+    args["nb_envs"] = [int(x) for x in args["nb_envs"].split(",")]
+    args["nb_step"] = int(args["nb_step"])
+    args["nb_warmup"] = int(args["nb_warmup"])
+    args["step_time"] = float(args["step_time"])
+    return DotDict(args)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,97 @@
+# Copyright (C) 2018 Heron Systems, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Step latency of the Simple, SubProc and Threaded env managers.
+
+Usage:
+    manager_compare [options]
+    manager_compare (-h | --help)
+
+Options:
+    --nb-envs <str>             Comma separated env counts [default: 8,32]
+    --managers <str>            Managers to compare
+                                [default: SimpleEnvManager,SubProcEnvManager,ThreadedEnvManager]
+    --nb-step <int>             Timed steps per run [default: 200]
+    --nb-warmup <int>           Untimed steps per run [default: 20]
+    --step-time <float>         Seconds per env step [default: 0.0]
+    --release-gil               Sleep for step-time instead of busy work
+    --nb-thread <int>           ThreadedEnvManager threads, defaults to one
+                                per env up to the number of CPUs
+
+Run from the repository root:
+    python -m benchmarks.manager_compare
+    python -m benchmarks.manager_compare --step-time 0.001 --release-gil \
+        --nb-thread 8
+"""
+
+import numpy as np
+
+from adept.manager import MANAGER_REG, ThreadedEnvManager
+from adept.utils.util import DotDict
+from benchmarks.manager_transport import time_steps
+from benchmarks.synthetic_env import make_env_fns
+
+
+def main(args):
+    managers = {m.__name__: m for m in MANAGER_REG}
+    row = "{:>18} {:>7} {:>10} {:>10} {:>12}"
+    print(row.format("manager", "nb_env", "mean ms", "p90 ms", "env steps/s"))
+    for nb_env in args.nb_envs:
+        for name in args.managers:
+            manager_cls = managers[name]
+            kwargs = {}
+            if manager_cls is ThreadedEnvManager:
+                kwargs["nb_thread"] = args.nb_thread
+            manager = manager_cls(
+                make_env_fns(
+                    nb_env, args.step_time, release_gil=args.release_gil
+                ),
+                "SyntheticAtari",
+                **kwargs
+            )
+            try:
+                step_times = time_steps(manager, args.nb_step, args.nb_warmup)
+            finally:
+                manager.close()
+            print(
+                row.format(
+                    name,
+                    nb_env,
+                    "{:.3f}".format(step_times.mean() * 1000),
+                    "{:.3f}".format(np.percentile(step_times, 90) * 1000),
+                    "{:.0f}".format(nb_env / step_times.mean()),
+                )
+            )
+
+
+def parse_args():
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    args = {k.strip("--").replace("-", "_"): v for k, v in args.items()}
+    del args["h"]
+    del args["help"]
+    args["nb_envs"] = [int(x) for x in args["nb_envs"].split(",")]
+    args["managers"] = args["managers"].split(",")
+    args["nb_step"] = int(args["nb_step"])
+    args["nb_warmup"] = int(args["nb_warmup"])
+    args["step_time"] = float(args["step_time"])
+    if args["nb_thread"] is not None:
+        args["nb_thread"] = int(args["nb_thread"])
+    return DotDict(args)
+
+
+if __name__ == "__main__":
+    main(parse_args())
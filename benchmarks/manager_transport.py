@@ -0,0 +1,106 @@
+# Copyright (C) 2018 Heron Systems, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Step latency of SubProcEnvManager for each worker transport.
+
+Usage:
+    manager_transport [options]
+    manager_transport (-h | --help)
+
+Options:
+    --nb-envs <str>             Comma separated env counts [default: 8,32,128]
+    --transports <str>          Transports to compare [default: ipc,pipe,tcp]
+    --envs-per-worker <int>     Envs stepped by each worker [default: 1]
+    --nb-step <int>             Timed steps per run [default: 200]
+    --nb-warmup <int>           Untimed steps per run [default: 20]
+    --step-time <float>         Seconds of busy work per env step [default: 0.0]
+
+Run from the repository root:
+    python -m benchmarks.manager_transport
+"""
+
+import time
+
+import numpy as np
+import torch
+
+from adept.manager import SubProcEnvManager
+from adept.utils.util import DotDict
+from benchmarks.synthetic_env import make_env_fns
+
+
+def time_steps(manager, nb_step, nb_warmup):
+    """
+    :param manager: EnvManagerModule
+    :param nb_step: int, number of timed steps
+    :param nb_warmup: int, number of untimed steps
+    :return: np.ndarray, seconds taken by each timed step
+    """
+    actions = {"Discrete": torch.zeros(manager.nb_env, dtype=torch.long)}
+    manager.reset()
+    for _ in range(nb_warmup):
+        manager.step(actions)
+    step_times = []
+    for _ in range(nb_step):
+        start = time.perf_counter()
+        manager.step(actions)
+        step_times.append(time.perf_counter() - start)
+    return np.array(step_times)
+
+
+def main(args):
+    row = "{:>9} {:>7} {:>10} {:>10} {:>12}"
+    print(row.format("transport", "nb_env", "mean ms", "p90 ms", "env steps/s"))
+    for nb_env in args.nb_envs:
+        for transport in args.transports:
+            manager = SubProcEnvManager(
+                make_env_fns(nb_env, args.step_time),
+                "SyntheticAtari",
+                args.envs_per_worker,
+                transport=transport,
+            )
+            try:
+                step_times = time_steps(manager, args.nb_step, args.nb_warmup)
+            finally:
+                manager.close()
+            print(
+                row.format(
+                    transport,
+                    nb_env,
+                    "{:.3f}".format(step_times.mean() * 1000),
+                    "{:.3f}".format(np.percentile(step_times, 90) * 1000),
+                    "{:.0f}".format(nb_env / step_times.mean()),
+                )
+            )
+
+
+def parse_args():
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    args = {k.strip("--").replace("-", "_"): v for k, v in args.items()}
+    del args["h"]
+    del args["help"]
+    args["nb_envs"] = [int(x) for x in args["nb_envs"].split(",")]
+    args["transports"] = args["transports"].split(",")
+    args["envs_per_worker"] = int(args["envs_per_worker"])
+    args["nb_step"] = int(args["nb_step"])
+    args["nb_warmup"] = int(args["nb_warmup"])
+    args["step_time"] = float(args["step_time"])
+    return DotDict(args)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,142 @@
+# Copyright (C) 2018 Heron Systems, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Time and allocations of one Atari CPU preprocessing pass, with ops
+allocating their outputs against ops writing into preallocated outputs.
+
+Allocations are the peak bytes traced by tracemalloc during the pass.
+numpy reports its array buffers to tracemalloc, so this includes the
+images OpenCV returns, which torch.from_numpy then wraps.
+
+Usage:
+    preprocess_alloc [options]
+    preprocess_alloc (-h | --help)
+
+Options:
+    --nb-env <int>              Envs in the batched pass [default: 16]
+    --nb-step <int>             Timed passes [default: 1000]
+
+Run from the repository root:
+    python -m benchmarks.preprocess_alloc
+"""
+
+import time
+import tracemalloc
+
+import numpy as np
+import torch
+
+from adept.preprocess.base import BatchCPUPreprocessor, CPUPreprocessor
+from adept.preprocess.ops import (
+    FrameStackCPU,
+    FromNumpy,
+    GrayScaleAndMoveChannel,
+    ResizeToNxM,
+)
+from adept.utils.util import DotDict
+from benchmarks.synthetic_env import ATARI_FRAME_SHAPE
+
+
+def atari_preprocessor(frame_stack):
+    ops = [
+        FromNumpy("Box", "Box"),
+        GrayScaleAndMoveChannel("Box", "Box"),
+        ResizeToNxM(84, 84, "Box", "Box"),
+    ]
+    if frame_stack:
+        ops.append(FrameStackCPU("Box", "Box", 4))
+    return CPUPreprocessor(ops, {"Box": ATARI_FRAME_SHAPE}, {"Box": np.uint8})
+
+
+def allocating_pass(preprocessor):
+    """The same ops as preprocessor, each allocating its output."""
+
+    def preprocess(obs):
+        for op in preprocessor.ops:
+            obs[op.output_field] = op.preprocess_cpu(obs[op.input_field])
+        return obs
+
+    return preprocess
+
+
+def batched_pass(nb_env, frame_stack):
+    preprocessors = [atari_preprocessor(frame_stack) for _ in range(nb_env)]
+    batch_preprocessor = BatchCPUPreprocessor(preprocessors)
+    shape = preprocessors[0].observation_space["Box"]
+    out = {"Box": torch.empty((nb_env,) + shape, dtype=torch.uint8)}
+
+    def preprocess(obs):
+        return batch_preprocessor([obs] * nb_env, out)
+
+    return preprocess
+
+
+def measure(preprocess, frame, nb_step):
+    """
+    :return: Tuple[float, int], microseconds per pass and peak bytes
+        allocated per pass
+    """
+    # warm up, buffers allocated on the first call aren't counted
+    for _ in range(10):
+        preprocess({"Box": frame})
+
+    start = time.perf_counter()
+    for _ in range(nb_step):
+        preprocess({"Box": frame})
+    usec = (time.perf_counter() - start) / nb_step * 1e6
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    current, _ = tracemalloc.get_traced_memory()
+    preprocess({"Box": frame})
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return usec, peak - current
+
+
+def main(args):
+    frame = np.random.randint(0, 256, ATARI_FRAME_SHAPE, dtype=np.uint8)
+    row = "{:>32} {:>10} {:>14}"
+    print(row.format("pass", "usec", "alloc bytes"))
+    for frame_stack in [False, True]:
+        suffix = " + frame stack" if frame_stack else ""
+        preprocessor = atari_preprocessor(frame_stack)
+        runs = [
+            ("allocating" + suffix, allocating_pass(preprocessor)),
+            ("out buffers" + suffix, preprocessor),
+            (
+                "batched x{}{}".format(args.nb_env, suffix),
+                batched_pass(args.nb_env, frame_stack),
+            ),
+        ]
+        for name, preprocess in runs:
+            usec, nb_byte = measure(preprocess, frame, args.nb_step)
+            print(row.format(name, "{:.1f}".format(usec), nb_byte))
+
+
+def parse_args():
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    args = {k.strip("--").replace("-", "_"): v for k, v in args.items()}
+    del args["h"]
+    del args["help"]
+    args["nb_env"] = int(args["nb_env"])
+    args["nb_step"] = int(args["nb_step"])
+    return DotDict(args)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,120 @@
+# Copyright (C) 2018 Heron Systems, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Insert and sample throughput of ExperienceReplay.
+
+Usage:
+    replay [options]
+    replay (-h | --help)
+
+Options:
+    --replay-size <int>         Transitions stored [default: 1000000]
+    --nb-env <int>              Envs written per step [default: 32]
+    --obs-shape <str>           Comma separated observation shape, 1,84,84
+                                for Atari frames (about 7GB at 1M)
+                                [default: 4]
+    --batch-sizes <str>         Comma separated sample sizes [default: 32,512]
+    --nb-sample <int>           Timed samples [default: 1000]
+
+Run from the repository root:
+    python -m benchmarks.replay
+"""
+
+import time
+
+import torch
+
+from adept.exp import ExperienceReplay, ExpSpecBuilder
+from adept.utils.util import DotDict
+
+
+def make_spec_builder(nb_env, obs_shape):
+    def build_fn(exp_len):
+        return {
+            "Box": (exp_len + 1, nb_env, *obs_shape),
+            "Discrete": (exp_len, nb_env),
+            "rewards": (exp_len, nb_env),
+            "terminals": (exp_len, nb_env),
+        }
+
+    return ExpSpecBuilder(
+        obs_keys={"Box": obs_shape},
+        act_keys={"Discrete": (6,)},
+        internal_keys={},
+        key_types={
+            "Box": torch.uint8,
+            "Discrete": "long",
+            "rewards": "float",
+            "terminals": "float",
+        },
+        exp_keys=["Box", "Discrete", "rewards", "terminals"],
+        build_fn=build_fn,
+    )
+
+
+def main(args):
+    spec_builder = make_spec_builder(args.nb_env, args.obs_shape)
+    replay = ExperienceReplay(spec_builder, args.replay_size, 1, 1)
+    obs = {
+        "Box": torch.randint(
+            0, 256, (args.nb_env, *args.obs_shape), dtype=torch.uint8
+        )
+    }
+    actions = {"Discrete": torch.zeros(args.nb_env).long()}
+    rewards = torch.zeros(args.nb_env)
+    terminals = torch.zeros(args.nb_env)
+    infos = [{}] * args.nb_env
+
+    # fill the buffer once, timing the inserts
+    start = time.perf_counter()
+    for _ in range(replay.capacity):
+        replay.write_actor(actions)
+        replay.write_env(obs, rewards, terminals, infos)
+    insert_s = time.perf_counter() - start
+    nb_insert = replay.capacity * args.nb_env
+
+    row = "{:>24} {:>16}"
+    print(row.format("op", "transitions/s"))
+    print(row.format("insert", "{:.0f}".format(nb_insert / insert_s)))
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        for _ in range(args.nb_sample):
+            replay.read_transitions(*replay.sample(batch_size))
+        sample_s = time.perf_counter() - start
+        print(
+            row.format(
+                "sample B={}".format(batch_size),
+                "{:.0f}".format(args.nb_sample * batch_size / sample_s),
+            )
+        )
+
+
+def parse_args():
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    args = {k.strip("--").replace("-", "_"): v for k, v in args.items()}
+    del args["h"]
+    del args["help"]
+    args["replay_size"] = int(args["replay_size"])
+    args["nb_env"] = int(args["nb_env"])
+    args["obs_shape"] = tuple(int(x) for x in args["obs_shape"].split(","))
+    args["batch_sizes"] = [int(x) for x in args["batch_sizes"].split(",")]
+    args["nb_sample"] = int(args["nb_sample"])
+    return DotDict(args)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,132 @@
+# Copyright (C) 2018 Heron Systems, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Observation memory, packed size and read time of a Rollout storing full
+frame stacks against one storing deduplicated frames.
+
+Usage:
+    rollout_dedup [options]
+    rollout_dedup (-h | --help)
+
+Options:
+    --rollout-len <int>         Rollout length [default: 20]
+    --batch-sizes <str>         Comma separated batch sizes [default: 32,256]
+    --nb-frame <int>            Frames stacked [default: 4]
+    --nb-read <int>             Timed reads [default: 20]
+
+Run from the repository root:
+    python -m benchmarks.rollout_dedup
+"""
+
+import time
+
+import torch
+
+from adept.exp import ExpSpecBuilder, Rollout
+from adept.utils.util import DotDict
+
+FRAME_SHAPE = (1, 84, 84)
+
+
+def make_spec_builder(batch_size, nb_frame):
+    obs_shape = (nb_frame * FRAME_SHAPE[0], *FRAME_SHAPE[1:])
+
+    def build_fn(exp_len):
+        return {
+            "Box": (exp_len + 1, batch_size, *obs_shape),
+            "Discrete": (exp_len, batch_size),
+            "rewards": (exp_len, batch_size),
+            "terminals": (exp_len, batch_size),
+        }
+
+    return ExpSpecBuilder(
+        obs_keys={"Box": obs_shape},
+        act_keys={"Discrete": (6,)},
+        internal_keys={},
+        key_types={
+            "Box": "byte",
+            "Discrete": "long",
+            "rewards": "float",
+            "terminals": "float",
+        },
+        exp_keys=["Box", "Discrete", "rewards", "terminals"],
+        build_fn=build_fn,
+    )
+
+
+def fill(rollout, batch_size, nb_frame):
+    stack = torch.zeros(batch_size, nb_frame, *FRAME_SHAPE, dtype=torch.uint8)
+    for _ in range(rollout.rollout_len):
+        frame = torch.randint(0, 256, (batch_size, 1, *FRAME_SHAPE))
+        stack = torch.cat([stack[:, 1:], frame.byte()], dim=1)
+        terminals = (torch.rand(batch_size) < 0.01).float()
+        rollout.write_env(
+            {"Box": stack.flatten(1, 2)},
+            torch.zeros(batch_size),
+            terminals,
+            {},
+        )
+    rollout.write_next_obs({"Box": stack.flatten(1, 2)})
+
+
+def main(args):
+    row = "{:>24} {:>14} {:>14} {:>12}"
+    print(row.format("storage", "obs MB", "packed MB", "read ms"))
+    for batch_size in args.batch_sizes:
+        spec_builder = make_spec_builder(batch_size, args.nb_frame)
+        for dedup_frames in [0, args.nb_frame]:
+            rollout = Rollout(spec_builder, args.rollout_len, dedup_frames)
+            fill(rollout, batch_size, args.nb_frame)
+            obs = rollout["Box"]
+            obs_bytes = obs.numel() * obs.element_size()
+            packed_bytes = sum(
+                t.numel() * t.element_size() for t in rollout.values()
+            )
+
+            rollout.read()
+            start = time.perf_counter()
+            for _ in range(args.nb_read):
+                rollout.read()
+            read_ms = (time.perf_counter() - start) / args.nb_read * 1e3
+
+            name = "{} B={}".format(
+                "dedup" if dedup_frames else "full stacks", batch_size
+            )
+            print(
+                row.format(
+                    name,
+                    "{:.1f}".format(obs_bytes / 2**20),
+                    "{:.1f}".format(packed_bytes / 2**20),
+                    "{:.2f}".format(read_ms),
+                )
+            )
+
+
+def parse_args():
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    args = {k.strip("--").replace("-", "_"): v for k, v in args.items()}
+    del args["h"]
+    del args["help"]
+    args["rollout_len"] = int(args["rollout_len"])
+    args["batch_sizes"] = [int(x) for x in args["batch_sizes"].split(",")]
+    args["nb_frame"] = int(args["nb_frame"])
+    args["nb_read"] = int(args["nb_read"])
+    return DotDict(args)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,128 @@
+# Copyright (C) 2018 Heron Systems, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Environment for benchmarks that looks like an Atari game to the rest of adept
+but needs no emulator or ROMs.
+"""
+
+import time
+
+import numpy as np
+
+from adept.env.base.env_module import EnvModule
+from adept.preprocess.base.preprocessor import CPUPreprocessor, GPUPreprocessor
+from adept.preprocess.ops import (
+    CastToFloat,
+    Divide,
+    FromNumpy,
+    GrayScaleAndMoveChannel,
+    ResizeToNxM,
+)
+
+ATARI_FRAME_SHAPE = (210, 160, 3)
+
+
+class SyntheticAtariEnv(EnvModule):
+    """
+    Returns random (210, 160, 3) frames through the same CPU and GPU
+    preprocessing as AdeptGymEnv. ``step_time`` seconds of busy work per step
+    stand in for the emulator. With ``release_gil`` the env sleeps instead,
+    like an emulator written in C that releases the GIL while stepping.
+    """
+
+    args = {
+        "step_time": 0.0,
+        "episode_len": 1000,
+        "nb_frame": 16,
+        "release_gil": False,
+    }
+    ids = ["SyntheticAtari"]
+
+    def __init__(
+        self,
+        seed,
+        step_time=0.0,
+        episode_len=1000,
+        nb_frame=16,
+        release_gil=False,
+    ):
+        cpu_preprocessor = CPUPreprocessor(
+            [
+                FromNumpy("Box", "Box"),
+                GrayScaleAndMoveChannel("Box", "Box"),
+                ResizeToNxM(84, 84, "Box", "Box"),
+            ],
+            {"Box": ATARI_FRAME_SHAPE},
+            {"Box": np.uint8},
+        )
+        gpu_preprocessor = GPUPreprocessor(
+            [CastToFloat("Box", "Box"), Divide("Box", "Box", 255)],
+            cpu_preprocessor.observation_space,
+            cpu_preprocessor.observation_dtypes,
+        )
+        super(SyntheticAtariEnv, self).__init__(
+            {"Discrete": (6,)}, cpu_preprocessor, gpu_preprocessor
+        )
+        self.step_time = step_time
+        self.release_gil = release_gil
+        self.episode_len = episode_len
+        rng = np.random.RandomState(seed)
+        # a few fixed frames, generating one per step would dominate timing
+        self._frames = rng.randint(
+            0, 256, (nb_frame, *ATARI_FRAME_SHAPE), dtype=np.uint8
+        )
+        self._nb_step = 0
+
+    @classmethod
+    def from_args(cls, args, seed, **kwargs):
+        return cls(
+            seed,
+            args.step_time,
+            args.episode_len,
+            args.nb_frame,
+            args.release_gil,
+        )
+
+    def step(self, action):
+        if self.step_time and self.release_gil:
+            time.sleep(self.step_time)
+        elif self.step_time:
+            end = time.perf_counter() + self.step_time
+            while time.perf_counter() < end:
+                pass
+        self._nb_step += 1
+        done = self._nb_step >= self.episode_len
+        return self._observation(), 0.0, done, {}
+
+    def reset(self, **kwargs):
+        self.cpu_preprocessor.reset()
+        self._nb_step = 0
+        return self._observation()
+
+    def close(self):
+        pass
+
+    def _observation(self):
+        frame = self._frames[self._nb_step % len(self._frames)]
+        return self.cpu_preprocessor({"Box": frame})
+
+
+def make_env_fns(nb_env, step_time=0.0, episode_len=1000, release_gil=False):
+    return [
+        lambda seed=seed: SyntheticAtariEnv(
+            seed, step_time, episode_len, release_gil=release_gil
+        )
+        for seed in range(nb_env)
+    ]
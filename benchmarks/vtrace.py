@@ -0,0 +1,160 @@
+# Copyright (C) 2018 Heron Systems, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Time of the ImpalaLearner log prob gather and v-trace, against the per step
+python loops they replaced.
+
+Usage:
+    vtrace [options]
+    vtrace (-h | --help)
+
+Options:
+    --rollout-lens <str>    Comma separated rollout lengths [default: 20,80]
+    --batch-sizes <str>     Comma separated batch sizes [default: 64,512]
+    --nb-key <int>          Number of action keys [default: 2]
+    --nb-action <int>       Number of actions per key [default: 6]
+    --device <str>          Device to run on [default: cpu]
+    --nb-iter <int>         Timed iterations [default: 100]
+
+Run from the repository root:
+    python -m benchmarks.vtrace
+"""
+
+import time
+
+import torch
+
+from adept.learner.impala import ImpalaLearner
+from adept.utils.util import DotDict, dlist_to_listd
+
+
+def loop_gather_log_probs(actions, log_softmaxes):
+    r_log_probs = []
+    for b_action, b_log_softs in zip(actions, log_softmaxes):
+        k_log_probs = []
+        for act_tensor, log_soft in zip(
+            b_action.values(), b_log_softs.unbind(1)
+        ):
+            k_log_probs.append(log_soft.gather(1, act_tensor.unsqueeze(1)))
+        r_log_probs.append(torch.cat(k_log_probs, dim=1))
+    return torch.stack(r_log_probs)
+
+
+def loop_vtrace(
+    log_prob_diffs, dterminal_masks, rewards, values, bootstrap_value
+):
+    importance = torch.exp(log_prob_diffs)
+    clamped = importance.clamp(max=1.0).mean(-1)
+    values_t_plus_1 = torch.cat((values[1:], bootstrap_value.unsqueeze(0)))
+    deltas = clamped * (rewards + dterminal_masks * values_t_plus_1 - values)
+    vs_minus_v_xs = []
+    nstep_v = 0.0
+    for i in reversed(range(rewards.shape[0])):
+        nstep_v = deltas[i] + dterminal_masks[i] * clamped[i] * nstep_v
+        vs_minus_v_xs.append(nstep_v)
+    v_s = values + torch.stack(list(reversed(vs_minus_v_xs)))
+    v_s_tp1 = torch.cat((v_s[1:], bootstrap_value.unsqueeze(0)))
+    advantage = rewards + dterminal_masks * v_s_tp1 - values
+    return v_s, importance.clamp(max=1.0) * advantage.unsqueeze(-1)
+
+
+def time_ms(fn, device, nb_iter):
+    # warm up, also compiles the scan
+    for _ in range(3):
+        fn()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(nb_iter):
+        fn()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) * 1000 / nb_iter
+
+
+def main(args):
+    device = torch.device(args.device)
+    row = "{:>6} {:>6} {:>10} {:>12} {:>12} {:>8}"
+    print(row.format("T", "B", "op", "loop ms", "vector ms", "speedup"))
+    for rollout_len in args.rollout_lens:
+        for batch_size in args.batch_sizes:
+            shape = (rollout_len, batch_size)
+            log_softmaxes = torch.randn(
+                *shape, args.nb_key, args.nb_action, device=device
+            ).log_softmax(-1)
+            actions = {
+                "act_{}".format(k): torch.randint(
+                    args.nb_action, shape, device=device
+                )
+                for k in range(args.nb_key)
+            }
+            # the per step dicts Rollout.read() returns
+            step_actions = dlist_to_listd(actions)
+            vtrace_args = (
+                0.5 * torch.randn(*shape, args.nb_key, device=device),
+                0.99 * torch.ones(*shape, device=device),
+                torch.randn(*shape, device=device),
+                torch.randn(*shape, device=device),
+                torch.randn(batch_size, device=device),
+            )
+
+            ops = [
+                (
+                    "gather",
+                    lambda: loop_gather_log_probs(step_actions, log_softmaxes),
+                    lambda: ImpalaLearner._gather_log_probs(
+                        actions, log_softmaxes
+                    ),
+                ),
+                (
+                    "vtrace",
+                    lambda: loop_vtrace(*vtrace_args),
+                    lambda: ImpalaLearner._vtrace_returns(
+                        *vtrace_args, 1.0, 1.0, 1.0
+                    ),
+                ),
+            ]
+            for name, loop_fn, vector_fn in ops:
+                loop_ms = time_ms(loop_fn, device, args.nb_iter)
+                vector_ms = time_ms(vector_fn, device, args.nb_iter)
+                print(
+                    row.format(
+                        rollout_len,
+                        batch_size,
+                        name,
+                        "{:.3f}".format(loop_ms),
+                        "{:.3f}".format(vector_ms),
+                        "{:.1f}x".format(loop_ms / vector_ms),
+                    )
+                )
+
+
+def parse_args():
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    args = {k.strip("--").replace("-", "_"): v for k, v in args.items()}
+    del args["h"]
+    del args["help"]
+    args["rollout_lens"] = [int(x) for x in args["rollout_lens"].split(",")]
+    args["batch_sizes"] = [int(x) for x in args["batch_sizes"].split(",")]
+    args["nb_key"] = int(args["nb_key"])
+    args["nb_action"] = int(args["nb_action"])
+    args["nb_iter"] = int(args["nb_iter"])
+    return DotDict(args)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import torch
+from adept.exp import (
+    ExperienceRecorder,
+    ExpSpecBuilder,
+    OfflineRolloutLoader,
+    Rollout,
+)
+
+exp_len = 3
+
+
+def spec_builder(batch_size):
+    def build_fn(exp_len):
+        return {
+            "obs_a": (exp_len + 1, batch_size, 2),
+            "act_a": (exp_len, batch_size),
+            "rewards": (exp_len, batch_size),
+            "terminals": (exp_len, batch_size),
+        }
+
+    return ExpSpecBuilder(
+        obs_keys={"obs_a": (2,)},
+        act_keys={"act_a": (5,)},
+        internal_keys={},
+        key_types={
+            "obs_a": torch.uint8,
+            "act_a": "long",
+            "rewards": "float",
+            "terminals": "float",
+        },
+        exp_keys=["obs_a", "act_a", "rewards", "terminals"],
+        build_fn=build_fn,
+    )
+
+
+def fill(rollout, value):
+    for k, v in rollout.items():
+        v.fill_(value)
+
+
+class TestOffline(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        recorder = ExperienceRecorder(self.dir)
+        r = Rollout(spec_builder(2), exp_len)
+        for chunk in range(4):
+            fill(r, chunk)
+            recorder.record(
+                r,
+                {"obs_a": torch.full((2, 2), chunk, dtype=torch.uint8)},
+                {"hx": [torch.full((3,), float(chunk))] * 2},
+            )
+        recorder.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_index(self):
+        self.assertTrue(os.path.exists(os.path.join(self.dir, "index.json")))
+        # continues the recording
+        recorder = ExperienceRecorder(self.dir)
+        self.assertEqual(recorder.nb_chunk, 4)
+        recorder.close()
+
+    def test_load(self):
+        loader = OfflineRolloutLoader(self.dir, Rollout(spec_builder(2), 3))
+        self.assertEqual(len(loader), 4)
+        for chunk, (exp, next_obs, internals) in enumerate(loader):
+            self.assertTrue(torch.all(exp.rewards == chunk))
+            self.assertEqual(exp.observations[0]["obs_a"].dtype, torch.uint8)
+            self.assertTrue(torch.all(next_obs["obs_a"] == chunk))
+            self.assertEqual(len(internals["hx"]), 2)
+            self.assertEqual(internals["hx"][0].tolist(), [chunk] * 3)
+
+    def test_merge_chunks(self):
+        loader = OfflineRolloutLoader(
+            self.dir, Rollout(spec_builder(4), 3), nb_epoch=2
+        )
+        self.assertEqual(len(loader), 4)
+        batches = [exp.rewards[0].tolist() for exp, _, _ in loader]
+        self.assertEqual(batches, [[0, 0, 1, 1], [2, 2, 3, 3]] * 2)
+
+    def test_shape_mismatch(self):
+        with self.assertRaises(ValueError):
+            OfflineRolloutLoader(self.dir, Rollout(spec_builder(2), 5))
+
+    def test_close(self):
+        loader = OfflineRolloutLoader(
+            self.dir, Rollout(spec_builder(2), 3), prefetch=1
+        )
+        next(iter(loader))
+        loader.close()
+        self.assertIsNone(loader._thread)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,245 @@
+import gc
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+from adept.exp import (
+    DiskExperienceReplay,
+    ExperienceReplay,
+    ExpSpecBuilder,
+    PrioritizedExperienceReplay,
+)
+from adept.exp.base import SumTree
+
+batch_size = 4
+replay_size = 40
+
+
+def build_fn(exp_len):
+    return {
+        "obs_a": (exp_len + 1, batch_size, 2),
+        "act_a": (exp_len, batch_size),
+        "rewards": (exp_len, batch_size),
+        "terminals": (exp_len, batch_size),
+    }
+
+
+spec_builder = ExpSpecBuilder(
+    obs_keys={"obs_a": (2,)},
+    act_keys={"act_a": (5,)},
+    internal_keys={},
+    key_types={
+        "obs_a": torch.uint8,
+        "act_a": "long",
+        "rewards": "float",
+        "terminals": "float",
+    },
+    exp_keys=["obs_a", "act_a", "rewards", "terminals"],
+    build_fn=build_fn,
+)
+
+
+def write_step(replay, step, env_ids=None):
+    """Every value of a step is the step number."""
+    nb_env = batch_size if env_ids is None else len(env_ids)
+    replay.write_actor(
+        {"act_a": torch.full((nb_env,), step, dtype=torch.long)},
+        env_ids=env_ids,
+    )
+    replay.write_env(
+        {"obs_a": torch.full((nb_env, 2), step, dtype=torch.uint8)},
+        torch.full((nb_env,), float(step)),
+        torch.zeros(nb_env),
+        [{}] * nb_env,
+        env_ids=env_ids,
+    )
+
+
+class TestExperienceReplay(unittest.TestCase):
+    def test_storage(self):
+        r = ExperienceReplay(spec_builder, replay_size, 1, 8)
+        self.assertEqual(r.capacity, replay_size // batch_size)
+        self.assertEqual(r["obs_a"].shape, (r.capacity, batch_size, 2))
+        self.assertEqual(r["obs_a"].dtype, torch.uint8)
+        self.assertEqual(r["act_a"].dtype, torch.int64)
+
+    def test_ready(self):
+        r = ExperienceReplay(spec_builder, replay_size, 8, 8)
+        write_step(r, 0)
+        self.assertEqual(len(r), 0)
+        write_step(r, 1)
+        self.assertEqual(len(r), batch_size)
+        self.assertFalse(r.is_ready())
+        write_step(r, 2)
+        self.assertTrue(r.is_ready())
+
+    def test_read_transitions(self):
+        torch.manual_seed(0)
+        r = ExperienceReplay(spec_builder, replay_size, 1, 64)
+        nb_step = 25
+        for step in range(nb_step):
+            write_step(r, step)
+        self.assertEqual(len(r), batch_size * (r.capacity - 2))
+
+        batch = r.read()
+        self.assertEqual(batch.rewards.shape, (64,))
+        steps = batch.rewards.long()
+        # only the newest steps whose next observation is stored
+        self.assertTrue((steps >= nb_step + 1 - r.capacity).all())
+        self.assertTrue((steps <= nb_step - 2).all())
+        self.assertTrue(torch.equal(batch.actions["act_a"], steps))
+        self.assertTrue(
+            torch.equal(batch.observations["obs_a"][:, 0].long(), steps)
+        )
+        next_steps = batch.next_observations["obs_a"][:, 0].long()
+        self.assertTrue(torch.equal(next_steps, steps + 1))
+
+    def test_write_env_ids(self):
+        torch.manual_seed(0)
+        r = ExperienceReplay(spec_builder, replay_size, 1, 64)
+        first, second = torch.arange(2), torch.arange(2, batch_size)
+        for step in range(4):
+            write_step(r, step, env_ids=first)
+        write_step(r, 0, env_ids=second)
+        # the second envs have no transitions yet
+        self.assertEqual(len(r), 2 * 3)
+        slots, env_ids = r.sample(64)
+        self.assertTrue((env_ids < 2).all())
+
+        batch = r.read_transitions(slots, env_ids)
+        self.assertTrue(
+            torch.equal(
+                batch.next_observations["obs_a"][:, 0].long(),
+                batch.actions["act_a"] + 1,
+            )
+        )
+
+
+class TestSumTree(unittest.TestCase):
+    def test_update(self):
+        tree = SumTree(6)
+        tree.update(np.arange(6), np.array([1.0, 0.0, 2.0, 0.0, 3.0, 0.0]))
+        self.assertEqual(tree.total(), 6.0)
+        self.assertEqual(tree.min(), 1.0)
+        tree.update(np.array([0, 2]), np.array([0.0, 0.5]))
+        self.assertEqual(tree.total(), 3.5)
+        self.assertEqual(tree.min(), 0.5)
+
+    def test_find(self):
+        tree = SumTree(6)
+        tree.update(np.arange(6), np.array([1.0, 0.0, 2.0, 0.0, 3.0, 0.0]))
+        leaves = tree.find(np.array([0.0, 0.99, 1.0, 2.99, 3.0, 5.999]))
+        self.assertEqual(leaves.tolist(), [0, 0, 2, 2, 4, 4])
+        # past the total, still a leaf with a priority
+        self.assertEqual(tree.find(np.array([6.5])).tolist(), [4])
+
+    def test_sample(self):
+        tree = SumTree(4)
+        tree.update(np.arange(4), np.array([1.0, 0.0, 3.0, 0.0]))
+        leaves = tree.sample(4000, np.random.RandomState(0))
+        counts = np.bincount(leaves, minlength=4)
+        self.assertEqual(counts.tolist(), [1000, 0, 3000, 0])
+
+
+class TestPrioritizedExperienceReplay(unittest.TestCase):
+    def make_replay(self):
+        np.random.seed(0)
+        return PrioritizedExperienceReplay(
+            spec_builder, replay_size, 1, 64, replay_alpha=1.0, replay_beta=1.0
+        )
+
+    def test_new_transitions_max_priority(self):
+        r = self.make_replay()
+        for step in range(25):
+            write_step(r, step)
+        self.assertEqual(r.tree.total(), len(r))
+        batch = r.read()
+        steps = batch.rewards.long()
+        self.assertTrue((steps >= 25 + 1 - r.capacity).all())
+        self.assertTrue((steps <= 25 - 2).all())
+        self.assertTrue(torch.allclose(batch.weights, torch.ones(64)))
+
+    def test_update_priorities(self):
+        r = self.make_replay()
+        for step in range(4):
+            write_step(r, step)
+        batch = r.read()
+        # only transition 0 of env 0 keeps a priority
+        priorities = torch.zeros(64)
+        target = (batch.rewards == 0) & (batch.indices % batch_size == 0)
+        priorities[target] = 1.0
+        r.update_priorities(batch.indices, priorities)
+        batch = r.read()
+        self.assertTrue((batch.rewards == 0).all())
+        self.assertTrue((batch.indices % batch_size == 0).all())
+
+    def test_overwritten_excluded(self):
+        r = self.make_replay()
+        for step in range(r.capacity):
+            write_step(r, step)
+        indices = r.sample(64)[0] * batch_size
+        write_step(r, r.capacity)
+        r.update_priorities(indices, torch.ones(64))
+        for _ in range(10):
+            steps = r.read().rewards.long()
+            self.assertTrue((steps >= 2).all())
+
+
+class TestDiskExperienceReplay(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.replay = DiskExperienceReplay(
+            spec_builder, replay_size, 1, 64, self.dir, 3 * batch_size
+        )
+
+    def tearDown(self):
+        self.replay.close()
+
+    def test_hot_window(self):
+        r = self.replay
+        self.assertEqual(r["obs_a"].shape, (3, batch_size, 2))
+        self.assertEqual(r.disk["obs_a"].shape, (r.capacity * batch_size, 2))
+        self.assertEqual(r.disk["obs_a"].dtype, np.uint8)
+
+    def test_close_removes_files(self):
+        replay_dir = self.replay.dir
+        self.assertTrue(os.path.isdir(replay_dir))
+        self.replay.close()
+        self.assertFalse(os.path.exists(replay_dir))
+
+        # removed when collected without close()
+        replay = DiskExperienceReplay(
+            spec_builder, replay_size, 1, 64, self.dir, 3 * batch_size
+        )
+        replay_dir = replay.dir
+        del replay
+        gc.collect()
+        self.assertFalse(os.path.exists(replay_dir))
+
+    def test_matches_in_memory(self):
+        torch.manual_seed(0)
+        expected = ExperienceReplay(spec_builder, replay_size, 1, 64)
+        first, second = torch.arange(2), torch.arange(2, batch_size)
+        for step in range(25):
+            for r in [expected, self.replay]:
+                write_step(r, step, env_ids=first)
+                if step % 2:
+                    write_step(r, step, env_ids=second)
+        self.assertEqual(len(self.replay), len(expected))
+
+        slots, env_ids = expected.sample(256)
+        expected_batch = expected.read_transitions(slots, env_ids)
+        batch = self.replay.read_transitions(slots, env_ids)
+        self.assertTrue(torch.equal(batch.rewards, expected_batch.rewards))
+        self.assertTrue(
+            torch.equal(batch.terminals, expected_batch.terminals)
+        )
+        for field in ["observations", "next_observations", "actions"]:
+            for k, v in getattr(expected_batch, field).items():
+                self.assertTrue(torch.equal(getattr(batch, field)[k], v))
+
+
+if __name__ == "__main__":
+    unittest.main()
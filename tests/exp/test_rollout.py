@@ -1,7 +1,9 @@
 import unittest
 
+import numpy as np
 import torch
 from adept.exp import Rollout, ExpSpecBuilder
+from adept.utils.util import DotDict
 
 obs_space = {"obs_a": (2, 2), "obs_b": (3, 3)}
 act_space = {"act_a": (5,), "act_b": (6,)}
@@ -59,3 +61,213 @@ class TestRollout(unittest.TestCase):
         # print(next_obs)
         self.assertEqual(next_obs["obs_a"][0][0][0].item(), 1)
         self.assertEqual(next_obs["obs_b"][0][0][0].item(), 1)
+
+    def test_write_env_ids(self):
+        r = Rollout(spec_builder, 2)
+        obs = {
+            "obs_a": torch.ones(batch_size, 2, 2),
+            "obs_b": torch.ones(batch_size, 3, 3),
+        }
+        first, second = torch.arange(4), torch.arange(4, batch_size)
+        for _ in range(2):
+            r.write_env(
+                {k: v[first] for k, v in obs.items()},
+                torch.ones(4),
+                torch.zeros(4),
+                [{}] * 4,
+                env_ids=first,
+            )
+        self.assertFalse(r.is_ready())
+        self.assertEqual(r["rewards"][1][:4].sum().item(), 4)
+        self.assertEqual(r["rewards"][1][4:].sum().item(), 0)
+
+        for _ in range(2):
+            r.write_env(
+                {k: v[second] for k, v in obs.items()},
+                torch.full((batch_size - 4,), 2.0),
+                torch.zeros(batch_size - 4),
+                [{}] * (batch_size - 4),
+                env_ids=second,
+            )
+        self.assertTrue(r.is_ready())
+        self.assertEqual(r["rewards"][0][4:].sum().item(), 2 * (batch_size - 4))
+
+        r.clear()
+        self.assertEqual(r.env_cur_idx.sum().item(), 0)
+
+    def test_contiguous_storage(self):
+        r = Rollout(spec_builder, 2)
+        self.assertEqual(r["obs_a"].shape, (3, batch_size, 2, 2))
+        self.assertEqual(r["obs_a"].dtype, torch.int64)
+        self.assertEqual(r["rewards"].shape, (2, batch_size))
+        self.assertTrue(r["obs_a"].is_contiguous())
+
+        obs = {
+            "obs_a": torch.ones(batch_size, 2, 2).long(),
+            "obs_b": torch.ones(batch_size, 3, 3).long(),
+        }
+        r.write_env(obs, torch.ones(batch_size), torch.zeros(batch_size), {})
+        # written in place, the input isn't kept
+        obs["obs_a"].fill_(2)
+        self.assertEqual(r["obs_a"][0].sum().item(), batch_size * 4)
+
+        # reads are views of the storage
+        read = r.read()
+        self.assertEqual(read.rewards.data_ptr(), r["rewards"].data_ptr())
+        self.assertEqual(
+            read.observations[0]["obs_a"].data_ptr(), r["obs_a"].data_ptr()
+        )
+
+    def test_obs_dtypes(self):
+        from adept.actor.impala import ImpalaWorkerActor
+
+        builder = ImpalaWorkerActor.exp_spec_builder(
+            {"obs_a": (2, 2), "obs_b": (3, 3)},
+            {"act_a": (5,)},
+            {},
+            batch_size,
+            {"obs_a": torch.uint8, "obs_b": np.dtype("float32")},
+        )
+        r = Rollout(builder, 2)
+        self.assertEqual(r["obs_a"][0].dtype, torch.uint8)
+        self.assertEqual(r["obs_b"][0].dtype, torch.float32)
+        self.assertEqual(r["act_a"][0].dtype, torch.int64)
+
+        obs = {
+            "obs_a": torch.full((4, 2, 2), 255, dtype=torch.uint8),
+            "obs_b": torch.ones(4, 3, 3),
+        }
+        r.write_env(
+            obs, torch.ones(4), torch.zeros(4), [{}] * 4, env_ids=torch.arange(4)
+        )
+        self.assertEqual(r["obs_a"][0].dtype, torch.uint8)
+        self.assertEqual(r["obs_a"][0][:4].sum().item(), 255 * 16)
+
+
+nb_frame = 4
+
+
+def make_frame_spec_builder(nb_env):
+    def build_frame_fn(exp_len):
+        return {
+            "obs_a": (exp_len + 1, nb_env, nb_frame * 2, 3, 3),
+            "act_a": (exp_len, nb_env),
+            "rewards": (exp_len, nb_env),
+            "terminals": (exp_len, nb_env),
+        }
+
+    return ExpSpecBuilder(
+        obs_keys={"obs_a": (nb_frame * 2, 3, 3)},
+        act_keys={"act_a": (5,)},
+        internal_keys={},
+        key_types={
+            "obs_a": "byte",
+            "act_a": "long",
+            "rewards": "float",
+            "terminals": "float",
+        },
+        exp_keys=["obs_a", "act_a", "rewards", "terminals"],
+        build_fn=build_frame_fn,
+    )
+
+
+frame_spec_builder = make_frame_spec_builder(batch_size)
+
+
+def stacked_obs(nb_step, terminals):
+    """Frame-stacked observations that reset to zeros after a terminal."""
+    stacks = []
+    stack = torch.zeros(batch_size, nb_frame, 2, 3, 3, dtype=torch.uint8)
+    for t in range(nb_step):
+        frame = torch.randint(1, 255, (batch_size, 1, 2, 3, 3))
+        stack = torch.cat([stack[:, 1:], frame.byte()], dim=1)
+        stacks.append(stack.flatten(1, 2))
+        if t < len(terminals):
+            stack = stack.masked_fill(
+                terminals[t].bool().view(-1, 1, 1, 1, 1), 0
+            )
+    return stacks
+
+
+class TestRolloutDedupFrames(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.terminals = (torch.rand(exp_len, batch_size) < 0.2).float()
+        self.obs = stacked_obs(exp_len + 1, self.terminals)
+
+    def _write(self, r, env_ids=None):
+        for t in range(exp_len):
+            obs, terminals = self.obs[t], self.terminals[t]
+            if env_ids is None:
+                r.write_env(
+                    {"obs_a": obs}, torch.ones(batch_size), terminals, {}
+                )
+            else:
+                for ids in env_ids:
+                    r.write_env(
+                        {"obs_a": obs[ids]},
+                        torch.ones(len(ids)),
+                        terminals[ids],
+                        {},
+                        env_ids=ids,
+                    )
+        r.write_next_obs({"obs_a": self.obs[-1]})
+
+    def _check(self, r):
+        full = Rollout(frame_spec_builder, exp_len)
+        self._write(full)
+        expected, actual = full.read(), r.read()
+        for t in range(exp_len):
+            self.assertTrue(
+                torch.equal(
+                    expected.observations[t]["obs_a"],
+                    actual.observations[t]["obs_a"],
+                )
+            )
+        self.assertTrue(
+            torch.equal(
+                expected.next_observation["obs_a"],
+                actual.next_observation["obs_a"],
+            )
+        )
+
+    def test_read_matches_full_stacks(self):
+        r = Rollout(frame_spec_builder, exp_len, dedup_frames=nb_frame)
+        self.assertEqual(r.frame_keys, ["obs_a"])
+        self.assertEqual(len(r["obs_a"]), exp_len + nb_frame)
+        self.assertEqual(r["obs_a"][0].shape, (batch_size, 2, 3, 3))
+        self._write(r)
+        self._check(r)
+
+    def test_write_env_ids(self):
+        r = Rollout(frame_spec_builder, exp_len, dedup_frames=nb_frame)
+        self._write(r, env_ids=[torch.arange(4), torch.arange(4, batch_size)])
+        self._check(r)
+
+    def test_write_exps(self):
+        half = batch_size // 2
+        exps = []
+        half_spec_builder = make_frame_spec_builder(half)
+        for ids in [torch.arange(half), torch.arange(half, batch_size)]:
+            r = Rollout(half_spec_builder, exp_len, dedup_frames=nb_frame)
+            for t in range(exp_len):
+                r.write_env(
+                    {"obs_a": self.obs[t][ids]},
+                    torch.ones(half),
+                    self.terminals[t][ids],
+                    {},
+                )
+            r.write_next_obs({"obs_a": self.obs[-1][ids]})
+            exps.append({k: v.clone() for k, v in r.items()})
+
+        merged = Rollout(frame_spec_builder, exp_len, dedup_frames=nb_frame)
+        merged.write_exps(exps)
+        self._check(merged)
+
+    def test_from_args_without_dedup_frames(self):
+        # args saved before dedup_frames existed
+        args = DotDict({"rollout_len": exp_len})
+        r = Rollout.from_args(args, frame_spec_builder)
+        self.assertEqual(r.dedup_frames, 0)
+        self._write(r)
+        self._check(r)
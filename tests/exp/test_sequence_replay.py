@@ -0,0 +1,123 @@
+import unittest
+
+import torch
+from adept.exp import ExpSpecBuilder, SequenceReplay
+
+batch_size = 2
+hidden_size = 3
+
+
+def build_fn(exp_len):
+    return {
+        "obs_a": (exp_len + 1, batch_size, 2),
+        "act_a": (exp_len, batch_size),
+        "hx": (exp_len, batch_size, hidden_size),
+        "rewards": (exp_len, batch_size),
+        "terminals": (exp_len, batch_size),
+    }
+
+
+spec_builder = ExpSpecBuilder(
+    obs_keys={"obs_a": (2,)},
+    act_keys={"act_a": (5,)},
+    internal_keys={"hx": (hidden_size,)},
+    key_types={
+        "obs_a": torch.uint8,
+        "act_a": "long",
+        "hx": "float",
+        "rewards": "float",
+        "terminals": "float",
+    },
+    exp_keys=["obs_a", "act_a", "hx", "rewards", "terminals"],
+    build_fn=build_fn,
+)
+
+
+def write_step(replay, step, terminal=0.0):
+    """Every value of a step is the step number."""
+    replay.write_actor(
+        {
+            "act_a": torch.full((batch_size,), step, dtype=torch.long),
+            "hx": torch.full((batch_size, hidden_size), float(step)),
+        }
+    )
+    replay.write_env(
+        {"obs_a": torch.full((batch_size, 2), step, dtype=torch.uint8)},
+        torch.full((batch_size,), float(step)),
+        torch.full((batch_size,), terminal),
+        [{}] * batch_size,
+    )
+
+
+class TestSequenceReplay(unittest.TestCase):
+    def setUp(self):
+        # sequences of 4 steps starting every 2 steps, 1 step of burn in
+        self.replay = SequenceReplay(spec_builder, 10, 4, 6, 4, 2, 1)
+
+    def test_storage(self):
+        r = self.replay
+        self.assertEqual(r["obs_a"].shape, (5, 10, 2))
+        self.assertEqual(r["obs_a"].dtype, torch.uint8)
+        self.assertEqual(r["act_a"].shape, (4, 10))
+        self.assertEqual(r["hx"].shape, (10, hidden_size))
+        self.assertEqual(r["masks"].shape, (4, 10))
+
+    def test_overlapping_sequences(self):
+        r = self.replay
+        for step in range(4):
+            write_step(r, step)
+        self.assertEqual(len(r), 0)
+        # the next observation completes the first sequence
+        write_step(r, 4)
+        self.assertEqual(len(r), batch_size)
+        self.assertFalse(r.is_ready())
+        for step in range(5, 7):
+            write_step(r, step)
+        self.assertEqual(len(r), 2 * batch_size)
+        self.assertTrue(r.is_ready())
+
+        batch = r.read_sequences(torch.tensor([0, 2]))
+        obs = batch.observations["obs_a"]
+        self.assertEqual(obs[:, 0].tolist(), [[1, 1], [2, 2], [3, 3]])
+        self.assertEqual(obs[:, 1, 0].tolist(), [3, 4, 5])
+        self.assertEqual(
+            batch.burn_in_observations["obs_a"][:, :, 0].tolist(), [[0, 2]]
+        )
+        self.assertEqual(
+            batch.next_observation["obs_a"][:, 0].tolist(), [4, 6]
+        )
+        self.assertEqual(
+            batch.actions["act_a"].tolist(), [[1, 3], [2, 4], [3, 5]]
+        )
+        self.assertEqual(batch.rewards.shape, (3, 2))
+        # internals the burn in starts from
+        self.assertEqual(batch.internals["hx"][:, 0].tolist(), [0.0, 2.0])
+
+    def test_masks(self):
+        r = self.replay
+        for step in range(5):
+            write_step(r, step, terminal=float(step == 1))
+        batch = r.read_sequences(torch.tensor([0]))
+        self.assertEqual(batch.burn_in_masks[:, 0].tolist(), [1.0])
+        # step 2 starts a new episode
+        self.assertEqual(batch.masks[:, 0].tolist(), [1.0, 0.0, 1.0])
+
+    def test_read(self):
+        r = self.replay
+        for step in range(7):
+            write_step(r, step)
+        batch = r.read()
+        self.assertEqual(batch.observations["obs_a"].shape, (3, 6, 2))
+        self.assertEqual(batch.internals["hx"].shape, (6, hidden_size))
+
+    def test_ring(self):
+        r = self.replay
+        for step in range(15):
+            write_step(r, step)
+        self.assertEqual(len(r), 10)
+        # the two oldest sequences were overwritten by the newest
+        self.assertEqual(r["act_a"][0, :2].tolist(), [10, 10])
+
+
+if __name__ == "__main__":
+    unittest.main()
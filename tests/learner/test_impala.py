@@ -0,0 +1,103 @@
+import unittest
+
+import torch
+
+from adept.learner.impala import ImpalaLearner
+
+
+def reference_vtrace(
+    log_prob_diffs,
+    dterminal_masks,
+    rewards,
+    values,
+    bootstrap_value,
+    rho_bar,
+    pg_rho_bar,
+    c_bar,
+):
+    """Step by step v-trace, following the paper."""
+    importance = torch.exp(log_prob_diffs)
+    rhos = importance.clamp(max=rho_bar).mean(-1)
+    cs = importance.clamp(max=c_bar).mean(-1)
+    rollout_len = rewards.shape[0]
+
+    v_s = torch.zeros_like(values)
+    next_value = bootstrap_value
+    nstep_v = torch.zeros_like(bootstrap_value)
+    for i in reversed(range(rollout_len)):
+        delta = rhos[i] * (
+            rewards[i] + dterminal_masks[i] * next_value - values[i]
+        )
+        nstep_v = delta + dterminal_masks[i] * cs[i] * nstep_v
+        v_s[i] = values[i] + nstep_v
+        next_value = values[i]
+
+    advantages = torch.zeros_like(importance)
+    next_v_s = bootstrap_value
+    for i in reversed(range(rollout_len)):
+        advantage = rewards[i] + dterminal_masks[i] * next_v_s - values[i]
+        advantages[i] = (
+            importance[i].clamp(max=pg_rho_bar) * advantage.unsqueeze(-1)
+        )
+        next_v_s = v_s[i]
+    return v_s, advantages
+
+
+class TestImpalaLearner(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        rollout_len, batch_size, nb_key = 20, 8, 2
+        self.log_prob_diffs = 0.5 * torch.randn(
+            rollout_len, batch_size, nb_key
+        )
+        terminals = (torch.rand(rollout_len, batch_size) < 0.1).float()
+        self.dterminal_masks = 0.99 * (1.0 - terminals)
+        self.rewards = torch.randn(rollout_len, batch_size)
+        self.values = torch.randn(rollout_len, batch_size)
+        self.bootstrap_value = torch.randn(batch_size)
+
+    def check(self, rho_bar, pg_rho_bar, c_bar):
+        args = (
+            self.log_prob_diffs,
+            self.dterminal_masks,
+            self.rewards,
+            self.values,
+            self.bootstrap_value,
+            rho_bar,
+            pg_rho_bar,
+            c_bar,
+        )
+        v_s, advantages, _ = ImpalaLearner._vtrace_returns(*args)
+        expected_v_s, expected_advantages = reference_vtrace(*args)
+        self.assertTrue(torch.allclose(v_s, expected_v_s, atol=1e-5))
+        self.assertTrue(
+            torch.allclose(advantages, expected_advantages, atol=1e-5)
+        )
+
+    def test_vtrace(self):
+        self.check(1.0, 1.0, 1.0)
+
+    def test_vtrace_clipping(self):
+        self.check(2.0, 1.5, 0.5)
+        self.check(0.8, 1.0, 1.2)
+
+    def test_gather_log_probs(self):
+        log_softmaxes = torch.randn(5, 3, 2, 4).log_softmax(-1)
+        actions = {
+            "act_a": torch.randint(4, (5, 3)),
+            "act_b": torch.randint(4, (5, 3)),
+        }
+        log_probs = ImpalaLearner._gather_log_probs(actions, log_softmaxes)
+        self.assertEqual(log_probs.shape, (5, 3, 2))
+        for t in range(5):
+            for k, key in enumerate(["act_a", "act_b"]):
+                for b in range(3):
+                    a = actions[key][t, b]
+                    self.assertEqual(
+                        log_probs[t, b, k].item(),
+                        log_softmaxes[t, b, k, a].item(),
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main()
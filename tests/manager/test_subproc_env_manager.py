@@ -0,0 +1,332 @@
+import os
+import unittest
+
+import numpy as np
+import torch
+
+from adept.env.base.env_module import EnvModule
+from adept.manager import SubProcEnvManager
+from adept.preprocess.base.preprocessor import CPUPreprocessor, GPUPreprocessor
+from adept.preprocess.ops import CastToFloat, FromNumpy
+
+EPISODE_LEN = 5
+
+
+class CountingEnv(EnvModule):
+    """
+    Observations are filled with the number of steps taken, the reward is the
+    action taken. Episodes last EPISODE_LEN steps.
+    """
+
+    args = {}
+    ids = ["Counting"]
+
+    def __init__(self, seed):
+        cpu_preprocessor = CPUPreprocessor(
+            [FromNumpy("Box", "Box")], {"Box": (1, 4, 4)}, {"Box": np.uint8}
+        )
+        gpu_preprocessor = GPUPreprocessor(
+            [CastToFloat("Box", "Box")],
+            cpu_preprocessor.observation_space,
+            cpu_preprocessor.observation_dtypes,
+        )
+        super(CountingEnv, self).__init__(
+            {"Discrete": (3,)}, cpu_preprocessor, gpu_preprocessor
+        )
+        self.seed = seed
+        self.nb_step = 0
+
+    @classmethod
+    def from_args(cls, args, seed, **kwargs):
+        return cls(seed)
+
+    def step(self, action):
+        self.nb_step += 1
+        done = self.nb_step == EPISODE_LEN
+        info = {"seed": self.seed} if done else {}
+        return self._observation(), float(action["Discrete"]), done, info
+
+    def reset(self, **kwargs):
+        self.nb_step = 0
+        return self._observation()
+
+    def close(self):
+        pass
+
+    def _observation(self):
+        ob = np.full((1, 4, 4), self.nb_step, dtype=np.uint8)
+        return self.cpu_preprocessor({"Box": ob})
+
+
+class FailingEnv(CountingEnv):
+    """
+    Raises on its second step, or kills its process if crash is set.
+    """
+
+    def __init__(self, seed, crash=False):
+        super(FailingEnv, self).__init__(seed)
+        self.crash = crash
+
+    def step(self, action):
+        if self.nb_step == 1:
+            if self.crash:
+                os._exit(1)
+            raise RuntimeError("env failed")
+        return super(FailingEnv, self).step(action)
+
+
+def make_env_fns(nb_env):
+    return [CountingEnv.from_args_curry(None, seed) for seed in range(nb_env)]
+
+
+class TestSubProcEnvManager(unittest.TestCase):
+    nb_env = 4
+    envs_per_worker = 1
+    transport = "ipc"
+    batch_preprocess = False
+
+    def setUp(self):
+        self.manager = SubProcEnvManager(
+            make_env_fns(self.nb_env),
+            "Counting",
+            self.envs_per_worker,
+            transport=self.transport,
+            batch_preprocess=self.batch_preprocess,
+        )
+
+    def tearDown(self):
+        self.manager.close()
+
+    def test_reset(self):
+        obs = self.manager.reset()
+        self.assertEqual(obs["Box"].shape, (self.nb_env, 1, 4, 4))
+        self.assertEqual(obs["Box"].dtype, torch.uint8)
+        self.assertEqual(obs["Box"].sum().item(), 0)
+
+    def test_step(self):
+        self.manager.reset()
+        actions = {"Discrete": torch.arange(self.nb_env) % 3}
+        obs, rewards, dones, infos = self.manager.step(actions)
+        self.assertTrue(
+            torch.equal(obs["Box"][:, 0, 0, 0], torch.ones(4).byte())
+        )
+        self.assertTrue(torch.equal(rewards, actions["Discrete"].float()))
+        self.assertFalse(dones.any())
+        self.assertEqual(list(infos), [{}] * self.nb_env)
+
+    def test_terminal(self):
+        self.manager.reset()
+        actions = {"Discrete": torch.zeros(self.nb_env).long()}
+        for _ in range(EPISODE_LEN):
+            obs, rewards, dones, infos = self.manager.step(actions)
+        self.assertTrue(dones.all())
+        # terminal envs are reset by the worker
+        self.assertEqual(obs["Box"].sum().item(), 0)
+        self.assertEqual([i["seed"] for i in infos], list(range(self.nb_env)))
+
+    def test_returned_tensors_not_overwritten(self):
+        self.manager.reset()
+        _, rewards, _, _ = self.manager.step(
+            {"Discrete": torch.ones(self.nb_env).long()}
+        )
+        self.manager.step({"Discrete": torch.zeros(self.nb_env).long()})
+        self.assertTrue(torch.equal(rewards, torch.ones(self.nb_env)))
+
+    def test_obs_not_copied(self):
+        obs = self.manager.reset()
+        next_obs, _, _, _ = self.manager.step(
+            {"Discrete": torch.zeros(self.nb_env).long()}
+        )
+        self.assertTrue(next_obs["Box"].is_contiguous())
+        self.assertTrue(next_obs["Box"].is_shared())
+        self.assertNotEqual(obs["Box"].data_ptr(), next_obs["Box"].data_ptr())
+
+    def test_obs_double_buffered(self):
+        self.manager.reset()
+        actions = {"Discrete": torch.zeros(self.nb_env).long()}
+        obs, _, _, _ = self.manager.step(actions)
+        self.manager.step(actions)
+        self.assertEqual(obs["Box"].sum().item(), self.nb_env * 16)
+
+        # buffers are reused after two steps
+        next_obs, _, _, _ = self.manager.step(actions)
+        self.assertEqual(obs["Box"].data_ptr(), next_obs["Box"].data_ptr())
+
+
+class TestSubProcEnvManagerMultiEnv(TestSubProcEnvManager):
+    # uneven split, second worker only steps one env
+    envs_per_worker = 3
+
+    def test_nb_worker(self):
+        self.assertEqual(self.manager.nb_worker, 2)
+
+
+class TestSubProcEnvManagerBatchPreprocess(TestSubProcEnvManagerMultiEnv):
+    batch_preprocess = True
+
+
+class TestSubProcEnvManagerPipe(TestSubProcEnvManager):
+    transport = "pipe"
+
+
+class TestSubProcEnvManagerTcp(TestSubProcEnvManager):
+    transport = "tcp"
+
+
+class TestTransport(unittest.TestCase):
+    def test_ipc_dir_removed(self):
+        manager = SubProcEnvManager(make_env_fns(2), "Counting")
+        ipc_dir = manager._ipc_dir
+        self.assertTrue(os.path.isdir(ipc_dir))
+        manager.close()
+        self.assertFalse(os.path.exists(ipc_dir))
+
+    def test_unknown_transport(self):
+        with self.assertRaises(ValueError):
+            SubProcEnvManager(make_env_fns(2), "Counting", transport="udp")
+
+
+@unittest.skipIf(
+    not hasattr(os, "sched_getaffinity"), "requires CPU affinity support"
+)
+class TestAffinity(unittest.TestCase):
+    def setUp(self):
+        self.affinity = os.sched_getaffinity(0)
+        self.nb_thread = torch.get_num_threads()
+
+    def tearDown(self):
+        os.sched_setaffinity(0, self.affinity)
+        torch.set_num_threads(self.nb_thread)
+
+    def test_worker_cores(self):
+        core = min(self.affinity)
+        manager = SubProcEnvManager(
+            make_env_fns(2), "Counting", worker_cores=str(core)
+        )
+        for process in manager.processes:
+            self.assertEqual(os.sched_getaffinity(process.pid), {core})
+        # this process isn't pinned without learner_cores
+        self.assertEqual(os.sched_getaffinity(0), self.affinity)
+        manager.close()
+
+    def test_learner_cores(self):
+        if len(self.affinity) < 2:
+            self.skipTest("requires at least 2 cores")
+        core = min(self.affinity)
+        manager = SubProcEnvManager(
+            make_env_fns(2), "Counting", learner_cores=str(core)
+        )
+        self.assertEqual(os.sched_getaffinity(0), {core})
+        for process in manager.processes:
+            self.assertNotIn(core, os.sched_getaffinity(process.pid))
+        manager.close()
+
+    def test_no_worker_cores(self):
+        with self.assertRaises(ValueError):
+            SubProcEnvManager(
+                make_env_fns(2),
+                "Counting",
+                learner_cores=",".join(str(c) for c in self.affinity),
+            )
+        # pinning happens after cores are assigned
+        self.assertEqual(os.sched_getaffinity(0), self.affinity)
+
+
+class TestSubProcEnvManagerAsync(unittest.TestCase):
+    nb_env = 4
+    transport = "ipc"
+
+    def setUp(self):
+        self.manager = SubProcEnvManager(
+            make_env_fns(self.nb_env),
+            "Counting",
+            async_batch_size=2,
+            transport=self.transport,
+        )
+
+    def tearDown(self):
+        self.manager.close()
+
+    def test_is_async(self):
+        self.assertTrue(self.manager.is_async)
+
+    def test_send_recv(self):
+        self.manager.reset()
+        env_ids = torch.arange(self.nb_env)
+        self.manager.send({"Discrete": env_ids % 3}, env_ids)
+        seen = []
+        while len(seen) < self.nb_env:
+            obs, rewards, dones, infos, ids = self.manager.recv()
+            self.assertGreaterEqual(len(ids), 2)
+            self.assertEqual(obs["Box"].shape, (len(ids), 1, 4, 4))
+            self.assertTrue(
+                torch.equal(obs["Box"][:, 0, 0, 0], torch.ones(len(ids)).byte())
+            )
+            self.assertTrue(torch.equal(rewards, (ids % 3).float()))
+            seen.extend(ids.tolist())
+        self.assertEqual(sorted(seen), list(range(self.nb_env)))
+
+    def test_resend_ready_envs(self):
+        self.manager.reset()
+        env_ids = torch.arange(self.nb_env)
+        self.manager.send(
+            {"Discrete": torch.zeros(self.nb_env).long()}, env_ids
+        )
+        _, _, _, _, ids = self.manager.recv()
+        self.manager.send({"Discrete": torch.ones(len(ids)).long()}, ids)
+        with self.assertRaises(AssertionError):
+            self.manager.send({"Discrete": torch.ones(len(ids)).long()}, ids)
+
+    def test_recv_without_send(self):
+        self.manager.reset()
+        with self.assertRaises(RuntimeError):
+            self.manager.recv()
+
+
+class TestSubProcEnvManagerAsyncPipe(TestSubProcEnvManagerAsync):
+    transport = "pipe"
+
+
+class TestWorkerRestart(unittest.TestCase):
+    transport = "ipc"
+    crash = False
+
+    def setUp(self):
+        env_fns = make_env_fns(3)
+        env_fns[1] = lambda: FailingEnv(1, self.crash)
+        self.manager = SubProcEnvManager(
+            env_fns, "Counting", transport=self.transport
+        )
+
+    def tearDown(self):
+        self.manager.close()
+
+    def test_restart(self):
+        self.manager.reset()
+        actions = {"Discrete": torch.ones(3).long()}
+        self.manager.step(actions)
+        obs, rewards, dones, infos = self.manager.step(actions)
+
+        self.assertEqual(self.manager.restart_counts, [0, 1, 0])
+        self.assertEqual(self.manager.nb_restart, 1)
+        self.assertEqual(dones.tolist(), [False, True, False])
+        self.assertEqual(rewards.tolist(), [1.0, 0.0, 1.0])
+        # restarted env is reset
+        self.assertEqual(obs["Box"][:, 0, 0, 0].tolist(), [2, 0, 2])
+
+        # keeps stepping
+        obs, _, dones, _ = self.manager.step(actions)
+        self.assertEqual(obs["Box"][:, 0, 0, 0].tolist(), [3, 1, 3])
+        self.assertFalse(dones.any())
+
+
+class TestWorkerRestartPipe(TestWorkerRestart):
+    transport = "pipe"
+
+
+class TestWorkerRestartCrash(TestWorkerRestart):
+    crash = True
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
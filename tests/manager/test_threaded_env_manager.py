@@ -0,0 +1,110 @@
+import unittest
+
+import torch
+
+from adept.manager import ThreadedEnvManager
+from tests.manager.test_subproc_env_manager import (
+    EPISODE_LEN,
+    FailingEnv,
+    make_env_fns,
+)
+
+
+class TestThreadedEnvManager(unittest.TestCase):
+    nb_env = 4
+    nb_thread = None
+    batch_preprocess = False
+
+    def setUp(self):
+        self.manager = ThreadedEnvManager(
+            make_env_fns(self.nb_env),
+            "Counting",
+            self.nb_thread,
+            self.batch_preprocess,
+        )
+
+    def tearDown(self):
+        self.manager.close()
+
+    def test_reset(self):
+        obs = self.manager.reset()
+        self.assertEqual(obs["Box"].shape, (self.nb_env, 1, 4, 4))
+        self.assertEqual(obs["Box"].dtype, torch.uint8)
+        self.assertEqual(obs["Box"].sum().item(), 0)
+
+    def test_step(self):
+        self.manager.reset()
+        actions = {"Discrete": torch.arange(self.nb_env) % 3}
+        obs, rewards, dones, infos = self.manager.step(actions)
+        self.assertTrue(
+            torch.equal(obs["Box"][:, 0, 0, 0], torch.ones(self.nb_env).byte())
+        )
+        self.assertTrue(torch.equal(rewards, actions["Discrete"].float()))
+        self.assertFalse(dones.any())
+        self.assertEqual(list(infos), [{}] * self.nb_env)
+
+    def test_terminal(self):
+        self.manager.reset()
+        actions = {"Discrete": torch.zeros(self.nb_env).long()}
+        for _ in range(EPISODE_LEN):
+            obs, rewards, dones, infos = self.manager.step(actions)
+        self.assertTrue(dones.all())
+        # terminal envs are reset by the manager
+        self.assertEqual(obs["Box"].sum().item(), 0)
+        self.assertEqual([i["seed"] for i in infos], list(range(self.nb_env)))
+
+    def test_returned_tensors_not_overwritten(self):
+        self.manager.reset()
+        _, rewards, dones, _ = self.manager.step(
+            {"Discrete": torch.ones(self.nb_env).long()}
+        )
+        self.manager.step({"Discrete": torch.zeros(self.nb_env).long()})
+        self.assertTrue(torch.equal(rewards, torch.ones(self.nb_env)))
+
+    def test_obs_double_buffered(self):
+        self.manager.reset()
+        actions = {"Discrete": torch.zeros(self.nb_env).long()}
+        obs, _, _, _ = self.manager.step(actions)
+        self.manager.step(actions)
+        self.assertEqual(obs["Box"].sum().item(), self.nb_env * 16)
+
+        # buffers are reused after two steps
+        next_obs, _, _, _ = self.manager.step(actions)
+        self.assertEqual(obs["Box"].data_ptr(), next_obs["Box"].data_ptr())
+
+
+class TestThreadedEnvManagerSingleThread(TestThreadedEnvManager):
+    nb_thread = 1
+
+
+class TestThreadedEnvManagerUnevenSplit(TestThreadedEnvManager):
+    nb_env = 5
+    nb_thread = 2
+
+    def test_env_slices(self):
+        self.assertEqual(
+            [(s.start, s.stop) for s in self.manager.env_slices],
+            [(0, 2), (2, 5)],
+        )
+
+
+class TestThreadedEnvManagerBatchPreprocess(TestThreadedEnvManagerUnevenSplit):
+    batch_preprocess = True
+
+
+class TestThreadedEnvManagerError(unittest.TestCase):
+    def test_env_error_raised(self):
+        manager = ThreadedEnvManager(
+            [lambda seed=seed: FailingEnv(seed) for seed in range(2)],
+            "Counting",
+        )
+        manager.reset()
+        actions = {"Discrete": torch.zeros(2).long()}
+        manager.step(actions)
+        with self.assertRaises(RuntimeError):
+            manager.step(actions)
+        manager.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+
+import numpy as np
+import torch
+
+from adept.container.base import Container
+from adept.preprocess.base import GPUPreprocessor
+from adept.preprocess.ops import (
+    CV2_AVAILABLE,
+    FrameStackCPU,
+    FrameStackGPU,
+    ResizeToNxM,
+)
+
+if CV2_AVAILABLE:
+    import cv2
+
+
+class TestFrameStackCPU(unittest.TestCase):
+    def setUp(self):
+        self.op = FrameStackCPU("Box", "Box", 3)
+        self.op.update_shape((1, 2, 2))
+
+    def push(self, value):
+        return self.op.preprocess_cpu(torch.full((1, 2, 2), value))
+
+    def test_order(self):
+        for step in range(1, 6):
+            stacked = self.push(float(step))
+        # oldest frame first
+        self.assertEqual(stacked.shape, (3, 2, 2))
+        self.assertEqual(stacked[:, 0, 0].tolist(), [3, 4, 5])
+
+    def test_reset(self):
+        for step in range(1, 4):
+            self.push(float(step))
+        self.op.reset()
+        stacked = self.push(5.0)
+        self.assertEqual(stacked[:, 0, 0].tolist(), [0, 0, 5])
+
+    def test_input_copied(self):
+        frame = torch.ones(1, 2, 2)
+        self.op.preprocess_cpu(frame)
+        frame.fill_(2)
+        stacked = self.push(3.0)
+        self.assertEqual(stacked[:, 0, 0].tolist(), [0, 1, 3])
+
+
+class TestFrameStackGPU(unittest.TestCase):
+    nb_env = 3
+
+    def setUp(self):
+        self.op = FrameStackGPU("Box", "Box", 2)
+        self.preprocessor = GPUPreprocessor(
+            [self.op], {"Box": (1, 2, 2)}, {"Box": torch.float32}
+        )
+
+    def push(self, values):
+        frames = torch.tensor(values).view(-1, 1, 1, 1).expand(-1, 1, 2, 2)
+        return self.preprocessor({"Box": frames})["Box"]
+
+    def test_shape(self):
+        self.assertEqual(self.preprocessor.observation_space["Box"], (2, 2, 2))
+        stacked = self.push([1.0, 2.0, 3.0])
+        self.assertEqual(stacked.shape, (self.nb_env, 2, 2, 2))
+
+    def test_order(self):
+        self.push([1.0, 2.0, 3.0])
+        stacked = self.push([4.0, 5.0, 6.0])
+        self.assertEqual(stacked[:, :, 0, 0].tolist(), [[1, 4], [2, 5], [3, 6]])
+        stacked = self.push([7.0, 8.0, 9.0])
+        self.assertEqual(stacked[:, :, 0, 0].tolist(), [[4, 7], [5, 8], [6, 9]])
+
+    def test_reset_mask(self):
+        self.push([1.0, 2.0, 3.0])
+        self.preprocessor.reset(torch.tensor([False, True, False]))
+        stacked = self.push([4.0, 5.0, 6.0])
+        self.assertEqual(stacked[:, :, 0, 0].tolist(), [[1, 4], [0, 5], [3, 6]])
+
+    def test_container_reset_on_terminals(self):
+        network = torch.nn.Module()
+        network.gpu_preprocessor = self.preprocessor
+        self.push([1.0, 2.0, 3.0])
+        Container.reset_preprocessor(network, torch.tensor([0.0, 0.0, 0.0]))
+        self.push([4.0, 5.0, 6.0])
+        # terminals as the envs return them, the last env starts over
+        Container.reset_preprocessor(network, torch.tensor([0.0, 0.0, 1.0]))
+        stacked = self.push([7.0, 8.0, 9.0])
+        self.assertEqual(stacked[:, :, 0, 0].tolist(), [[4, 7], [5, 8], [0, 9]])
+
+    def test_reset_all(self):
+        self.push([1.0, 2.0, 3.0])
+        self.preprocessor.reset()
+        stacked = self.push([4.0, 5.0, 6.0])
+        self.assertEqual(stacked[:, 0, 0, 0].tolist(), [0, 0, 0])
+
+
+@unittest.skipIf(not CV2_AVAILABLE, "requires cv2")
+class TestResizeToNxM(unittest.TestCase):
+    def setUp(self):
+        # 84 wide, 64 high
+        self.op = ResizeToNxM(84, 64, "Box", "Box")
+        rng = np.random.RandomState(0)
+        self.frames = torch.from_numpy(
+            rng.randint(0, 256, (3, 1, 210, 160), dtype=np.uint8)
+        )
+
+    def expected(self, frame):
+        return cv2.resize(frame, (84, 64), interpolation=cv2.INTER_AREA)
+
+    def test_shape(self):
+        self.assertEqual(self.op.update_shape((1, 210, 160)), (1, 64, 84))
+
+    def test_out(self):
+        out = torch.empty(self.op.update_shape(None), dtype=torch.uint8)
+        result = self.op.preprocess_cpu(self.frames[0], out=out)
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(
+            out.numpy()[0], self.expected(self.frames[0, 0].numpy())
+        )
+
+    def test_batch_out(self):
+        out = torch.empty(
+            3, *self.op.update_shape(None), dtype=torch.uint8
+        )
+        self.op.preprocess_cpu_batch(self.frames, out=out)
+        for i in range(3):
+            np.testing.assert_array_equal(
+                out.numpy()[i, 0], self.expected(self.frames[i, 0].numpy())
+            )
+
+    def test_wrong_out(self):
+        out = torch.empty(1, 84, 64, dtype=torch.uint8)
+        with self.assertRaises(ValueError):
+            self.op.preprocess_cpu(self.frames[0], out=out)
+
+
+if __name__ == "__main__":
+    unittest.main()
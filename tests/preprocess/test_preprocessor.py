@@ -0,0 +1,186 @@
+import unittest
+
+import numpy as np
+import torch
+
+from adept.preprocess.base import (
+    BatchCPUPreprocessor,
+    CPUPreprocessor,
+    FusedOperation,
+    GPUPreprocessor,
+)
+from adept.preprocess.ops import (
+    CastToFloat,
+    Divide,
+    FlattenSpace,
+    FrameStackCPU,
+    FromNumpy,
+    GrayScaleAndMoveChannel,
+    ResizeToNxM,
+)
+
+FRAME_SHAPE = (20, 16, 3)
+NB_ENV = 3
+
+
+def make_preprocessor(frame_stack=False):
+    ops = [
+        FromNumpy("Box", "Box"),
+        GrayScaleAndMoveChannel("Box", "Box"),
+        ResizeToNxM(8, 8, "Box", "Box"),
+    ]
+    if frame_stack:
+        ops.append(FrameStackCPU("Box", "Box", 2))
+    return CPUPreprocessor(ops, {"Box": FRAME_SHAPE}, {"Box": np.uint8})
+
+
+def random_obs(rng):
+    return [
+        {
+            "Box": rng.randint(0, 256, FRAME_SHAPE, dtype=np.uint8),
+            "Text": str(env_ind),
+        }
+        for env_ind in range(NB_ENV)
+    ]
+
+
+class TestCPUPreprocessor(unittest.TestCase):
+    def test_out_matches_allocating_ops(self):
+        rng = np.random.RandomState(0)
+        preprocessor = make_preprocessor()
+        frame = rng.randint(0, 256, FRAME_SHAPE, dtype=np.uint8)
+        expected = frame
+        for op in preprocessor.ops:
+            expected = op.preprocess_cpu(expected)
+        ob = preprocessor({"Box": frame})
+        self.assertTrue(torch.equal(ob["Box"], expected))
+        self.assertIs(ob["Box"], preprocessor.outs[-1])
+
+    def test_outputs_reused(self):
+        rng = np.random.RandomState(0)
+        preprocessor = make_preprocessor()
+        obs = random_obs(rng)
+        first = preprocessor({"Box": obs[0]["Box"]})["Box"]
+        second = preprocessor({"Box": obs[1]["Box"]})["Box"]
+        self.assertEqual(first.data_ptr(), second.data_ptr())
+
+    def test_frame_stack_output(self):
+        rng = np.random.RandomState(0)
+        preprocessor = make_preprocessor(frame_stack=True)
+        ob = preprocessor({"Box": random_obs(rng)[0]["Box"]})
+        self.assertEqual(ob["Box"].shape, (2, 8, 8))
+        self.assertEqual(ob["Box"].dtype, torch.uint8)
+        # a view of the frame stack ring buffer
+        frames = preprocessor.ops[-1].frames
+        self.assertEqual(
+            ob["Box"].untyped_storage().data_ptr(),
+            frames.untyped_storage().data_ptr(),
+        )
+
+
+class TestBatchCPUPreprocessor(unittest.TestCase):
+    def check_matches_unbatched(self, frame_stack):
+        rng = np.random.RandomState(0)
+        expected = [make_preprocessor(frame_stack) for _ in range(NB_ENV)]
+        batched = [make_preprocessor(frame_stack) for _ in range(NB_ENV)]
+        batch_preprocessor = BatchCPUPreprocessor(batched)
+        shape = expected[0].observation_space["Box"]
+        out = {"Box": torch.zeros(NB_ENV, *shape, dtype=torch.uint8)}
+
+        for _ in range(3):
+            obs = random_obs(rng)
+            # envs return their observations unprocessed
+            raw = [p(ob) for p, ob in zip(batched, obs)]
+            others = batch_preprocessor(raw, out)
+            for env_ind, ob in enumerate(obs):
+                ob = expected[env_ind](ob)
+                self.assertTrue(torch.equal(out["Box"][env_ind], ob["Box"]))
+                self.assertEqual(others[env_ind], {"Text": str(env_ind)})
+
+    def test_matches_unbatched(self):
+        self.check_matches_unbatched(frame_stack=False)
+
+    def test_matches_unbatched_frame_stack(self):
+        self.check_matches_unbatched(frame_stack=True)
+
+    def test_batched_ops(self):
+        preprocessors = [make_preprocessor(True) for _ in range(NB_ENV)]
+        batch_preprocessor = BatchCPUPreprocessor(preprocessors)
+        self.assertEqual(len(batch_preprocessor.ops), 3)
+        self.assertFalse(batch_preprocessor.all_batched)
+        self.assertEqual(preprocessors[0].nb_batch_op, 3)
+
+    def test_no_batchable_ops(self):
+        preprocessors = [
+            CPUPreprocessor(
+                [FrameStackCPU("Box", "Box", 2)],
+                {"Box": (1, 2, 2)},
+                {"Box": torch.float32},
+            )
+            for _ in range(NB_ENV)
+        ]
+        batch_preprocessor = BatchCPUPreprocessor(preprocessors)
+        out = {"Box": torch.zeros(NB_ENV, 2, 2, 2)}
+        obs = [p({"Box": torch.ones(1, 2, 2)}) for p in preprocessors]
+        others = batch_preprocessor(obs, out)
+        self.assertEqual(others, [{}] * NB_ENV)
+        self.assertEqual(out["Box"].sum().item(), NB_ENV * 4)
+
+
+def make_gpu_preprocessor(fuse):
+    return GPUPreprocessor(
+        [
+            CastToFloat("Box", "Box"),
+            Divide("Box", "Box", 255),
+            FlattenSpace("Box", "Box"),
+            CastToFloat("Other", "Other"),
+        ],
+        {"Box": (2, 8, 8), "Other": (3,)},
+        {"Box": torch.uint8, "Other": torch.int64},
+        fuse=fuse,
+    )
+
+
+class TestGPUPreprocessor(unittest.TestCase):
+    def test_fused_ops(self):
+        preprocessor = make_gpu_preprocessor(fuse=True)
+        self.assertEqual(len(preprocessor.run_ops), 3)
+        self.assertIsInstance(preprocessor.run_ops[0], FusedOperation)
+        self.assertEqual(len(preprocessor.run_ops[0].ops), 2)
+        # a single elementwise op is left as is
+        self.assertIsInstance(preprocessor.run_ops[2], CastToFloat)
+
+    def test_cpu_not_traced(self):
+        preprocessor = make_gpu_preprocessor(fuse=True)
+        obs = {
+            "Box": torch.randint(0, 256, (4, 2, 8, 8), dtype=torch.uint8),
+            "Other": torch.arange(12).view(4, 3),
+        }
+        preprocessor(obs)
+        self.assertEqual(preprocessor.run_ops[0]._fns, {})
+
+    def test_space_matches_unfused(self):
+        fused = make_gpu_preprocessor(fuse=True)
+        unfused = make_gpu_preprocessor(fuse=False)
+        self.assertEqual(fused.observation_space, unfused.observation_space)
+        self.assertEqual(fused.observation_dtypes, unfused.observation_dtypes)
+
+    def test_output_matches_unfused(self):
+        fused = make_gpu_preprocessor(fuse=True)
+        unfused = make_gpu_preprocessor(fuse=False)
+        for batch_size in [4, 2]:
+            obs = {
+                "Box": torch.randint(
+                    0, 256, (batch_size, 2, 8, 8), dtype=torch.uint8
+                ),
+                "Other": torch.arange(batch_size * 3).view(batch_size, 3),
+            }
+            expected = unfused(obs)
+            actual = fused(obs)
+            for k in expected:
+                self.assertEqual(actual[k].dtype, expected[k].dtype)
+                self.assertTrue(torch.allclose(actual[k], expected[k]))
+
+
+if __name__ == "__main__":
+    unittest.main()
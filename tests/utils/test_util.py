@@ -1,6 +1,24 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
 
-from adept.utils.util import listd_to_dlist, dlist_to_listd
+import numpy as np
+import torch
+from torch import distributed as dist
+
+from adept.exp import ExpSpecBuilder, Rollout
+from adept.network.base.base import BaseNetwork
+from adept.utils.util import (
+    listd_to_dlist,
+    dlist_to_listd,
+    DeviceTransfer,
+    pin_memory_,
+    unpin_memory_,
+    parse_cores,
+    broadcast_coalesced,
+    numpy_to_torch_dtype,
+)
 
 
 class TestUtil(unittest.TestCase):
@@ -10,6 +28,114 @@ class TestUtil(unittest.TestCase):
     def test_listd_to_dlist(self):
         assert listd_to_dlist([{"a": 1}]) == {"a": [1]}
 
+    def test_parse_cores(self):
+        assert parse_cores("0-3,8") == [0, 1, 2, 3, 8]
+        assert parse_cores("5, 2,2") == [2, 5]
+
+    def test_numpy_to_torch_dtype(self):
+        assert numpy_to_torch_dtype(np.uint8) == torch.uint8
+        assert numpy_to_torch_dtype(np.dtype("float32")) == torch.float32
+
+    def test_device_transfer_cpu_no_copy(self):
+        d_tensor = {"a": torch.ones(2, 3)}
+        d_dev = DeviceTransfer(torch.device("cpu"))(d_tensor)
+        assert d_dev["a"].data_ptr() == d_tensor["a"].data_ptr()
+
+    @unittest.skipIf(not torch.cuda.is_available(), "requires CUDA")
+    def test_device_transfer_cuda(self):
+        device = torch.device("cuda")
+        d_tensor = {"a": pin_memory_(torch.arange(6).share_memory_())}
+        assert d_tensor["a"].is_pinned()
+        d_dev = DeviceTransfer(device)(d_tensor)
+        assert d_dev["a"].device.type == "cuda"
+        assert torch.equal(d_dev["a"].cpu(), d_tensor["a"])
+        unpin_memory_(d_tensor["a"])
+        assert not d_tensor["a"].is_pinned()
+
+
+class TinyNetwork(BaseNetwork):
+    def __init__(self):
+        super(TinyNetwork, self).__init__()
+        self.linear_a = torch.nn.Linear(4, 4)
+        self.linear_b = torch.nn.Linear(4, 2)
+        self.register_buffer("nb_update", torch.zeros(1).long())
+
+
+class TestBroadcastCoalesced(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.store_file = tempfile.mktemp()
+        dist.init_process_group(
+            "gloo",
+            init_method="file://" + cls.store_file,
+            rank=0,
+            world_size=1,
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        dist.destroy_process_group()
+        if os.path.exists(cls.store_file):
+            os.remove(cls.store_file)
+
+    def count_broadcasts(self, fn):
+        with mock.patch.object(
+            dist, "broadcast", wraps=dist.broadcast
+        ) as broadcast:
+            fn()
+        return broadcast.call_count
+
+    def test_values(self):
+        tensors = [torch.arange(6).view(2, 3), torch.ones(3), torch.arange(2)]
+        expected = [t.clone() for t in tensors]
+        handles = broadcast_coalesced(tensors, 0, async_op=True)
+        # int64 and float32 buckets
+        self.assertEqual(len(handles), 2)
+        for h in handles:
+            h.wait()
+        for t, e in zip(tensors, expected):
+            self.assertTrue(torch.equal(t, e))
+
+    def test_rollout_sync(self):
+        def build_fn(exp_len):
+            return {
+                "obs_a": (exp_len + 1, 4, 2),
+                "act_a": (exp_len, 4),
+                "act_b": (exp_len, 4),
+                "values": (exp_len, 4),
+                "rewards": (exp_len, 4),
+                "terminals": (exp_len, 4),
+            }
+
+        spec_builder = ExpSpecBuilder(
+            obs_keys={"obs_a": (2,)},
+            act_keys={"act_a": (5,), "act_b": (6,)},
+            internal_keys={},
+            key_types={
+                "obs_a": torch.uint8,
+                "act_a": "long",
+                "act_b": "long",
+                "values": "float",
+                "rewards": "float",
+                "terminals": "float",
+            },
+            exp_keys=["values"],
+            build_fn=build_fn,
+        )
+        r = Rollout(spec_builder, 20)
+        # one broadcast per dtype instead of per key
+        count = self.count_broadcasts(lambda: r.sync(0, None))
+        self.assertEqual(count, 3)
+
+    def test_network_sync(self):
+        net = TinyNetwork()
+        params = [p.detach().clone() for p in net.parameters()]
+        count = self.count_broadcasts(lambda: net.sync(0))
+        # 4 float parameters and a long buffer
+        self.assertEqual(count, 2)
+        for p, e in zip(net.parameters(), params):
+            self.assertTrue(torch.equal(p, e))
+
 
 if __name__ == "__main__":
     unittest.main(verbosity=2)